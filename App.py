@@ -12,6 +12,8 @@ from ui.people_sidebar import PeopleSidebar
 from ui.location_sidebar import LocationSidebar
 from ui.time_sidebar import TimeSidebar
 
+RECLUSTER_DELAY_MS = 10_000
+
 ctk.set_appearance_mode("system")
 ctk.set_default_color_theme("blue")
 
@@ -51,6 +53,9 @@ class PhotoApp(ctk.CTk):
 
         self.toggle_subsets()
 
+        # first re-clustering pass once the window is up
+        self.after(RECLUSTER_DELAY_MS, self.start_reclustering)
+
     def create_widgets(self):
 
         # (detect faces switch, export button, selected folder label, progress bar)
@@ -140,6 +145,17 @@ class PhotoApp(ctk.CTk):
         # self.status_frame.pack_forget()
         self.toggle_subsets()
         self.update_gallery()
+        self.start_reclustering()
+
+    def start_reclustering(self):
+        # background merge pass over all people, proposals end up in the People tab
+        self.controller.start_reclustering(
+            on_done=lambda job: self.after(0, lambda: self.on_reclustering_done(job)))
+
+    def on_reclustering_done(self, job):
+        if job.apply and job.finished:
+            self.sidebar_people.refresh_people_list(self.sidebar_people.subset_ids)
+        self.sidebar_people.show_merge_proposals(self.controller.get_merge_proposals())
 
     def on_closing(self):
 
@@ -170,7 +186,7 @@ class PhotoApp(ctk.CTk):
 
     def update_progress_bar(self, percent, message=""):
         # THREAD SAFE - another thread cannot update GUI directly
-        self.after(0, lambda: self.progress_bar.set(percent))
+        self.after(0, lambda: self._set_progress(percent))
 
         if message:
             if isinstance(message, (int, float)):
@@ -180,6 +196,20 @@ class PhotoApp(ctk.CTk):
 
             self.after(0, lambda: self.lbl_status.configure(text=text))
 
+    def _set_progress(self, percent):
+        # percent None = total not known yet, bar runs indeterminate
+        indeterminate = self.progress_bar.cget("mode") == "indeterminate"
+        if percent is None:
+            if not indeterminate:
+                self.progress_bar.configure(mode="indeterminate")
+                self.progress_bar.start()
+            return
+
+        if indeterminate:
+            self.progress_bar.stop()
+            self.progress_bar.configure(mode="determinate")
+        self.progress_bar.set(percent)
+
     def load_user_preferences(self):
 
         width = self.sys_prefs_repo.load_pref("window_width")
@@ -0,0 +1,227 @@
+from pathlib import Path
+from typing import Optional, Tuple
+import os
+
+import numpy as np
+
+
+class IVFFlatIndex:
+    """
+    Approximate nearest neighbour index over L2-normalized embeddings
+    (cosine similarity = dot product), NumPy only.
+    Embeddings are split into `nlist` inverted lists by a spherical k-means
+    coarse quantizer. A search scans only the `nprobe` lists whose centroids
+    are closest to the query: higher nprobe = better recall, slower search.
+    New embeddings can be added at any time without retraining.
+    """
+
+    def __init__(self, dim: int = 512, nprobe: int = 16):
+        self.dim = dim
+        self.nprobe = nprobe
+
+        self.centroids = None
+        self.trained_size = 0
+        # database the ids belong to (ClusteringConfig.db_identity)
+        self.identity: Optional[str] = None
+        self._lists = []
+        self.size = 0
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def train(self, embs: np.ndarray, nlist: Optional[int] = None, iters: int = 10,
+              max_train: int = 100_000, seed: int = 0) -> None:
+        rng = np.random.default_rng(seed)
+        embs = np.asarray(embs, dtype=np.float32)
+        n = len(embs)
+
+        # ~sqrt(N) lists keeps both the coarse step and the list scans small
+        if nlist is None:
+            nlist = int(np.sqrt(n))
+        nlist = max(1, min(nlist, n))
+
+        sample = embs if n <= max_train else embs[rng.choice(
+            n, max_train, replace=False)]
+        centroids = sample[rng.choice(
+            len(sample), nlist, replace=False)].copy()
+
+        for _ in range(iters):
+            assign = self._nearest_lists(sample, centroids)
+
+            # sum of members per list, sorted so every list is one slice
+            order = np.argsort(assign, kind="stable")
+            counts = np.bincount(assign, minlength=nlist)
+            starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+            non_empty = counts > 0
+
+            sums = np.add.reduceat(sample[order], starts[non_empty], axis=0)
+            # empty lists keep their old centroid
+            centroids[non_empty] = _normalize(sums)
+
+        self.centroids = centroids
+        self.trained_size = n
+        self._lists = [_InvertedList(self.dim) for _ in range(nlist)]
+        self.size = 0
+
+    def add(self, embs: np.ndarray, ids: np.ndarray) -> None:
+        embs = np.asarray(embs, dtype=np.float32)
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(embs) == 0:
+            return
+
+        assign = self._nearest_lists(embs, self.centroids)
+        for list_no in np.unique(assign):
+            rows = assign == list_no
+            self._lists[list_no].append(embs[rows], ids[rows])
+        self.size += len(embs)
+
+    def search(self, queries: np.ndarray, k: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        -> (similarities, ids), both (len(queries), k), best first.
+        Missing results are padded with -inf / -1.
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        sims_out = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        ids_out = np.full((len(queries), k), -1, dtype=np.int64)
+
+        if self.size == 0:
+            return sims_out, ids_out
+
+        nprobe = min(self.nprobe, len(self._lists))
+        coarse = queries @ self.centroids.T
+        probes = np.argpartition(-coarse, nprobe - 1, axis=1)[:, :nprobe]
+
+        # one matmul per probed list for all queries probing it
+        pairs = np.argsort(probes, axis=None, kind="stable")
+        list_of_pair = probes.flat[pairs]
+        bounds = np.flatnonzero(np.diff(list_of_pair)) + 1
+
+        for group in np.split(pairs, bounds):
+            inv_list = self._lists[probes.flat[group[0]]]
+            if inv_list.size == 0:
+                continue
+
+            rows = group // nprobe
+            sims = queries[rows] @ inv_list.embeddings.T
+
+            # merge with the best k found so far
+            sims = np.concatenate([sims_out[rows], sims], axis=1)
+            ids = np.concatenate([
+                ids_out[rows], np.broadcast_to(inv_list.ids, (len(rows), inv_list.size))], axis=1)
+            top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+            sims_out[rows] = np.take_along_axis(sims, top, axis=1)
+            ids_out[rows] = np.take_along_axis(ids, top, axis=1)
+
+        order = np.argsort(-sims_out, axis=1)
+        return np.take_along_axis(sims_out, order, axis=1), np.take_along_axis(ids_out, order, axis=1)
+
+    def all_ids(self) -> np.ndarray:
+        if not self._lists:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([l.ids for l in self._lists])
+
+    def all_embeddings(self) -> np.ndarray:
+        # same order as all_ids()
+        if not self._lists:
+            return np.empty((0, self.dim), dtype=np.float32)
+        return np.concatenate([l.embeddings for l in self._lists])
+
+    def embeddings_at(self, rows: np.ndarray) -> np.ndarray:
+        # rows = positions in all_ids(), without concatenating every list
+        ends = np.cumsum([l.size for l in self._lists])
+        lists = np.searchsorted(ends, rows, side="right")
+        out = np.empty((len(rows), self.dim), dtype=np.float32)
+        for i, (row, list_no) in enumerate(zip(rows, lists)):
+            start = ends[list_no] - self._lists[list_no].size
+            out[i] = self._lists[list_no].embeddings[row - start]
+        return out
+
+    def save(self, path) -> None:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        sizes = np.array([l.size for l in self._lists], dtype=np.int64)
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            np.savez(
+                f,
+                centroids=self.centroids,
+                trained_size=np.array([self.trained_size]),
+                sizes=sizes,
+                embeddings=self.all_embeddings(),
+                ids=self.all_ids(),
+                identity=np.array(self.identity or ""),
+            )
+        # never leave a half written index behind
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, nprobe: int = 16) -> Optional["IVFFlatIndex"]:
+        try:
+            data = np.load(path)
+        except (OSError, ValueError):
+            return None
+
+        centroids = data["centroids"]
+        index = cls(dim=centroids.shape[1], nprobe=nprobe)
+        index.centroids = centroids
+        index.trained_size = int(data["trained_size"][0])
+        # files written before the identity was stored -> None, rebuilt
+        if "identity" in data.files:
+            index.identity = str(data["identity"]) or None
+        index._lists = [_InvertedList(index.dim) for _ in range(len(centroids))]
+
+        embs, ids = data["embeddings"], data["ids"]
+        start = 0
+        for inv_list, size in zip(index._lists, data["sizes"]):
+            inv_list.append(embs[start:start + size], ids[start:start + size])
+            start += size
+        index.size = start
+
+        return index
+
+    @staticmethod
+    def _nearest_lists(embs: np.ndarray, centroids: np.ndarray, chunk: int = 65536) -> np.ndarray:
+        assign = np.empty(len(embs), dtype=np.int64)
+        for start in range(0, len(embs), chunk):
+            assign[start:start + chunk] = np.argmax(
+                embs[start:start + chunk] @ centroids.T, axis=1)
+        return assign
+
+
+class _InvertedList:
+    # Growable (embeddings, ids) buffer of one list, capacity doubles when full
+
+    def __init__(self, dim: int):
+        self._embs = np.empty((0, dim), dtype=np.float32)
+        self._ids = np.empty(0, dtype=np.int64)
+        self.size = 0
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        return self._embs[:self.size]
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self._ids[:self.size]
+
+    def append(self, embs: np.ndarray, ids: np.ndarray) -> None:
+        end = self.size + len(embs)
+        if end > len(self._embs):
+            capacity = max(end, 2 * len(self._embs), 16)
+            new_embs = np.empty((capacity, self._embs.shape[1]), dtype=np.float32)
+            new_ids = np.empty(capacity, dtype=np.int64)
+            new_embs[:self.size] = self.embeddings
+            new_ids[:self.size] = self.ids
+            self._embs, self._ids = new_embs, new_ids
+
+        self._embs[self.size:end] = embs
+        self._ids[self.size:end] = ids
+        self.size = end
+
+
+def _normalize(embs: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(embs, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return embs / norms
@@ -2,7 +2,9 @@ from pathlib import Path
 from tokenize import String
 from PIL import Image, ImageOps
 import json
-import hashlib
+import math
+import threading
+from functools import partial
 
 import shutil
 import os
@@ -15,6 +17,25 @@ from face_detection import FaceDetection
 from repositories.photo_repo import PhotoRepository
 from repositories.face_repo import FaceRepository
 from repositories.person_repo import PersonRepository
+from repositories.file_index_repo import FileIndexRepository
+from repositories.sys_prefs_repo import SystemPrefsRepository
+from repositories.geocode_cache_repo import GeocodeCacheRepository
+from reverse_geocoding import DEFAULT_CITIES_PATH, GeocodeCache, OfflineGeocoder
+from ingest_pipeline import FolderDiscovery, PipelineStage, StagedPipeline, read_photo_info
+from structures import ClusteringConfig, FaceQualityConfig, PipelineConfig
+from near_duplicates import NearDuplicateIndex, is_degenerate, to_signed64
+from reclustering import ReclusteringJob
+from thumbnail_cache import ThumbnailCache
+
+
+def _signed_phash(phash):
+    return None if phash is None else to_signed64(phash)
+
+
+def _oriented_size(width, height, orientation):
+    # photos.width/height are the stored (header) size, face boxes live in
+    # the EXIF-rotated frame cv2 decodes to
+    return (height, width) if orientation in (5, 6, 7, 8) else (width, height)
 
 
 class PhotoController:
@@ -23,45 +44,121 @@ class PhotoController:
         self.photo_repo = PhotoRepository(self.db)
         self.face_repo = FaceRepository(self.db)
         self.person_repo = PersonRepository(self.db)
-
-        self.face_detector = FaceDetection(self.photo_repo, self.face_repo)
-        self.face_clustering = FaceClustering(self.face_repo, self.person_repo)
+        self.file_index_repo = FileIndexRepository(self.db)
+
+        prefs = SystemPrefsRepository(self.db)
+        self.face_detector = FaceDetection(
+            self.photo_repo, self.face_repo,
+            FaceQualityConfig(min_det_score=float(prefs.load_pref("face_min_det_score", 0.6)),
+                              min_face_size=int(prefs.load_pref("face_min_size", 20)),
+                              min_sharpness=float(prefs.load_pref("face_min_sharpness", 10.0))))
+        self.face_detector.embedding_dtype = prefs.load_pref(
+            "embedding_dtype", "float32")
+        self.face_clustering = FaceClustering(
+            self.face_repo, self.person_repo,
+            ClusteringConfig(matcher=prefs.load_pref("face_matcher", "auto"),
+                             matrix_dtype=prefs.load_pref("embedding_matrix_dtype", "float32"),
+                             db_identity=prefs.get_db_identity()))
+        self.thumbnail_cache = ThumbnailCache(
+            max_bytes=int(prefs.load_pref("thumbnail_cache_mb", 512)) * 1024 * 1024)
         self.current_batch_ids = set()
 
+        self.pipeline_config = PipelineConfig()
+        self._db_lock = threading.Lock()
+        self._queued_for_detection = set()
+        self.ingest_stats = {"photos_read": 0, "bytes_read": 0}
+
+        self._file_index = {}
+        self._new_file_index_rows = []
+        self._near_dup_index = None
+
+        self.reclustering_job = None
+
+        self._setup_geocoder()
+        self.geocode_cache = GeocodeCache(
+            GeocodeCacheRepository(self.db), PhotoMetadata.reverse_geocode,
+            source=PhotoMetadata.geocoder_id(),
+            precision=SystemPrefsRepository(self.db).load_pref("geocode_cache_precision", 2))
+
+    def _setup_geocoder(self):
+        # GeoNames dump present -> no Nominatim calls at all
+        cities_path = SystemPrefsRepository(self.db).load_pref(
+            "geonames_cities_path", str(DEFAULT_CITIES_PATH))
+
+        if cities_path and os.path.exists(cities_path):
+            print(f"Using offline geocoder: {cities_path}")
+            PhotoMetadata.set_offline_geocoder(OfflineGeocoder(cities_path))
+
     def analyze_folder(self, folder_path, detect_faces=True, callback=None):
 
         self.current_batch_ids.clear()
+        self._queued_for_detection.clear()
+        self.ingest_stats = {"photos_read": 0, "bytes_read": 0}
+        self.face_detector.reset_quality_stats()
 
         input_folder = Path(folder_path)
 
-        image_paths = [
-            p for p in input_folder.rglob("*")
-            if p.is_file() and p.suffix.lower() in [".jpg", ".jpeg", ".png", ".webp"]
-        ]
+        # Stat signatures from the previous scans of this folder
+        with self._db_lock:
+            self.geocode_cache.load()
+            self._file_index = {
+                row["path"]: row for row in self.file_index_repo.get_under_folder(input_folder)}
 
-        total_photos = len(image_paths)
+            radius = self.pipeline_config.near_duplicate_radius
+            self._near_dup_index = NearDuplicateIndex.from_rows(
+                self.photo_repo.get_all_phashes(), radius) if detect_faces and radius > 0 else None
+        self._new_file_index_rows = []
 
-        if total_photos == 0:
+        # total unknown while discovery runs -> progress None (indeterminate)
+        def on_discovered(count):
+            if callback:
+                callback(None, f"Found {count} photos...")
+
+        discovery = FolderDiscovery(
+            input_folder, extensions=[".jpg", ".jpeg", ".png", ".webp"],
+            ignore_patterns=self.pipeline_config.ignore_patterns, on_progress=on_discovered)
+
+        def on_photo_done(done):
+            if not callback:
+                return
+            # total is only known once discovery has finished
+            if discovery.finished:
+                total = max(discovery.count, 1)
+                callback(done/total, done/total)
+            else:
+                callback(None, f"{done} / {discovery.count}+ photos")
+
+        # 1. Metadata + 2. Face detection, all stages run concurrently
+        pipeline = StagedPipeline(
+            self._build_ingest_stages(detect_faces), on_item_done=on_photo_done)
+        pipeline.run(discovery)
+
+        if discovery.count == 0:
             if callback:
                 callback(1.0, "No photos found")
             return
 
-        for i, img_path in enumerate(image_paths):
-            # 1. Get metadata
-            photo_id = self._scan_metadata(img_path)
-
-            # add current batch photo ids
-            if photo_id:
-                self.current_batch_ids.add(photo_id)
-
-            # 2. Face detection
+        with self._db_lock:
             if detect_faces:
-                self.face_detector.process_photo(img_path, photo_id)
+                self.face_detector.flush()
+            self._flush_file_index()
+            self.geocode_cache.flush()
+            # files that are gone from the folder
+            self.file_index_repo.delete_paths(
+                set(self._file_index) - discovery.seen_paths)
+
+        read = self.ingest_stats["photos_read"]
+        if read:
+            print(
+                f"INGEST: {read} photos, {self.ingest_stats['bytes_read'] / read / 1024:.0f} KB read per photo")
+        if detect_faces:
+            print(f"FACE QUALITY: {self.face_detector.quality_summary()}")
 
-            if callback:
-                callback(i/total_photos, i/total_photos)
+        geo = self.geocode_cache.stats()
+        print(
+            f"GEOCODE CACHE: {geo['hits']} hits, {geo['misses']} misses ({geo['hit_rate']:.0%})")
 
-        # 2. Face clustering
+        # 3. Face clustering
         if detect_faces:
             self.face_clustering.resolve_identities()
 
@@ -69,32 +166,206 @@ class PhotoController:
         if callback:
             callback(1.0, "Done!")
 
-    def _scan_metadata(self, path):
-        filename = path.name
-        path_str = str(path)
-        hash_val = self.compute_hash(path)
-        time_data = PhotoMetadata.get_date(path)
-        width, height = PhotoMetadata.get_size(path)
-        location_data = PhotoMetadata.get_location(path)
+    def _build_ingest_stages(self, detect_faces):
+        cfg = self.pipeline_config
+
+        # discovery -> change check -> hash/metadata -> DB register -> decode -> detection -> DB write
+        stages = [
+            PipelineStage("change-check", lambda item: self._check_unchanged(item, detect_faces),
+                          workers=cfg.stat_workers, queue_size=cfg.queue_size),
+            PipelineStage("metadata", partial(read_photo_info, keep_data=detect_faces), workers=cfg.metadata_workers,
+                          queue_size=cfg.queue_size, use_processes=cfg.use_processes),
+            PipelineStage("register", lambda info: self._register_photo(info, detect_faces),
+                          queue_size=cfg.queue_size),
+        ]
+
+        if detect_faces:
+            stages += [
+                PipelineStage("decode", self._decode_photo,
+                              workers=cfg.decode_workers, queue_size=cfg.queue_size),
+                PipelineStage("detect", self._detect_photos, workers=cfg.detect_workers,
+                              queue_size=cfg.queue_size, batch_size=cfg.detect_batch_size),
+                PipelineStage("write", self._save_photo_faces,
+                              queue_size=cfg.queue_size, on_idle=self._flush_due_faces),
+            ]
+
+        return stages
+
+    def _check_unchanged(self, item, detect_faces):
+        img_path = item["path"]
+        st = item["entry"].stat() if "entry" in item else img_path.stat()
+        signature = (st.st_size, st.st_mtime_ns, st.st_ino)
+
+        row = self._file_index.get(str(img_path))
+
+        # Same size, mtime and inode as last time -> no hashing, EXIF, geocoding or detection.
+        # Rows from before the near-duplicate index go through metadata once
+        # more, so they get a phash / orientation and can act as originals;
+        # phash_checked marks a tried hash, unreadable formats are not retried.
+        if row and (row["size"], row["mtime_ns"], int(row["inode"])) == signature \
+                and row["near_dup_ready"]:
+            if row["already_analyzed"] or not detect_faces:
+                self.current_batch_ids.add(row["photo_id"])
+                return None
+
+        return {"path": img_path, "signature": signature}
+
+    def _register_photo(self, info, detect_faces):
+        # Network lookup happens outside of the DB lock
+        location_data = None
+        if info["coords"]:
+            location_data = self.geocode_cache.lookup(*info["coords"])
 
         if location_data:
-            location_data_city, location_data_country = location_data
+            info["location_data_city"], info["location_data_country"] = location_data
         else:
-            location_data_city, location_data_country = None, None
+            info["location_data_city"], info["location_data_country"] = None, None
+
+        with self._db_lock:
+            photo_id, already_analyzed, new_phash = self._store_photo(info)
+
+            if new_phash and self._near_dup_index is not None and info["phash"] is not None:
+                self._near_dup_index.add(info["phash"], photo_id)
+
+            self._new_file_index_rows.append(
+                (str(info["path"]), *info["signature"], photo_id))
+            if len(self._new_file_index_rows) >= 500:
+                self._flush_file_index()
+
+        # add current batch photo ids
+        self.current_batch_ids.add(photo_id)
+
+        self.ingest_stats["photos_read"] += 1
+        self.ingest_stats["bytes_read"] += info["bytes_read"]
+
+        if not detect_faces or already_analyzed:
+            if already_analyzed:
+                print(f"{info['filename']}: Already analyzed, skipping.")
+            return None
+
+        # Same content twice in one folder -> detect only once
+        if photo_id in self._queued_for_detection:
+            return None
+        self._queued_for_detection.add(photo_id)
+
+        # Resized / recompressed copy of an analyzed photo -> reuse its faces
+        if self._reuse_near_duplicate_faces(photo_id, info):
+            return None
+
+        info["photo_id"] = photo_id
+        return info
+
+    def _reuse_near_duplicate_faces(self, photo_id, info):
+        if self._near_dup_index is None or info["phash"] is None \
+                or is_degenerate(info["phash"]):
+            return False
+
+        for dist, original_id in self._near_dup_index.find(info["phash"], exclude_id=photo_id):
+            with self._db_lock:
+                original = self.photo_repo.get_by_id(original_id)
+                if not original or not original.get("already_analyzed"):
+                    continue
+
+                # face boxes scaled to the size of this copy, both sides in the
+                # EXIF-rotated frame (rotation may be baked into the copy)
+                if not (original["width"] and original["height"] and info["width"] and info["height"]):
+                    continue
+                original_w, original_h = _oriented_size(
+                    original["width"], original["height"], original["orientation"])
+                copy_w, copy_h = _oriented_size(
+                    info["width"], info["height"], info["orientation"])
+                scale_x = copy_w / original_w
+                scale_y = copy_h / original_h
+
+                # dHash squashes to 9x8, a cropped or letterboxed copy still
+                # matches; only a plain resize keeps the boxes on the same pixels
+                if abs(scale_x - scale_y) > 0.01 * max(scale_x, scale_y):
+                    continue
+                scale = (scale_x + scale_y) / 2
+
+                face_rows = []
+                for face in self.face_repo.get_faces_by_photo_id(original_id):
+                    coords = face["face_coords"]
+                    while isinstance(coords, str):
+                        coords = json.loads(coords)
+                    left, top, right, bottom = coords[0]
+
+                    face_coords = json.dumps([[int(left * scale), int(top * scale),
+                                               int(right * scale), int(bottom * scale)]])
+                    face_size = int(face["face_size"] * scale) \
+                        if face["face_size"] is not None else None
+                    face_rows.append((photo_id, bytes(face["embedding"]),
+                                      face_coords, face["person_id"],
+                                      face["det_score"], face_size, face["sharpness"]))
+
+                # saved together with already_analyzed, same as detected faces
+                self.face_detector.face_writer.add_photo(photo_id, face_rows)
+
+            print(
+                f"{info['filename']}: Near-duplicate of photo {original_id} ({dist} bits), reusing {len(face_rows)} faces")
+            return True
+
+        return False
+
+    def _store_photo(self, info):
+        path_str = str(info["path"])
 
         # Check if photo with this hash exists to prevent duplication
-        exists = self.photo_repo.get_by_hash(hash_val)
+        exists = self.photo_repo.get_by_hash(info["hash"])
 
         if exists:
             self.photo_repo.update_photo(
-                photo_id=exists["id"], path=path_str, filename=filename, location_data_city=location_data_city, location_data_country=location_data_country)
-            return exists["id"]
+                photo_id=exists["id"], path=path_str, filename=info["filename"],
+                location_data_city=info["location_data_city"], location_data_country=info["location_data_country"],
+                phash=_signed_phash(info["phash"]), orientation=info["orientation"])
+            # -> (id, already_analyzed, phash stored for the first time)
+            return exists["id"], exists.get("already_analyzed"), exists.get("phash") is None
         else:
             new_id = self.photo_repo.insert_photo(
-                path=path_str, filename=filename, hash=hash_val,
-                location_data_city=location_data_city, time_data=time_data,
-                width=width, height=height, location_data_country=location_data_country)
-            return new_id
+                path=path_str, filename=info["filename"], hash=info["hash"],
+                location_data_city=info["location_data_city"], time_data=info["time_data"],
+                width=info["width"], height=info["height"], location_data_country=info["location_data_country"],
+                phash=_signed_phash(info["phash"]), orientation=info["orientation"])
+            return new_id, False, True
+
+    def _flush_file_index(self):
+        self.file_index_repo.upsert_many(self._new_file_index_rows)
+        self._new_file_index_rows = []
+
+    def _decode_photo(self, info):
+        info["image"] = self.face_detector.decode_image(
+            info["path"], info["data"])
+        # compressed bytes are not needed anymore
+        info["data"] = None
+
+        # pixels are decoded anyway, the gallery never has to open the original
+        if not self.thumbnail_cache.contains(info["hash"]):
+            self.thumbnail_cache.put_array(info["hash"], info["image"])
+        return info
+
+    def _detect_photos(self, infos):
+        all_faces = self.face_detector.detect_faces_batch(
+            [info["image"] for info in infos])
+
+        for info, faces in zip(infos, all_faces):
+            info["faces"] = faces
+        return infos
+
+    def _save_photo_faces(self, info):
+        with self._db_lock:
+            self.face_detector.save_results(
+                info["photo_id"], info["path"], info["image"], info["faces"])
+        return info
+
+    def _flush_due_faces(self):
+        # write stage waiting for detection -> faces older than max_delay
+        # (incl. reused near-duplicates) are committed anyway
+        with self._db_lock:
+            self.face_detector.flush_if_due()
+
+    def get_photo_thumbnail(self, photo):
+        # photo = row of photos (gallery), thumbnail from the cache when possible
+        return self.thumbnail_cache.get_or_create(photo.get("hash"), photo.get("path"))
 
     def get_person_thumbnail(self, person_id):
         rows = self.face_repo.get_faces_by_person_id(person_id)
@@ -139,19 +410,82 @@ class PhotoController:
             img = Image.open(biggest_photo_path)
             left, top, right, bottom = biggest_face
             MARGIN = 30
-
-            img_crop = img.crop((
-                max(0, left - MARGIN),
-                max(0, top - MARGIN),
-                min(img.width, right + MARGIN),
-                min(img.height, bottom + MARGIN)
+            # shorter side of the crop that is still decoded at full detail
+            CROP_SIZE = 120
+
+            # JPEG DCT scaling: decode only as large as the crop needs
+            full_width, full_height = img.size
+            factor = min(1.0, CROP_SIZE / max(1, min(right - left, bottom - top) + 2 * MARGIN))
+            img.draft("RGB", (math.ceil(full_width * factor), math.ceil(full_height * factor)))
+            scale = img.width / full_width
+
+            # face coords are in the EXIF-rotated frame (cv2 decoding), rotate first
+            img = ImageOps.exif_transpose(img)
+            return img.crop((
+                max(0, int((left - MARGIN) * scale)),
+                max(0, int((top - MARGIN) * scale)),
+                min(img.width, int((right + MARGIN) * scale)),
+                min(img.height, int((bottom + MARGIN) * scale))
             ))
-            return ImageOps.exif_transpose(img_crop)
 
         except Exception:
             return None
 
+    def start_reclustering(self, apply=None, on_done=None):
+        """
+        Background merge pass over all people (see ReclusteringJob), started
+        by the UI at launch and after every import.
+        Budget from system prefs: recluster_max_seconds (default 10 min),
+        a stopped run continues where it left off on the next call.
+        apply None -> recluster_auto_apply pref (default False): safe groups
+        are merged right away, the rest is only proposed.
+        """
+        if self.reclustering_job is not None and self.reclustering_job.running:
+            return self.reclustering_job
+
+        prefs = SystemPrefsRepository(self.db)
+        if apply is None:
+            apply = bool(prefs.load_pref("recluster_auto_apply", False))
+        self.reclustering_job = ReclusteringJob(
+            threshold=self.face_clustering.threshold,
+            apply=apply,
+            max_seconds=prefs.load_pref("recluster_max_seconds", 600),
+        )
+        self.reclustering_job.start(on_done)
+        return self.reclustering_job
+
+    def get_merge_proposals(self):
+        # -> [(proposal, [(person_id, name), ...]), ...] of the last finished run
+        job = self.reclustering_job
+        if job is None or job.running:
+            return []
+        return [(p, [(pid, job.person_name(pid)) for pid in (p[0], *p[1])])
+                for p in job.proposals]
+
+    def accept_merge_proposal(self, proposal, on_done=None):
+        # on_done(applied) runs on the worker thread, like start_reclustering
+        job = self.reclustering_job
+
+        def target():
+            applied = 0
+            try:
+                applied = job.apply_proposals([proposal])
+            except Exception as e:
+                print(f"Error -> Merge failed: {e}")
+            if on_done:
+                on_done(applied)
+
+        threading.Thread(target=target, name="merge-people", daemon=True).start()
+
+    def reject_merge_proposal(self, proposal):
+        self.reclustering_job.reject(SystemPrefsRepository(self.db), proposal)
+
+    def cancel_reclustering(self):
+        if self.reclustering_job is not None:
+            self.reclustering_job.cancel()
+
     def close(self):
+        self.cancel_reclustering()
         self.db.close()
 
     def export_photos(self, photos_list, base_target_folder):
@@ -188,12 +522,7 @@ class PhotoController:
         return count, errors
 
     def compute_hash(self, path: Path) -> str:
-        BUF_SIZE = 65536  # 64KB
-        sha256 = hashlib.sha256()
-        with open(path, "rb") as f:
-            while chunk := f.read(BUF_SIZE):
-                sha256.update(chunk)
-        return sha256.hexdigest()
+        return PhotoMetadata.get_hash(path)
 
 # =========================================================================
 #  WRAPPER METODS FOR UI (app.py)
@@ -0,0 +1,111 @@
+"""
+Recall and speed of the IVF ANN index used by FaceClustering against exact
+brute force search, on synthetic face embeddings (identities = random
+unit vectors, faces = identity + noise, ~20 faces per identity).
+Needs ~2x the embedding matrix in RAM (4 GB for the default 1M).
+
+    python benchmarks/bench_ann_recall.py [--n 1000000] [--queries 1000] [--k 10] [--nprobe 1 4 8 16 32 64]
+"""
+from pathlib import Path
+import argparse
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ann_index import IVFFlatIndex  # noqa: E402
+
+DIM = 512
+FACES_PER_PERSON = 20
+# cosine distance below this is a match in FaceClustering
+THRESHOLD = 0.6
+
+
+def synthetic_faces(n, centers, rng, chunk=100_000):
+    embs = np.empty((n, DIM), dtype=np.float32)
+    for start in range(0, n, chunk):
+        end = min(n, start + chunk)
+        people = rng.integers(0, len(centers), end - start)
+        # noise of norm ~1 -> cosine ~0.7 to the identity
+        faces = centers[people] + rng.standard_normal(
+            (end - start, DIM), dtype=np.float32) / np.sqrt(DIM)
+        embs[start:end] = faces / np.linalg.norm(faces, axis=1, keepdims=True)
+    return embs
+
+
+def brute_force(embs, queries, k, chunk=100_000):
+    best_sims = np.full((len(queries), k), -np.inf, dtype=np.float32)
+    best_ids = np.full((len(queries), k), -1, dtype=np.int64)
+
+    for start in range(0, len(embs), chunk):
+        sims = queries @ embs[start:start + chunk].T
+        ids = np.broadcast_to(
+            np.arange(start, start + sims.shape[1]), sims.shape)
+
+        sims = np.concatenate([best_sims, sims], axis=1)
+        ids = np.concatenate([best_ids, ids], axis=1)
+        top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        best_sims = np.take_along_axis(sims, top, axis=1)
+        best_ids = np.take_along_axis(ids, top, axis=1)
+
+    order = np.argsort(-best_sims, axis=1)
+    return np.take_along_axis(best_sims, order, axis=1), np.take_along_axis(best_ids, order, axis=1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, nargs="+",
+                        default=[1, 4, 8, 16, 32, 64])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    centers = rng.standard_normal(
+        (max(1, args.n // FACES_PER_PERSON), DIM), dtype=np.float32)
+    centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+
+    print(f"Generating {args.n} embeddings...")
+    embs = synthetic_faces(args.n, centers, rng)
+    queries = synthetic_faces(args.queries, centers, rng)
+
+    t0 = time.perf_counter()
+    exact_sims, exact_ids = brute_force(embs, queries, args.k)
+    brute_ms = (time.perf_counter() - t0) * 1000 / len(queries)
+    print(f"Brute force: {brute_ms:.2f} ms/query")
+
+    index = IVFFlatIndex(DIM)
+    t0 = time.perf_counter()
+    index.train(embs)
+    train_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    index.add(embs, np.arange(len(embs)))
+    add_s = time.perf_counter() - t0
+    print(f"IVF: {len(index.centroids)} lists, train {train_s:.1f} s, add {add_s:.1f} s")
+
+    exact_match = (1.0 - exact_sims[:, 0]) < THRESHOLD
+
+    print(f"{'nprobe':>6} {'ms/query':>9} {'speedup':>8} {'recall@1':>9} "
+          f"{'recall@' + str(args.k):>10} {'same match':>11}")
+    for nprobe in args.nprobe:
+        index.nprobe = nprobe
+        t0 = time.perf_counter()
+        sims, ids = index.search(queries, k=args.k)
+        ms = (time.perf_counter() - t0) * 1000 / len(queries)
+
+        recall_1 = np.mean(ids[:, 0] == exact_ids[:, 0])
+        recall_k = np.mean([len(np.intersect1d(a, b)) / args.k
+                            for a, b in zip(ids, exact_ids)])
+        # does the threshold decision (match / new person) stay the same
+        same = np.mean(((1.0 - sims[:, 0]) < THRESHOLD) == exact_match)
+
+        print(f"{nprobe:>6} {ms:>9.2f} {brute_ms / ms:>7.1f}x {recall_1:>9.3f} "
+              f"{recall_k:>10.3f} {same:>11.3f}")
+
+
+if __name__ == "__main__":
+    main()
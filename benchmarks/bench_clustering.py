@@ -0,0 +1,281 @@
+"""
+Quality and speed of FaceClustering.resolve_identities.
+Labelled embeddings are fed through resolve_identities in import batches
+(like several analyze_folder runs) with in-memory repositories, then
+compared with the labels. Reports per run:
+pairwise precision / recall, B-cubed F1, wall time, peak traced memory and
+the number of repository calls.
+
+Synthetic set (default): identities = random unit vectors, faces = identity
++ noise, identity sizes long-tailed like a real library.
+
+    python benchmarks/bench_clustering.py [--sizes 1000 5000] [--thresholds 0.5 0.6 0.7]
+        [--batches 4] [--noise 0.035 0.055] [--match-mode faces] [--matcher brute]
+        [--local-clustering auto] [--sidecar]
+
+Real photos (needs the insightface models): one face per photo, label taken
+from the file name with --label-regex, e.g. depp1.jpg, depp1_COPY.jpg -> depp.
+
+    python benchmarks/bench_clustering.py --folders testS1 testS2 --label-regex "^([a-z]+)"
+"""
+from collections import Counter
+from pathlib import Path
+import argparse
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from embedding_codec import encode_embedding  # noqa: E402
+from face_clustering import FaceClustering  # noqa: E402
+from structures import ClusteringConfig  # noqa: E402
+
+DIM = 512
+
+
+class _Conn:
+    def __init__(self, calls):
+        self.calls = calls
+
+    def commit(self):
+        self.calls["commit"] += 1
+
+    def rollback(self):
+        self.calls["rollback"] += 1
+
+
+class MemoryFaceRepository:
+    """Stand-in for FaceRepository, only what FaceClustering uses."""
+
+    def __init__(self, calls):
+        self.calls = calls
+        self.conn = _Conn(calls)
+        self.rows = {}
+
+    def insert(self, face_id, embedding_bytes):
+        self.rows[face_id] = {"id": face_id,
+                              "embedding": embedding_bytes, "person_id": None}
+
+    def get_all_embeddings(self):
+        self.calls["get_all_embeddings"] += 1
+        return [dict(row) for row in self.rows.values()]
+
+    def get_face_person_ids(self):
+        self.calls["get_face_person_ids"] += 1
+        return [{"id": row["id"], "person_id": row["person_id"]} for row in self.rows.values()]
+
+    def get_embeddings_by_ids(self, face_ids):
+        self.calls["get_embeddings_by_ids"] += 1
+        return [{"id": i, "embedding": self.rows[i]["embedding"]} for i in face_ids]
+
+    def assign_persons(self, pairs):
+        self.calls["assign_persons"] += 1
+        for face_id, person_id in pairs:
+            self.rows[face_id]["person_id"] = person_id
+
+    def update_person_id(self, face_id, person_id):
+        self.calls["update_person_id"] += 1
+        self.rows[face_id]["person_id"] = person_id
+
+
+class MemoryPersonRepository:
+    """Stand-in for PersonRepository, only what FaceClustering uses."""
+
+    def __init__(self, calls):
+        self.calls = calls
+        self.conn = _Conn(calls)
+        self.people = {}
+
+    def max_default_number(self):
+        self.calls["max_default_number"] += 1
+        numbers = [int(p["name"][6:]) for p in self.people.values()
+                   if re.fullmatch(r"Person\d+", p["name"] or "")]
+        return max(numbers, default=0)
+
+    def create_people(self, rows):
+        self.calls["create_people"] += 1
+        ids = []
+        for name, avg_embedding in rows:
+            person_id = len(self.people) + 1
+            self.people[person_id] = {"id": person_id, "name": name, "embedding_sum": None,
+                                      "face_count": 0, "medoids": None}
+            ids.append(person_id)
+        return ids
+
+    def get_all_people_data(self):
+        self.calls["get_all_people_data"] += 1
+        return list(self.people.values())
+
+    def get_all_stats(self):
+        self.calls["get_all_stats"] += 1
+        return [dict(p) for p in self.people.values()]
+
+    def update_stats_many(self, rows):
+        self.calls["update_stats_many"] += 1
+        for person_id, avg_embedding, embedding_sum, face_count, medoids in rows:
+            self.people[person_id].update(
+                embedding_sum=embedding_sum, face_count=face_count, medoids=medoids)
+
+
+def synthetic_set(n, rng, faces_per_person=10, noise=(0.035, 0.055)):
+    # long-tailed identity sizes: a few people on most photos
+    n_people = max(1, n // faces_per_person)
+    weights = 1.0 / np.arange(1, n_people + 1) ** 0.8
+    labels = rng.choice(n_people, n, p=weights / weights.sum())
+
+    centers = rng.standard_normal((n_people, DIM)).astype(np.float32)
+    centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+    sigma = rng.uniform(*noise, size=(n, 1)).astype(np.float32)
+    embs = centers[labels] + rng.standard_normal((n, DIM)).astype(np.float32) * sigma
+
+    order = rng.permutation(n)
+    return embs[order], labels[order]
+
+
+def folder_set(folders, label_regex):
+    from face_detection import FaceDetection
+
+    detector = FaceDetection(None, None)
+    pattern = re.compile(label_regex)
+    embs, labels = [], []
+
+    for folder in folders:
+        for path in sorted(Path(folder).iterdir()):
+            match = pattern.search(path.stem.lower())
+            if not match:
+                continue
+            try:
+                faces = detector.detect_faces(detector.decode_image(path))
+            except Exception as e:
+                print(f"Skipping {path.name}: {e}")
+                continue
+            # several faces -> unknown which one carries the label
+            if len(faces) != 1 or faces[0].normed_embedding is None:
+                continue
+            embs.append(faces[0].normed_embedding)
+            labels.append(match.group(1))
+
+    names = sorted(set(labels))
+    return np.array(embs, dtype=np.float32), np.array([names.index(l) for l in labels])
+
+
+def pair_scores(labels, predicted):
+    # pairwise precision / recall and B-cubed F1 from the contingency table
+    pairs = Counter(zip(predicted, labels))
+    cluster_sizes = Counter(predicted)
+    label_sizes = Counter(labels)
+
+    def comb2(x):
+        return x * (x - 1) / 2
+
+    same_both = sum(comb2(n) for n in pairs.values())
+    same_cluster = sum(comb2(n) for n in cluster_sizes.values())
+    same_label = sum(comb2(n) for n in label_sizes.values())
+    precision = same_both / same_cluster if same_cluster else 1.0
+    recall = same_both / same_label if same_label else 1.0
+
+    n = len(labels)
+    b3_p = sum(c * c / cluster_sizes[k] for (k, _), c in pairs.items()) / n
+    b3_r = sum(c * c / label_sizes[l] for (_, l), c in pairs.items()) / n
+    b3_f1 = 2 * b3_p * b3_r / (b3_p + b3_r) if b3_p + b3_r else 0.0
+
+    return precision, recall, b3_f1
+
+
+def run(embs, labels, threshold, batches, config, trace_memory):
+    calls = Counter()
+    face_repo = MemoryFaceRepository(calls)
+    person_repo = MemoryPersonRepository(calls)
+
+    blobs = [encode_embedding(emb) for emb in embs]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        config.ann_index_path = str(Path(tmp) / "face_index.npz")
+        config.embedding_cache_dir = str(Path(tmp) / "embeddings")
+        clustering = FaceClustering(face_repo, person_repo, config)
+        clustering.threshold = threshold
+
+        if trace_memory:
+            tracemalloc.start()
+        t0 = time.perf_counter()
+
+        # every batch = one import followed by a clustering run
+        for batch in np.array_split(np.arange(len(embs)), batches):
+            for i in batch:
+                face_repo.insert(int(i) + 1, blobs[i])
+            clustering.resolve_identities()
+
+        elapsed = time.perf_counter() - t0
+        peak = 0
+        if trace_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    predicted = [face_repo.rows[int(i) + 1]["person_id"] for i in range(len(embs))]
+    return pair_scores(list(labels), predicted), elapsed, peak, calls, len(person_repo.people)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000])
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.5, 0.6, 0.7])
+    parser.add_argument("--batches", type=int, default=4)
+    parser.add_argument("--match-mode", default="faces", choices=["faces", "people"])
+    parser.add_argument("--matcher", default="brute", choices=["brute", "ann", "auto"])
+    parser.add_argument("--local-clustering", default="auto",
+                        choices=["agglomerative", "leader", "auto"])
+    parser.add_argument("--sidecar", action="store_true",
+                        help="load embeddings through the mmap sidecar")
+    parser.add_argument("--no-memory", action="store_true",
+                        help="skip the second, traced run for peak memory")
+    parser.add_argument("--folders", nargs="+")
+    parser.add_argument("--label-regex", default=r"^([a-z]+)")
+    parser.add_argument("--noise", type=float, nargs=2, default=[0.035, 0.055],
+                        help="per-face noise range of the synthetic set, higher = harder")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.folders:
+        embs, labels = folder_set(args.folders, args.label_regex)
+        datasets = [(f"folders ({len(embs)})", embs, labels)]
+    else:
+        rng = np.random.default_rng(args.seed)
+        datasets = [(f"synthetic {n}", *synthetic_set(n, rng, noise=args.noise))
+                    for n in args.sizes]
+
+    print(f"{'dataset':>16} {'thr':>5} {'people':>7} {'true':>6} {'pair P':>7} {'pair R':>7} "
+          f"{'B3 F1':>6} {'time s':>7} {'peak MB':>8}  repo calls")
+
+    for name, embs, labels in datasets:
+        if len(embs) == 0:
+            print(f"{name}: no labelled faces")
+            continue
+
+        for threshold in args.thresholds:
+            def config():
+                return ClusteringConfig(match_mode=args.match_mode, matcher=args.matcher,
+                                        local_clustering=args.local_clustering,
+                                        embedding_cache=args.sidecar)
+
+            # timing without tracemalloc overhead, memory from a second run
+            scores, elapsed, _, calls, people = run(
+                embs, labels, threshold, args.batches, config(), False)
+            peak = 0
+            if not args.no_memory:
+                peak = run(embs, labels, threshold,
+                           args.batches, config(), True)[2]
+
+            precision, recall, b3_f1 = scores
+            call_text = ", ".join(f"{k}={v}" for k, v in sorted(calls.items()))
+            print(f"{name:>16} {threshold:>5.2f} {people:>7} {len(set(labels)):>6} "
+                  f"{precision:>7.3f} {recall:>7.3f} {b3_f1:>6.3f} {elapsed:>7.2f} "
+                  f"{peak / 2**20:>8.1f}  {call_text}")
+
+
+if __name__ == "__main__":
+    main()
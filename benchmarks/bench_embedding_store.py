@@ -0,0 +1,80 @@
+"""
+Scaling of the known-face matrix in FaceClustering.resolve_identities:
+old np.vstack / np.append per face against the capacity-doubling
+EmbeddingStore. Every step does the same matching (one cluster against all
+known faces) followed by the append, like resolve_identities.
+
+    python benchmarks/bench_embedding_store.py [--known 1000 5000 20000 50000] [--new 1000]
+"""
+from pathlib import Path
+import argparse
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from face_clustering import EmbeddingStore  # noqa: E402
+
+DIM = 512
+CLUSTER_SIZE = 5
+
+
+def random_embeddings(n, rng):
+    embs = rng.standard_normal((n, DIM)).astype(np.float32)
+    return embs / np.linalg.norm(embs, axis=1, keepdims=True)
+
+
+def run_old(known_embs, new_embs):
+    known_embs = known_embs.copy()
+    known_person_ids = np.arange(len(known_embs))
+
+    for start in range(0, len(new_embs), CLUSTER_SIZE):
+        cluster = new_embs[start:start + CLUSTER_SIZE]
+        np.min(1.0 - cluster @ known_embs.T)
+        for emb in cluster:
+            known_embs = np.vstack([known_embs, emb])
+            known_person_ids = np.append(known_person_ids, start)
+
+
+def run_store(known_embs, new_embs):
+    # default capacity on purpose: measures the doubling, not the presizing
+    store = EmbeddingStore(DIM)
+    store.append(known_embs, np.arange(len(known_embs)),
+                 np.arange(len(known_embs)))
+
+    for start in range(0, len(new_embs), CLUSTER_SIZE):
+        cluster = new_embs[start:start + CLUSTER_SIZE]
+        np.min(1.0 - cluster @ store.embeddings.T)
+        store.append(cluster, np.arange(start, start + len(cluster)), start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--known", nargs="+", type=int,
+                        default=[1000, 5000, 20000, 50000])
+    parser.add_argument("--new", type=int, default=1000,
+                        help="new faces appended per run")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    new_embs = random_embeddings(args.new, rng)
+
+    print(f"{'known':>8} {'vstack [s]':>11} {'store [s]':>10} {'speedup':>8}")
+    for n_known in args.known:
+        known_embs = random_embeddings(n_known, rng)
+
+        start = time.perf_counter()
+        run_old(known_embs, new_embs)
+        old = time.perf_counter() - start
+
+        start = time.perf_counter()
+        run_store(known_embs, new_embs)
+        new = time.perf_counter() - start
+
+        print(f"{n_known:>8} {old:>11.3f} {new:>10.3f} {old / new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
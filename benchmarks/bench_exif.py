@@ -0,0 +1,66 @@
+"""
+Old three-call metadata path (get_date + get_coordinates + get_size, each
+opening the file) against the single-pass PhotoMetadata.read_record on one
+read of the file. Also reports files where the two disagree.
+
+    python benchmarks/bench_exif.py [folder ...] [--rounds 200]
+"""
+from pathlib import Path
+import argparse
+import sys
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from metadata_handle import PhotoFile, PhotoMetadata  # noqa: E402
+
+ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_FOLDERS = [ROOT / "testS1", ROOT / "testS2", ROOT / "test_location_2"]
+EXTENSIONS = [".jpg", ".jpeg", ".png", ".webp"]
+
+
+def old_path(p):
+    # get_location without the network part
+    return PhotoMetadata.get_date(p), PhotoMetadata.get_coordinates(p), PhotoMetadata.get_size(p)
+
+
+def new_path(p):
+    photo = PhotoFile(p)
+    return photo.get_date(), photo.get_coordinates(), photo.get_size()
+
+
+def timed(fn, paths, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for p in paths:
+            fn(p)
+    return (time.perf_counter() - start) / (rounds * len(paths))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("folders", nargs="*", default=DEFAULT_FOLDERS)
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    paths = [p for folder in args.folders for p in sorted(Path(folder).rglob("*"))
+             if p.is_file() and p.suffix.lower() in EXTENSIONS]
+    print(f"{len(paths)} files")
+
+    mismatches = [p for p in paths if old_path(p) != new_path(p)]
+    for p in mismatches:
+        print(f"  differs: {p.name}: {old_path(p)} vs {new_path(p)}")
+
+    old = timed(old_path, paths, args.rounds)
+    new = timed(new_path, paths, args.rounds)
+    only_parse = timed(lambda p: PhotoMetadata.read_record(
+        p.read_bytes()), paths, args.rounds)
+
+    print(f"three calls (exifread x2 + PIL): {old * 1e6:8.1f} us/file")
+    print(f"PhotoFile, one read + parse:     {new * 1e6:8.1f} us/file  (x{old / new:.1f})")
+    print(f"read_record only:                {only_parse * 1e6:8.1f} us/file  (x{old / only_parse:.1f})")
+    print(f"mismatches: {len(mismatches)}")
+
+
+if __name__ == "__main__":
+    main()
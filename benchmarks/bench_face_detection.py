@@ -0,0 +1,92 @@
+"""
+Photos per second of FaceDetection.detect_faces_batch at several batch sizes,
+compared to the one-image-at-a-time reference path (FaceAnalysis.get via
+detect_faces_reference). Also checks that both find the same faces and
+embeddings; quality gates are switched off for that.
+
+    python benchmarks/bench_face_detection.py [folder ...] [--batch-sizes 1 2 4 8 16]
+"""
+from pathlib import Path
+import argparse
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from face_detection import FaceDetection  # noqa: E402
+from structures import FaceQualityConfig  # noqa: E402
+
+ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_FOLDERS = [ROOT / "testS1", ROOT / "testS2"]
+EXTENSIONS = [".jpg", ".jpeg", ".png", ".webp"]
+
+
+def load_images(detector, folders, repeat):
+    images = []
+    for folder in folders:
+        for p in sorted(Path(folder).rglob("*")):
+            if p.is_file() and p.suffix.lower() in EXTENSIONS:
+                images.append(detector.decode_image(p))
+    return images * repeat
+
+
+def compare(single, batched):
+    # same number of faces, same boxes, same embeddings (up to float noise)
+    max_bbox_diff = 0.0
+    max_emb_diff = 0.0
+    for faces_a, faces_b in zip(single, batched):
+        if len(faces_a) != len(faces_b):
+            return False, None, None
+        for a, b in zip(faces_a, faces_b):
+            max_bbox_diff = max(max_bbox_diff, float(
+                np.abs(a.bbox - b.bbox).max()))
+            max_emb_diff = max(max_emb_diff, float(
+                np.abs(a.normed_embedding - b.normed_embedding).max()))
+    return True, max_bbox_diff, max_emb_diff
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("folders", nargs="*", default=DEFAULT_FOLDERS)
+    parser.add_argument("--batch-sizes", nargs="+",
+                        type=int, default=[1, 2, 4, 8, 16])
+    parser.add_argument("--repeat", type=int, default=4,
+                        help="repeat the image set to get stable timings")
+    args = parser.parse_args()
+
+    # No DB needed, only the models. Gates off, the reference path has none.
+    detector = FaceDetection(photo_repo=None, face_repo=None,
+                             quality=FaceQualityConfig(min_det_score=0.0, min_face_size=0,
+                                                       min_sharpness=0.0))
+    images = load_images(detector, args.folders, args.repeat)
+    print(f"{len(images)} images, det batching supported by model: "
+          f"{detector._det_supports_batch}")
+
+    # warm up ONNX sessions
+    detector.detect_faces_reference(images[0])
+    detector.detect_faces_batch(images[:1])
+
+    start = time.perf_counter()
+    single = [detector.detect_faces_reference(img) for img in images]
+    base = len(images) / (time.perf_counter() - start)
+    print(f"{'reference':>9}: {base:7.2f} photos/s")
+
+    for batch_size in args.batch_sizes:
+        start = time.perf_counter()
+        batched = []
+        for i in range(0, len(images), batch_size):
+            batched.extend(detector.detect_faces_batch(
+                images[i:i + batch_size]))
+        speed = len(images) / (time.perf_counter() - start)
+
+        same, bbox_diff, emb_diff = compare(single, batched)
+        check = (f"max bbox diff {bbox_diff:.2e}, max emb diff {emb_diff:.2e}"
+                 if same else "DIFFERENT FACE COUNTS")
+        print(f"{batch_size:>9}: {speed:7.2f} photos/s "
+              f"(x{speed / base:.2f})  {check}")
+
+
+if __name__ == "__main__":
+    main()
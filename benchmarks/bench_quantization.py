@@ -0,0 +1,97 @@
+"""
+float32 vs float16 vs int8 face embeddings: bytes per stored embedding,
+size of the known-face matrix, brute force matching time and how many match
+decisions (matched person / new person) change against float32, on a
+labelled synthetic set (identity = random unit vector, face = identity + noise).
+
+    python benchmarks/bench_quantization.py [--known 50000] [--queries 2000] [--noise 0.045]
+"""
+from pathlib import Path
+import argparse
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from embedding_codec import EMBEDDING_DTYPES, encode_embedding  # noqa: E402
+from face_clustering import EmbeddingStore  # noqa: E402
+
+DIM = 512
+FACES_PER_PERSON = 10
+CLUSTER_SIZE = 5
+THRESHOLD = 0.6
+
+
+def labelled_faces(n, centers, rng, noise):
+    people = rng.integers(0, len(centers), n)
+    faces = centers[people] + rng.standard_normal((n, DIM), dtype=np.float32) * noise
+    return (faces / np.linalg.norm(faces, axis=1, keepdims=True)).astype(np.float32), people
+
+
+def match(store, queries):
+    # same decision as FaceClustering._match_brute: closest known face to any
+    # face of the cluster, all clusters in one pass over the matrix
+    best_sim, best_row = store.best(queries)
+    best_sim = best_sim.reshape(-1, CLUSTER_SIZE)
+    best_row = best_row.reshape(-1, CLUSTER_SIZE)
+
+    i = np.argmax(best_sim, axis=1)
+    sims = best_sim[np.arange(len(i)), i]
+    people = store.person_ids[best_row[np.arange(len(i)), i]]
+    return np.where(1.0 - sims < THRESHOLD, people, -1), sims
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--known", type=int, default=50_000)
+    parser.add_argument("--queries", type=int, default=2000)
+    # ~0.045 puts a good share of pairs near the 0.6 threshold
+    parser.add_argument("--noise", type=float, default=0.045)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    centers = rng.standard_normal(
+        (max(1, args.known // FACES_PER_PERSON), DIM), dtype=np.float32)
+    centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+
+    known, known_people = labelled_faces(args.known, centers, rng, args.noise)
+    # every cluster = CLUSTER_SIZE faces of one person
+    cluster_people = rng.integers(0, len(centers), args.queries // CLUSTER_SIZE)
+    queries = centers[np.repeat(cluster_people, CLUSTER_SIZE)] + rng.standard_normal(
+        (len(cluster_people) * CLUSTER_SIZE, DIM), dtype=np.float32) * args.noise
+    queries = (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(np.float32)
+
+    print(f"{args.known} known faces, {len(cluster_people)} clusters of {CLUSTER_SIZE}")
+    print(f"{'dtype':>8} {'bytes/emb':>10} {'matrix MB':>10} {'match s':>8} "
+          f"{'speedup':>8} {'sim err':>8} {'changed':>8} {'correct':>8}")
+
+    reference = None
+    reference_sims = None
+    reference_time = None
+    for dtype in EMBEDDING_DTYPES:
+        store = EmbeddingStore(DIM, capacity=args.known, dtype=dtype)
+        store.append(known, np.arange(args.known), known_people)
+
+        t0 = time.perf_counter()
+        decisions, sims = match(store, queries)
+        elapsed = time.perf_counter() - t0
+
+        if reference is None:
+            reference, reference_sims, reference_time = decisions, sims, elapsed
+
+        # largest shift of a best match similarity, what the threshold sees
+        sim_err = np.abs(sims - reference_sims).max()
+        changed = np.mean(decisions != reference)
+        correct = np.mean(decisions == cluster_people)
+        stored = len(encode_embedding(known[0], dtype))
+        matrix_mb = store.embeddings.nbytes / 2**20
+
+        print(f"{dtype:>8} {stored:>10} {matrix_mb:>10.1f} {elapsed:>8.2f} "
+              f"{reference_time / elapsed:>7.2f}x {sim_err:>8.5f} {changed:>8.4f} {correct:>8.4f}")
+
+
+if __name__ == "__main__":
+    main()
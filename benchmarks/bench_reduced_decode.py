@@ -0,0 +1,215 @@
+"""
+Full vs reduced-resolution JPEG decoding for gallery thumbnails and person
+face crops: time per image and peak RSS. Every variant runs in its own
+subprocess, so the peak memory of one does not hide the others.
+
+Variants:
+    thumb-full    Image.open + exif_transpose + thumbnail (old gallery path)
+    thumb-draft   same with draft() first (ThumbnailCache.get_or_create)
+    thumb-cv2     cv2.IMREAD_REDUCED_COLOR_8 + resize
+    crop-full     decode everything, crop a face (old get_person_thumbnail)
+    crop-draft    draft() sized for the crop, scaled coordinates
+
+Without --images, synthetic 24 MP JPEGs are written to a temp folder.
+
+    python benchmarks/bench_reduced_decode.py [--images a.jpg b.jpg] [--count 5] [--megapixels 24]
+"""
+from pathlib import Path
+import argparse
+import json
+import math
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import cv2  # noqa: E402
+import numpy as np  # noqa: E402
+from PIL import Image, ImageOps  # noqa: E402
+
+from thumbnail_cache import THUMBNAIL_SIZE  # noqa: E402
+
+VARIANTS = ("thumb-full", "thumb-draft", "thumb-cv2", "crop-full", "crop-draft")
+MARGIN = 30
+CROP_SIZE = 120
+
+
+def face_box(img):
+    # a face of ~1/10 of the shorter side in the middle of the photo, in the
+    # EXIF-rotated frame like the stored face_coords
+    width, height = img.size
+    if img.getexif().get(0x0112) in (5, 6, 7, 8):
+        width, height = height, width
+    side = min(width, height) // 10
+    left, top = width // 2 - side // 2, height // 2 - side // 2
+    return left, top, left + side, top + side
+
+
+def thumb_full(path):
+    img = ImageOps.exif_transpose(Image.open(path))
+    img.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+    return img
+
+
+def thumb_draft(path):
+    img = Image.open(path)
+    img.draft("RGB", (THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+    img = ImageOps.exif_transpose(img)
+    img.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+    return img
+
+
+def thumb_cv2(path):
+    img = cv2.imread(str(path), cv2.IMREAD_REDUCED_COLOR_8)
+    h, w = img.shape[:2]
+    scale = THUMBNAIL_SIZE / max(h, w)
+    return cv2.resize(img, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_AREA)
+
+
+def crop_full(path):
+    img = Image.open(path)
+    left, top, right, bottom = face_box(img)
+    img = ImageOps.exif_transpose(img)
+    return img.crop((max(0, left - MARGIN), max(0, top - MARGIN),
+                     min(img.width, right + MARGIN), min(img.height, bottom + MARGIN)))
+
+
+def crop_draft(path):
+    # same steps as PhotoController.get_person_thumbnail
+    img = Image.open(path)
+    full_width, full_height = img.size
+    left, top, right, bottom = face_box(img)
+    factor = min(1.0, CROP_SIZE / max(1, min(right - left, bottom - top) + 2 * MARGIN))
+    img.draft("RGB", (math.ceil(full_width * factor), math.ceil(full_height * factor)))
+    scale = img.width / full_width
+    img = ImageOps.exif_transpose(img)
+    return img.crop((max(0, int((left - MARGIN) * scale)), max(0, int((top - MARGIN) * scale)),
+                     min(img.width, int((right + MARGIN) * scale)),
+                     min(img.height, int((bottom + MARGIN) * scale))))
+
+
+FUNCTIONS = dict(zip(VARIANTS, (thumb_full, thumb_draft, thumb_cv2, crop_full, crop_draft)))
+
+
+def worker(variant, paths):
+    # variant "none" = interpreter + imports only, the baseline RSS
+    result = {}
+    if variant != "none":
+        fn = FUNCTIONS[variant]
+        t0 = time.perf_counter()
+        for path in paths:
+            out = fn(path)
+        result["ms"] = 1000 * (time.perf_counter() - t0) / len(paths)
+        result["size"] = list(out.shape[1::-1] if isinstance(out, np.ndarray) else out.size)
+
+    result["peak_mb"] = peak_rss_mb()
+    print(json.dumps(result))
+
+
+def peak_rss_mb():
+    # VmHWM starts fresh with the exec, ru_maxrss on Linux keeps the
+    # parent's peak from before the fork
+    status = Path("/proc/self/status")
+    if status.exists():
+        for line in status.read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+
+    if sys.platform == "win32":
+        return _peak_working_set_mb()
+
+    # POSIX only, macOS: bytes
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+def _peak_working_set_mb():
+    # Windows has no resource module: PeakWorkingSetSize of
+    # GetProcessMemoryInfo, the same number psutil reports as peak_wset
+    import ctypes
+    from ctypes import wintypes
+
+    class ProcessMemoryCounters(ctypes.Structure):
+        _fields_ = [("cb", wintypes.DWORD),
+                    ("PageFaultCount", wintypes.DWORD),
+                    ("PeakWorkingSetSize", ctypes.c_size_t),
+                    ("WorkingSetSize", ctypes.c_size_t),
+                    ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                    ("PagefileUsage", ctypes.c_size_t),
+                    ("PeakPagefileUsage", ctypes.c_size_t)]
+
+    counters = ProcessMemoryCounters()
+    counters.cb = ctypes.sizeof(counters)
+    kernel32 = ctypes.WinDLL("kernel32")
+    kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+    # K32GetProcessMemoryInfo: kernel32 export since Windows 7, no psapi.dll needed
+    if not kernel32.K32GetProcessMemoryInfo(
+            kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb):
+        raise ctypes.WinError()
+    return counters.PeakWorkingSetSize / 2**20
+
+
+def run_worker(variant, paths):
+    out = subprocess.run(
+        [sys.executable, __file__, "--worker", variant, "--paths", *map(str, paths)],
+        capture_output=True, text=True, check=True)
+    return json.loads(out.stdout)
+
+
+def synthetic_images(folder, count, megapixels, seed):
+    rng = np.random.default_rng(seed)
+    width = int(math.sqrt(megapixels * 1e6 * 3 / 2))
+    height = width * 2 // 3
+    # smooth gradients + noise, compresses like a photo
+    y, x = np.mgrid[:height, :width]
+    base = np.stack([x * 255 // width, y * 255 // height, (x + y) * 255 // (width + height)], axis=-1)
+
+    paths = []
+    for i in range(count):
+        noise = rng.integers(0, 24, size=(height, width, 3), dtype=np.uint8)
+        path = Path(folder) / f"synthetic_{i}.jpg"
+        Image.fromarray((base + noise).astype(np.uint8)).save(path, quality=90)
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", nargs="+")
+    parser.add_argument("--count", type=int, default=5)
+    parser.add_argument("--megapixels", type=float, default=24)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--paths", nargs="*", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args.worker, args.paths)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = args.images or synthetic_images(tmp, args.count, args.megapixels, args.seed)
+        with Image.open(paths[0]) as first:
+            print(f"{len(paths)} images, first {first.width}x{first.height}")
+
+        base = run_worker("none", [])["peak_mb"]
+        print(f"{'variant':>12} {'ms/image':>9} {'peak MB':>8} {'output':>10}")
+        reference = {}
+        for variant in VARIANTS:
+            result = run_worker(variant, paths)
+            kind = variant.split("-")[0]
+            reference.setdefault(kind, result["ms"])
+
+            print(f"{variant:>12} {result['ms']:>9.1f} {result['peak_mb'] - base:>8.1f} "
+                  f"{'x'.join(map(str, result['size'])):>10}  "
+                  f"{reference[kind] / result['ms']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
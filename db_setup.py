@@ -1,8 +1,16 @@
+from pathlib import Path
+
 import psycopg2
 import psycopg2.extras
 
+# 001_create.sql + later migrations, all idempotent
+SCHEMA_DIR = Path(__file__).resolve().parent / "docker" / "db-init"
+
 
 class Database:
+    # docker runs the init scripts only on an empty data dir, so existing
+    # databases get new tables / columns here, once per process
+    _schema_applied = False
 
     def __init__(self):
         self.conn = psycopg2.connect(
@@ -17,6 +25,20 @@ class Database:
             cursor_factory=psycopg2.extras.RealDictCursor
         )
         print("Connected to PostgreSQL")
+        self._apply_schema()
+
+    def _apply_schema(self) -> None:
+        if Database._schema_applied:
+            return
+
+        try:
+            for script in sorted(SCHEMA_DIR.glob("*.sql")):
+                self.cursor.execute(script.read_text())
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        Database._schema_applied = True
 
     def close(self) -> None:
         self.conn.close()
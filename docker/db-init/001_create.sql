@@ -9,7 +9,11 @@ CREATE TABLE IF NOT EXISTS photos (
     location_data_city TEXT,
     time_data TEXT,
     width INTEGER,
-    height INTEGER
+    height INTEGER,
+    phash BIGINT,
+    -- dHash attempted, phash stays NULL for formats PIL cannot open
+    phash_checked BOOLEAN NOT NULL DEFAULT FALSE,
+    orientation SMALLINT
 );
 
 -- TAGS
@@ -30,7 +34,10 @@ CREATE TABLE IF NOT EXISTS photo_tags (
 CREATE TABLE IF NOT EXISTS people (
     id SERIAL PRIMARY KEY,
     name TEXT NOT NULL,
-    avg_embedding BYTEA
+    avg_embedding BYTEA,
+    embedding_sum BYTEA,
+    face_count INTEGER NOT NULL DEFAULT 0,
+    medoids BYTEA
 );
 
 -- FACES
@@ -40,10 +47,30 @@ CREATE TABLE IF NOT EXISTS faces (
     embedding BYTEA NOT NULL,
     face_coords TEXT,
     person_id INTEGER,
+    det_score REAL,
+    face_size INTEGER,
+    sharpness REAL,
     FOREIGN KEY (photo_id) REFERENCES photos(id) ON DELETE CASCADE,
     FOREIGN KEY (person_id) REFERENCES people(id) ON DELETE SET NULL
 );
 
+-- FILE INDEX (stat signature per path, lets re-scans skip unchanged files)
+CREATE TABLE IF NOT EXISTS file_index (
+    path TEXT PRIMARY KEY,
+    size BIGINT NOT NULL,
+    mtime_ns BIGINT NOT NULL,
+    inode NUMERIC NOT NULL,
+    photo_id INTEGER NOT NULL,
+    FOREIGN KEY (photo_id) REFERENCES photos(id) ON DELETE CASCADE
+);
+
+-- GEOCODE CACHE (reverse geocoding result per rounded lat/lon cell)
+CREATE TABLE IF NOT EXISTS geocode_cache (
+    cell TEXT PRIMARY KEY,
+    city TEXT,
+    country TEXT
+);
+
 -- SYSTEM PREFS
 CREATE TABLE IF NOT EXISTS system_preferences (
     key TEXT PRIMARY KEY,
@@ -0,0 +1,17 @@
+-- Columns added after the first schema. Docker runs this folder only on an
+-- empty data dir, Database applies it on every start, so keep it idempotent.
+
+-- PHOTOS
+ALTER TABLE photos ADD COLUMN IF NOT EXISTS phash BIGINT;
+ALTER TABLE photos ADD COLUMN IF NOT EXISTS orientation SMALLINT;
+ALTER TABLE photos ADD COLUMN IF NOT EXISTS phash_checked BOOLEAN NOT NULL DEFAULT FALSE;
+
+-- PEOPLE (running stats for FaceClustering)
+ALTER TABLE people ADD COLUMN IF NOT EXISTS embedding_sum BYTEA;
+ALTER TABLE people ADD COLUMN IF NOT EXISTS face_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE people ADD COLUMN IF NOT EXISTS medoids BYTEA;
+
+-- FACES (quality metrics, FaceQualityConfig)
+ALTER TABLE faces ADD COLUMN IF NOT EXISTS det_score REAL;
+ALTER TABLE faces ADD COLUMN IF NOT EXISTS face_size INTEGER;
+ALTER TABLE faces ADD COLUMN IF NOT EXISTS sharpness REAL;
@@ -0,0 +1,71 @@
+from typing import Iterable
+import numpy as np
+
+# Stored format is recognised by the BYTEA length, so old float32 rows and
+# new quantized rows can live in the same faces table:
+#   float32: dim * 4 bytes, float16: dim * 2, int8: 4 byte scale + dim
+EMBEDDING_DTYPES = ("float32", "float16", "int8")
+
+
+def encode_embedding(emb: np.ndarray, dtype: str = "float32") -> bytes:
+    emb = np.asarray(emb, dtype=np.float32).ravel()
+
+    if dtype == "float32":
+        return emb.tobytes()
+    if dtype == "float16":
+        return emb.astype(np.float16).tobytes()
+    if dtype == "int8":
+        codes, scales = quantize_int8(emb[None, :])
+        return scales.tobytes() + codes.tobytes()
+
+    raise ValueError(f"Unknown embedding dtype: {dtype}")
+
+
+def decode_embedding(data, dim: int = 512) -> np.ndarray:
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+
+    size = len(data)
+    if size == 4 * dim:
+        return np.frombuffer(data, dtype=np.float32)
+    if size == 2 * dim:
+        return np.frombuffer(data, dtype=np.float16).astype(np.float32)
+    if size == dim + 4:
+        scale = np.frombuffer(data, dtype=np.float32, count=1)
+        return np.frombuffer(data, dtype=np.int8, offset=4).astype(np.float32) * scale
+
+    raise ValueError(f"Unexpected embedding size: {size} bytes")
+
+
+def decode_many(blobs: Iterable, dim: int = 512) -> np.ndarray:
+    # -> (n, dim) float32, one vectorized decode per stored format
+    blobs = [b.tobytes() if isinstance(b, memoryview) else b for b in blobs]
+    out = np.empty((len(blobs), dim), dtype=np.float32)
+
+    by_size = {}
+    for i, blob in enumerate(blobs):
+        by_size.setdefault(len(blob), []).append(i)
+
+    for size, rows in by_size.items():
+        data = b"".join(blobs[i] for i in rows)
+        if size == 4 * dim:
+            out[rows] = np.frombuffer(data, dtype=np.float32).reshape(-1, dim)
+        elif size == 2 * dim:
+            out[rows] = np.frombuffer(data, dtype=np.float16).reshape(-1, dim)
+        elif size == dim + 4:
+            packed = np.frombuffer(data, dtype=np.uint8).reshape(-1, dim + 4)
+            scales = packed[:, :4].copy().view(np.float32)
+            out[rows] = packed[:, 4:].view(np.int8) * scales
+        else:
+            raise ValueError(f"Unexpected embedding size: {size} bytes")
+
+    return out
+
+
+def quantize_int8(embs: np.ndarray):
+    # -> (codes int8 (n, dim), scales float32 (n, 1)), emb ~= codes * scale
+    embs = np.asarray(embs, dtype=np.float32)
+    scales = np.abs(embs).max(axis=1, keepdims=True) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(embs / scales), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
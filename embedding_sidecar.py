@@ -0,0 +1,216 @@
+from pathlib import Path
+from typing import Tuple
+import json
+import os
+
+import numpy as np
+
+from embedding_codec import decode_many
+
+MANIFEST = "manifest.json"
+
+
+class EmbeddingSidecar:
+    """
+    L2-normalized float32 copy of faces.embedding on disk, next to the DB.
+    Embeddings are immutable once written, so the file is append-only:
+    every sync writes the faces it does not have yet as a new segment
+    (.npy pair: embeddings + face ids) and lists it in manifest.json.
+    Segments are memory-mapped, a load is one read of N x dim floats
+    instead of N BYTEA rows. Deleted faces are dropped by compact(), which
+    runs on its own once enough dead rows or segments pile up.
+    Only face ids and person ids (both mutable or cheap) come from the DB.
+
+    Face ids are only unique within one database, so the manifest records
+    `identity` (SystemPrefsRepository.get_db_identity) and the sidecar is
+    rebuilt when it changes. Every sync also compares a random sample of
+    rows with the DB and rebuilds on any mismatch.
+    """
+
+    def __init__(self, root, dim: int = 512, max_segments: int = 8, max_dead_ratio: float = 0.25,
+                 identity=None, verify_sample: int = 32):
+        self.root = Path(root)
+        self.dim = dim
+        self.max_segments = max_segments
+        self.max_dead_ratio = max_dead_ratio
+        self.identity = identity
+        self.verify_sample = verify_sample
+
+        self._manifest = None
+
+    def sync(self, face_repo) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        -> (face_ids, person_ids, embeddings) for every face in the DB,
+        person_id -1 = unassigned. embeddings is a read-only memory map when
+        the sidecar is in one segment and in DB order, a copy otherwise.
+        """
+        pairs = face_repo.get_face_person_ids()
+        db_ids = np.fromiter((row["id"] for row in pairs), dtype=np.int64, count=len(pairs))
+        db_people = np.fromiter(
+            (-1 if row["person_id"] is None else row["person_id"] for row in pairs),
+            dtype=np.int64, count=len(pairs))
+
+        ids, embs = self._load()
+
+        missing = db_ids[~np.isin(db_ids, ids)]
+        if len(missing):
+            self._append(face_repo.get_embeddings_by_ids(missing.tolist()))
+            ids, embs = self._load()
+
+        if not self._verify(face_repo, ids, embs, db_ids):
+            print("EMBEDDINGS: Sidecar does not match the database, rebuilding")
+            ids = embs = None
+            self._reset()
+            self._append(face_repo.get_embeddings_by_ids(db_ids.tolist()))
+            ids, embs = self._load()
+
+        live = np.isin(ids, db_ids)
+        dead = len(ids) - int(live.sum())
+        if len(self._segments()) > self.max_segments or dead > self.max_dead_ratio * max(1, len(ids)):
+            self.compact(ids[live], embs[live])
+            ids, embs = self._load()
+
+        # faces without a usable embedding never make it into the sidecar
+        present = np.isin(db_ids, ids)
+        db_ids, db_people = db_ids[present], db_people[present]
+
+        if np.array_equal(ids, db_ids):
+            return db_ids, db_people, embs
+
+        order = np.argsort(ids, kind="stable")
+        rows = order[np.searchsorted(ids, db_ids, sorter=order)]
+        return db_ids, db_people, embs[rows]
+
+    def compact(self, ids: np.ndarray, embs: np.ndarray) -> None:
+        # rewrites the live rows as one segment, sorted by face id
+        order = np.argsort(ids, kind="stable")
+        ids, embs = np.ascontiguousarray(ids[order]), np.ascontiguousarray(embs[order])
+        old = self._segments()
+
+        manifest = self._read_manifest()
+        manifest["segments"] = []
+        self._write_segment(manifest, ids, embs)
+
+        for segment in old:
+            self._remove(segment)
+        print(f"EMBEDDINGS: Compacted {len(old)} segments into {len(ids)} rows")
+
+    def _verify(self, face_repo, ids, embs, db_ids) -> bool:
+        # random sample of live rows against the DB, catches reused face ids
+        candidates = np.flatnonzero(np.isin(ids, db_ids))
+        if len(candidates) == 0:
+            return True
+        rows = np.random.default_rng().choice(
+            candidates, min(self.verify_sample, len(candidates)), replace=False)
+
+        stored = {int(ids[r]): embs[r] for r in rows}
+        for row in face_repo.get_embeddings_by_ids(list(stored)):
+            emb = row["embedding"]
+            if not emb:
+                return False
+            expected = decode_many([emb], self.dim)[0]
+            norm = np.linalg.norm(expected)
+            if norm:
+                expected /= norm
+            if not np.allclose(stored[row["id"]], expected, atol=1e-4):
+                return False
+        return True
+
+    def _reset(self) -> None:
+        manifest = self._read_manifest()
+        for segment in manifest["segments"]:
+            self._remove(segment)
+        # segment numbers keep counting, an old file may still be mapped (Windows)
+        self._write_manifest(self._new_manifest(manifest["next_segment"]))
+
+    def _new_manifest(self, next_segment: int = 1) -> dict:
+        return {"dim": self.dim, "identity": self.identity,
+                "next_segment": next_segment, "segments": []}
+
+    def _append(self, rows) -> None:
+        ids = []
+        blobs = []
+        for row in rows:
+            emb = row["embedding"]
+            # float32, float16 or int8 + scale (embedding_codec)
+            if emb and len(emb) in (4 * self.dim, 2 * self.dim, self.dim + 4):
+                ids.append(row["id"])
+                blobs.append(emb)
+
+        if not ids:
+            return
+
+        embs = decode_many(blobs, self.dim)
+        # normalized once on write, never again on load
+        norms = np.linalg.norm(embs, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        embs = (embs / norms).astype(np.float32)
+
+        manifest = self._read_manifest()
+        self._write_segment(manifest, np.array(ids, dtype=np.int64), embs)
+        print(f"EMBEDDINGS: Added {len(ids)} faces to {self.root}")
+
+    def _write_segment(self, manifest, ids, embs) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+
+        number = manifest["next_segment"]
+        name = f"seg_{number:06d}"
+        np.save(self.root / f"{name}.emb.npy", embs)
+        np.save(self.root / f"{name}.ids.npy", ids)
+
+        manifest["next_segment"] = number + 1
+        manifest["segments"].append({"name": name, "rows": int(len(ids))})
+        # manifest last: a crash before this line leaves an unlisted segment
+        self._write_manifest(manifest)
+
+    def _load(self) -> Tuple[np.ndarray, np.ndarray]:
+        segments = self._segments()
+        if not segments:
+            return np.empty(0, dtype=np.int64), np.empty((0, self.dim), dtype=np.float32)
+
+        ids = [np.load(self.root / f"{s['name']}.ids.npy") for s in segments]
+        embs = [np.load(self.root / f"{s['name']}.emb.npy", mmap_mode="r") for s in segments]
+
+        if len(segments) == 1:
+            return ids[0], embs[0]
+        return np.concatenate(ids), np.concatenate(embs)
+
+    def _segments(self) -> list:
+        return self._read_manifest()["segments"]
+
+    def _read_manifest(self) -> dict:
+        if self._manifest is None:
+            path = self.root / MANIFEST
+            manifest = None
+            if path.exists():
+                with open(path, encoding="utf-8") as f:
+                    manifest = json.load(f)
+
+            # other model / dimension or other database -> start over
+            if manifest is not None and (manifest.get("dim") != self.dim
+                                         or manifest.get("identity") != self.identity):
+                print("EMBEDDINGS: Other database or model, rebuilding")
+                for segment in manifest["segments"]:
+                    self._remove(segment)
+                manifest = self._new_manifest(manifest.get("next_segment", 1))
+            if manifest is None:
+                manifest = self._new_manifest()
+            self._manifest = manifest
+
+        return self._manifest
+
+    def _write_manifest(self, manifest) -> None:
+        path = self.root / MANIFEST
+        tmp = path.with_name(MANIFEST + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(tmp, path)
+        self._manifest = manifest
+
+    def _remove(self, segment) -> None:
+        for suffix in (".emb.npy", ".ids.npy"):
+            try:
+                os.remove(self.root / f"{segment['name']}{suffix}")
+            except OSError as e:
+                # still mapped somewhere (Windows) -> only wastes disk space
+                print(f"Error -> Cannot remove {segment['name']}{suffix}: {e}")
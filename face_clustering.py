@@ -1,38 +1,462 @@
-from typing import Any
+from pathlib import Path
+from typing import Any, Optional
 import numpy as np
 from sklearn.cluster import AgglomerativeClustering
 
+from ann_index import IVFFlatIndex
+from embedding_codec import decode_many, quantize_int8
+from embedding_sidecar import EmbeddingSidecar
+from structures import ClusteringConfig
+
+DEFAULT_INDEX_PATH = Path(__file__).resolve().parent / "data" / "face_index.npz"
+DEFAULT_EMBEDDINGS_DIR = Path(__file__).resolve().parent / "data" / "embeddings"
+
+
+class EmbeddingStore:
+    """
+    Known face embeddings in one preallocated matrix, face and person ids
+    kept alongside. Capacity doubles when full, so appending a face is
+    amortized O(1) instead of copying the whole matrix on every append.
+    dtype "float16" / "int8" (per-row scale) stores the matrix at 1/2 or 1/4
+    of the float32 size, best() then widens it block by block.
+    """
+
+    def __init__(self, dim: int, capacity: int = 1024, dtype: str = "float32"):
+        capacity = max(1, int(capacity))
+        self.dtype = dtype
+        self._embs = np.empty((capacity, dim), dtype=np.dtype(dtype))
+        # int8 only: emb ~= code * scale
+        self._scales = np.empty((capacity, 1), dtype=np.float32) \
+            if dtype == "int8" else None
+        self._face_ids = np.empty(capacity, dtype=np.int64)
+        self._person_ids = np.empty(capacity, dtype=np.int64)
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        # stored rows as they are (view, no copy), float32 only for dtype float32
+        return self._embs[:self.size]
+
+    @property
+    def face_ids(self) -> np.ndarray:
+        return self._face_ids[:self.size]
+
+    @property
+    def person_ids(self) -> np.ndarray:
+        return self._person_ids[:self.size]
+
+    def get(self, rows=slice(None)) -> np.ndarray:
+        # -> float32 embeddings of `rows`
+        embs = self.embeddings[rows]
+        if self.dtype == "int8":
+            return embs.astype(np.float32) * self._scales[:self.size][rows]
+        return embs.astype(np.float32, copy=False)
+
+    def best(self, queries: np.ndarray, start: int = 0, block: int = 8192,
+             query_block: int = 2048) -> tuple[np.ndarray, np.ndarray]:
+        """
+        -> (highest similarity, its row) per query over rows start..size.
+        One pass over the matrix for all queries, at most
+        query_block x block similarities in memory.
+        """
+        queries = np.atleast_2d(queries)
+        best_sim = np.full(len(queries), -np.inf, dtype=np.float32)
+        best_row = np.full(len(queries), -1, dtype=np.int64)
+
+        for row in range(start, self.size, block):
+            end = min(row + block, self.size)
+            part = self._embs[row:end]
+            if self.dtype != "float32":
+                part = part.astype(np.float32)
+                if self._scales is not None:
+                    part *= self._scales[row:end]
+
+            for q in range(0, len(queries), query_block):
+                sims = queries[q:q + query_block] @ part.T
+                idx = np.argmax(sims, axis=1)
+                val = sims[np.arange(len(idx)), idx]
+                better = val > best_sim[q:q + query_block]
+                best_sim[q:q + query_block][better] = val[better]
+                best_row[q:q + query_block][better] = idx[better] + row
+
+        return best_sim, best_row
+
+    def append(self, embs: np.ndarray, face_ids, person_ids) -> None:
+        # person_ids / face_ids can be one value for all rows
+        embs = np.atleast_2d(embs)
+        n = len(embs)
+        if n == 0:
+            return
+
+        if self.size + n > len(self._embs):
+            self._grow(self.size + n)
+
+        end = self.size + n
+        if self.dtype == "int8":
+            self._embs[self.size:end], self._scales[self.size:end] = quantize_int8(embs)
+        else:
+            self._embs[self.size:end] = embs
+        self._face_ids[self.size:end] = face_ids
+        self._person_ids[self.size:end] = person_ids
+        self.size = end
+
+    def _grow(self, needed: int) -> None:
+        capacity = len(self._embs)
+        while capacity < needed:
+            capacity *= 2
+
+        for name in ("_embs", "_scales", "_face_ids", "_person_ids"):
+            old = getattr(self, name)
+            if old is None:
+                continue
+            new = np.empty((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+
+class PersonStats:
+    """
+    Running embedding sum, face count and a few medoids per person.
+    Centroids (normalized mean) and medoids live in growable matrices, so a
+    cluster can be compared with all P people instead of all N known faces.
+    Medoids are kept diverse: the face closest to the centroid, then the
+    faces least similar to the ones already picked.
+    """
+
+    def __init__(self, dim: int, medoids_per_person: int = 3, capacity: int = 256):
+        self.dim = dim
+        self.k = medoids_per_person
+        capacity = max(1, int(capacity))
+
+        self._person_ids = np.empty(capacity, dtype=np.int64)
+        self._sums = np.zeros((capacity, dim), dtype=np.float32)
+        self._counts = np.zeros(capacity, dtype=np.int64)
+        self._centroids = np.zeros((capacity, dim), dtype=np.float32)
+        # unused medoid slots stay zero -> similarity 0, never a match
+        self._medoids = np.zeros((capacity, self.k, dim), dtype=np.float32)
+        self._rows = {}
+        self.size = 0
+
+        # people whose stats changed since the last save
+        self.dirty = set()
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __contains__(self, person_id) -> bool:
+        return int(person_id) in self._rows
+
+    @property
+    def person_ids(self) -> np.ndarray:
+        return self._person_ids[:self.size]
+
+    @property
+    def centroids(self) -> np.ndarray:
+        return self._centroids[:self.size]
+
+    @property
+    def medoids(self) -> np.ndarray:
+        # (people, k, dim)
+        return self._medoids[:self.size]
+
+    def count(self, person_id) -> int:
+        row = self._rows.get(int(person_id))
+        return 0 if row is None else int(self._counts[row])
+
+    def load_row(self, person_id, sum_bytes, face_count, medoids_bytes) -> None:
+        row = self._row(person_id)
+        self._sums[row] = _from_bytes(sum_bytes)
+        self._counts[row] = face_count
+        self._centroids[row] = _unit(self._sums[row])
+
+        medoids = _from_bytes(medoids_bytes).reshape(-1, self.dim)[:self.k]
+        self._medoids[row] = 0
+        self._medoids[row, :len(medoids)] = medoids
+
+    def set(self, person_id, embedding_sum: np.ndarray, face_count: int,
+            medoid_candidates: np.ndarray) -> None:
+        # totals known already (merge of two people), medoids from candidates
+        row = self._row(person_id)
+        self._sums[row] = embedding_sum
+        self._counts[row] = face_count
+        self._centroids[row] = _unit(self._sums[row])
+
+        picked = self._pick_medoids(np.atleast_2d(
+            medoid_candidates), self._centroids[row])
+        self._medoids[row] = 0
+        self._medoids[row, :len(picked)] = picked
+        self.dirty.add(int(person_id))
+
+    def rebuild(self, person_id, embs: np.ndarray) -> None:
+        row = self._row(person_id)
+        self._sums[row] = 0
+        self._counts[row] = 0
+        self._medoids[row] = 0
+        self.add(person_id, embs)
+
+    def add(self, person_id, embs: np.ndarray) -> None:
+        embs = np.atleast_2d(embs)
+        row = self._row(person_id)
+
+        self._sums[row] += embs.sum(axis=0)
+        self._counts[row] += len(embs)
+        self._centroids[row] = _unit(self._sums[row])
+
+        old = self._medoids[row][np.any(self._medoids[row] != 0, axis=1)]
+        self._medoids[row] = 0
+        picked = self._pick_medoids(
+            np.vstack([old, embs]), self._centroids[row])
+        self._medoids[row, :len(picked)] = picked
+
+        self.dirty.add(int(person_id))
+
+    def rename(self, old_id, new_id) -> None:
+        # temporary id of a new person -> id from the DB
+        row = self._rows.pop(int(old_id))
+        self._rows[int(new_id)] = row
+        self._person_ids[row] = new_id
+        if int(old_id) in self.dirty:
+            self.dirty.discard(int(old_id))
+            self.dirty.add(int(new_id))
+
+    def to_bytes(self, person_id) -> tuple:
+        # -> (avg_embedding, embedding_sum, face_count, medoids) for the DB
+        row = self._rows[int(person_id)]
+        medoids = self._medoids[row][np.any(self._medoids[row] != 0, axis=1)]
+        return (self._centroids[row].tobytes(), self._sums[row].tobytes(),
+                int(self._counts[row]), medoids.tobytes())
+
+    def _pick_medoids(self, candidates: np.ndarray, centroid: np.ndarray) -> np.ndarray:
+        if len(candidates) <= self.k:
+            return candidates
+
+        picked = [int(np.argmax(candidates @ centroid))]
+        max_sim = candidates @ candidates[picked[0]]
+        while len(picked) < self.k:
+            max_sim[picked] = np.inf
+            nxt = int(np.argmin(max_sim))
+            picked.append(nxt)
+            max_sim = np.maximum(max_sim, candidates @ candidates[nxt])
+
+        return candidates[picked]
+
+    def _row(self, person_id) -> int:
+        person_id = int(person_id)
+        row = self._rows.get(person_id)
+        if row is not None:
+            return row
+
+        if self.size == len(self._sums):
+            self._grow()
+        row = self.size
+        self._rows[person_id] = row
+        self._person_ids[row] = person_id
+        self.size += 1
+        return row
+
+    def _grow(self) -> None:
+        capacity = 2 * len(self._sums)
+        for name in ("_person_ids", "_sums", "_counts", "_centroids", "_medoids"):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+
+def _from_bytes(data) -> np.ndarray:
+    if data is None:
+        return np.empty(0, dtype=np.float32)
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    return np.frombuffer(data, dtype=np.float32)
+
+
+def _unit(vector: np.ndarray) -> np.ndarray:
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+class LeaderClustering:
+    """
+    Average-linkage style clustering in bounded memory for large batches.
+    1. Leader pass: faces are streamed in chunks and join the cluster with the
+       highest average similarity (within the threshold) or start a new one.
+    2. Merge pass: clusters whose average pairwise cosine distance is below
+       the threshold are merged, mutual best pairs first, until none is left.
+    Only per-cluster embedding sums are kept: the mean similarity between the
+    members of two clusters is dot(sum_a, sum_b) / (n_a * n_b), the same
+    quantity sklearn's average linkage compares to distance_threshold.
+    Every similarity matrix is computed in blocks of at most memory_budget_mb.
+    """
+
+    def __init__(self, threshold: float = 0.6, memory_budget_mb: int = 512, chunk_size: int = 4096):
+        self.threshold = threshold
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self.chunk_size = chunk_size
+
+    def fit_predict(self, embs: np.ndarray) -> np.ndarray:
+        embs = np.asarray(embs, dtype=np.float32)
+        labels = np.empty(len(embs), dtype=np.int64)
+        min_sim = 1.0 - self.threshold
+
+        # cluster embedding sums, face_ids column = cluster number
+        sums = EmbeddingStore(embs.shape[1], capacity=max(1, len(embs) // 8))
+        # never more clusters than faces
+        all_counts = np.zeros(len(embs), dtype=np.int64)
+
+        for start in range(0, len(embs), self.chunk_size):
+            chunk = embs[start:start + self.chunk_size]
+            chunk_labels = np.full(len(chunk), -1, dtype=np.int64)
+
+            if len(sums):
+                best_sim, best = self._best_average(
+                    chunk, sums.embeddings, all_counts[:len(sums)])
+                matched = best_sim > min_sim
+                chunk_labels[matched] = best[matched]
+
+            # the rest starts new clusters, compared only with the ones made here
+            first_new = len(sums)
+            for i in np.flatnonzero(chunk_labels < 0):
+                new_sums = sums.embeddings[first_new:]
+                if len(new_sums):
+                    sims = (new_sums @ chunk[i]) / all_counts[first_new:len(sums)]
+                    j = int(np.argmax(sims))
+                    if sims[j] > min_sim:
+                        sums.embeddings[first_new + j] += chunk[i]
+                        all_counts[first_new + j] += 1
+                        chunk_labels[i] = first_new + j
+                        continue
+
+                chunk_labels[i] = len(sums)
+                all_counts[len(sums)] = 1
+                sums.append(chunk[i], len(sums), 0)
+
+            # matched faces are added to their clusters after the chunk
+            matched = chunk_labels < first_new
+            np.add.at(sums.embeddings, chunk_labels[matched], chunk[matched])
+            all_counts[:first_new] += np.bincount(
+                chunk_labels[matched], minlength=first_new)
+
+            labels[start:start + len(chunk)] = chunk_labels
+
+        cluster_of = self._merge(sums.embeddings.copy(), all_counts[:len(sums)].copy())
+        _, labels = np.unique(cluster_of[labels], return_inverse=True)
+        return labels
+
+    def _merge(self, sums: np.ndarray, counts: np.ndarray) -> np.ndarray:
+        # -> final cluster of every leader cluster
+        parent = np.arange(len(sums))
+        alive = np.arange(len(sums))
+        min_sim = 1.0 - self.threshold
+
+        while len(alive) > 1:
+            s, c = sums[alive], counts[alive]
+            best_sim, best = self._best_average(s / c[:, None], s, c, exclude_self=True)
+
+            # mutual best pairs within the threshold, like one agglomerative step each
+            rows = np.arange(len(alive))
+            mutual = (best[best] == rows) & (best_sim > min_sim) & (rows < best)
+            if not mutual.any():
+                break
+
+            keep, gone = alive[rows[mutual]], alive[best[mutual]]
+            sums[keep] += sums[gone]
+            counts[keep] += counts[gone]
+            parent[gone] = keep
+            alive = np.setdiff1d(alive, gone, assume_unique=True)
+
+        # follow merges to the surviving cluster
+        while True:
+            grand = parent[parent]
+            if np.array_equal(grand, parent):
+                return parent
+            parent = grand
+
+    def _best_average(self, queries, sums, counts, exclude_self=False):
+        """
+        Highest average similarity of each query row to the clusters given by
+        `sums` / `counts`, computed in blocks that fit the memory budget.
+        """
+        best_sim = np.full(len(queries), -np.inf, dtype=np.float32)
+        best = np.zeros(len(queries), dtype=np.int64)
+        # float32 block + temporaries of the same size
+        block = max(1, self.memory_budget // (3 * 4 * max(1, len(queries))))
+
+        for start in range(0, len(sums), block):
+            sims = queries @ sums[start:start + block].T
+            sims /= counts[start:start + block]
+            if exclude_self:
+                rows = np.arange(start, min(start + block, len(sums)))
+                sims[rows, rows - start] = -np.inf
+
+            idx = np.argmax(sims, axis=1)
+            val = sims[np.arange(len(queries)), idx]
+            better = val > best_sim
+            best_sim[better] = val[better]
+            best[better] = idx[better] + start
+
+        return best_sim, best
+
 
 class FaceClustering:
 
-    def __init__(self, face_repo: Any, person_repo: Any):
+    def __init__(self, face_repo: Any, person_repo: Any, config: Optional[ClusteringConfig] = None):
         self.face_repo = face_repo
         self.person_repo = person_repo
         self.threshold = 0.6
+        self.config = config or ClusteringConfig()
 
     def resolve_identities(self) -> None:
         print("CLUSTERING: Starting robust incremental clustering...")
 
-        unassigned_faces, known_faces = self._load_split_faces()
+        face_ids, person_ids, embs = self._load_faces()
+        unassigned = person_ids < 0
 
-        if not unassigned_faces:
+        if not unassigned.any():
             return
 
-        new_face_ids = [f[0] for f in unassigned_faces]
-        new_embs = np.array([f[1] for f in unassigned_faces])
+        new_face_ids = face_ids[unassigned]
+        new_embs = np.ascontiguousarray(embs[unassigned])
 
         # LOCAL CLUSTERING: Cluster unassigned faces to find groups of similar faces
         cluster_labels = self._run_local_clustering(new_embs)
         unique_clusters = np.unique(cluster_labels)
 
-        known_person_ids = np.array(
-            [f[0] for f in known_faces]) if known_faces else np.array([])
-        known_embs = np.array([f[1] for f in known_faces]
-                              ) if known_faces else np.array([])
+        # Room for every new face up front -> no reallocation during the run
+        known = EmbeddingStore(embs.shape[1], capacity=len(face_ids),
+                               dtype=self.config.matrix_dtype)
+        known.append(embs[~unassigned], face_ids[~unassigned],
+                     person_ids[~unassigned])
+
+        # person_id -> [row indices into known], for stats and exact re-checks
+        person_rows = self._group_by_person(known)
+        stats = self._load_person_stats(known, person_rows)
+        people_mode = self.config.match_mode == "people"
+
+        index = self._load_ann_index(known) \
+            if not people_mode and self._use_ann(len(known)) else None
+        # face_id -> person_id, resolves ANN hits (the index only knows faces)
+        face_person = dict(zip(known.face_ids.tolist(), known.person_ids.tolist())) \
+            if index is not None else None
+
+        # Brute force: every new face against the known faces in one pass,
+        # per cluster only the faces added during this run are left to check
+        brute_base = None
+        if not people_mode and index is None and len(known) > 0:
+            brute_base = (*known.best(new_embs), len(known))
 
         new_people_count = 0
         matched_people_count = 0
 
+        # New people get temporary negative ids, real ones come from one
+        # INSERT at the end -> [(temp_id, name), ...]
+        next_num = self.person_repo.max_default_number() + 1
+        new_people = []
+        assignments = []
+
         # For each local cluster, try to match it to known people or create a new person
         for cluster_id in unique_clusters:
             cluster_indices = np.where(cluster_labels == cluster_id)[0]
@@ -40,63 +464,252 @@ class FaceClustering:
 
             matched_person_id = None
 
-            if len(known_embs) > 0:
-                # Calculate cosine distances between ALL faces in this cluster
-                # and ALL faces in the known db simultaneously.
-                sim_matrix = np.dot(cluster_embs, known_embs.T)
-                distances = 1.0 - sim_matrix
-
-                # Find the closest match
-                min_dist = np.min(distances)
-
-                # If the closest match is within the threshold, consider it a match
-                if min_dist < self.threshold:
-                    best_match_idx = np.unravel_index(
-                        np.argmin(distances, axis=None), distances.shape)[1]
-                    matched_person_id = known_person_ids[best_match_idx]
+            if people_mode:
+                matched_person_id = self._match_people(
+                    stats, known, person_rows, cluster_embs)
+            elif index is not None:
+                matched_person_id = self._match_ann(
+                    index, face_person, cluster_embs)
+            elif len(known) > 0:
+                matched_person_id = self._match_brute(
+                    known, cluster_embs, cluster_indices, brute_base)
 
             if matched_person_id is not None:
                 final_person_id = matched_person_id
                 matched_people_count += 1
             else:
-                existing_people = self.person_repo.get_all_people_data()
-                next_num = len(existing_people) + 1 if existing_people else 1
-                person_name = f"Person{next_num}"
-
-                dummy_bytes = np.zeros(512, dtype=np.float32).tobytes()
-                final_person_id = self.person_repo.create_person(
-                    person_name, dummy_bytes)
+                final_person_id = -(len(new_people) + 1)
+                new_people.append(
+                    (final_person_id, f"Person{next_num + len(new_people)}"))
                 new_people_count += 1
 
             # Update known embeddings with the new cluster's embeddings for future matches
-            for emb in cluster_embs:
-                if len(known_embs) == 0:
-                    known_embs = np.array([emb])
-                    known_person_ids = np.array([final_person_id])
-                else:
-                    known_embs = np.vstack([known_embs, emb])
-                    known_person_ids = np.append(
-                        known_person_ids, final_person_id)
-
-            # Assign person_id in DB to all faces in this cluster
-            for idx in cluster_indices:
-                self.face_repo.update_person_id(
-                    int(new_face_ids[idx]),
-                    int(final_person_id)
-                )
+            person_rows.setdefault(int(final_person_id), []).append(
+                np.arange(len(known), len(known) + len(cluster_embs)))
+            known.append(cluster_embs, new_face_ids[cluster_indices],
+                         final_person_id)
+            stats.add(final_person_id, cluster_embs)
+            if index is not None:
+                index.add(cluster_embs, new_face_ids[cluster_indices])
+                face_person.update(
+                    (int(i), int(final_person_id)) for i in new_face_ids[cluster_indices])
+
+            assignments.extend((int(face_id), int(final_person_id))
+                               for face_id in new_face_ids[cluster_indices])
 
+        # Assign person_id in DB to all faces, one transaction for the whole run
+        if not self._save_results(new_people, assignments, stats):
+            return
+
+        if index is not None:
+            index.save(self._index_path())
+
+        print(f"CLUSTERING: {matched_people_count} clusters matched, "
+              f"{new_people_count} new people")
         print(f"CLUSTERING: Done!")
 
-    def _normalize_l2(self, vector: np.ndarray) -> np.ndarray:
-        norm = np.linalg.norm(vector)
-        if norm == 0:
-            return vector
-        return vector / norm
+    def _match_people(self, stats: PersonStats, known: EmbeddingStore, person_rows: dict,
+                      cluster_embs: np.ndarray) -> Optional[int]:
+        if len(stats) == 0:
+            return None
+
+        # best of centroid and medoids per person, over all faces of the cluster
+        sims = cluster_embs @ stats.centroids.T
+        medoid_sims = (cluster_embs @ stats.medoids.reshape(-1, stats.dim).T).reshape(
+            len(cluster_embs), len(stats), stats.k).max(axis=2)
+        scores = np.maximum(sims, medoid_sims).max(axis=0)
+
+        best = int(np.argmax(scores))
+        min_dist = 1.0 - scores[best]
+        margin = self.config.recheck_margin
+
+        if min_dist < self.threshold - margin:
+            return stats.person_ids[best]
+        if min_dist >= self.threshold + margin:
+            return None
+
+        # Borderline -> same decision as brute force, but only over the faces
+        # of the few closest people
+        matched_person_id = None
+        best_dist = self.threshold
+        for row in np.argsort(-scores)[:self.config.recheck_candidates]:
+            person_id = int(stats.person_ids[row])
+            rows = person_rows.get(person_id)
+            if not rows:
+                continue
+
+            faces = known.get(np.concatenate(rows))
+            dist = 1.0 - np.max(cluster_embs @ faces.T)
+            if dist < best_dist:
+                best_dist = dist
+                matched_person_id = person_id
+
+        return matched_person_id
+
+    def _group_by_person(self, known: EmbeddingStore) -> dict:
+        if len(known) == 0:
+            return {}
+
+        order = np.argsort(known.person_ids, kind="stable")
+        person_ids, starts, counts = np.unique(
+            known.person_ids[order], return_index=True, return_counts=True)
+        return {int(person_id): [order[start:start + count]]
+                for person_id, start, count in zip(person_ids, starts, counts)}
+
+    def _load_person_stats(self, known: EmbeddingStore, person_rows: dict) -> PersonStats:
+        dim = known.embeddings.shape[1]
+        stats = PersonStats(dim, self.config.medoids_per_person,
+                            capacity=len(person_rows) + 256)
+
+        for row in self.person_repo.get_all_stats():
+            if row["id"] in person_rows and row["embedding_sum"] is not None:
+                stats.load_row(row["id"], row["embedding_sum"],
+                               row["face_count"], row["medoids"])
+
+        # people from before the stats existed, or whose faces changed outside
+        # of clustering -> recomputed from their faces
+        for person_id, rows in person_rows.items():
+            if stats.count(person_id) != sum(len(r) for r in rows):
+                stats.rebuild(person_id, known.get(np.concatenate(rows)))
+
+        return stats
+
+    def _save_results(self, new_people: list, assignments: list, stats: PersonStats) -> bool:
+        conn = self.face_repo.conn
+        try:
+            person_ids = self.person_repo.create_people(
+                [(name, stats.to_bytes(temp_id)[0]) for temp_id, name in new_people])
+            real_ids = {temp_id: person_id for (temp_id, _), person_id
+                        in zip(new_people, person_ids)}
+            for temp_id, person_id in real_ids.items():
+                stats.rename(temp_id, person_id)
+
+            self.face_repo.assign_persons(
+                [(face_id, real_ids.get(person_id, person_id)) for face_id, person_id in assignments])
+            self.person_repo.update_stats_many(
+                [(person_id, *stats.to_bytes(person_id)) for person_id in stats.dirty])
+
+            conn.commit()
+            stats.dirty.clear()
+            return True
+        except Exception as e:
+            conn.rollback()
+            print(f"Error -> Saving clustering results failed: {e}")
+            return False
+
+    def _match_brute(self, known: EmbeddingStore, cluster_embs: np.ndarray,
+                     cluster_indices: np.ndarray, brute_base: Optional[tuple]) -> Optional[int]:
+        # Closest known face to ANY face of this cluster, exact
+        start = 0
+        best_sim, best_row = np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+        if brute_base is not None:
+            base_sims, base_rows, start = brute_base
+            best_sim, best_row = base_sims[cluster_indices], base_rows[cluster_indices]
+
+        if len(known) > start:
+            sims, rows = known.best(cluster_embs, start=start)
+            best_sim = np.concatenate([best_sim, sims])
+            best_row = np.concatenate([best_row, rows])
+
+        i = int(np.argmax(best_sim))
+
+        # If the closest match is within the threshold, consider it a match
+        if 1.0 - best_sim[i] < self.threshold:
+            return known.person_ids[best_row[i]]
+        return None
+
+    def _match_ann(self, index: IVFFlatIndex, face_person: dict, cluster_embs: np.ndarray) -> Optional[int]:
+        # top-k per face of the cluster, closest hit that still exists wins
+        sims, face_ids = index.search(cluster_embs, k=self.config.ann_top_k)
+        order = np.argsort(-sims, axis=None)
+
+        for flat in order:
+            sim = sims.flat[flat]
+            if 1.0 - sim >= self.threshold:
+                break
+            person_id = face_person.get(int(face_ids.flat[flat]))
+            # deleted face still in the index
+            if person_id is not None:
+                return person_id
+        return None
+
+    def _use_ann(self, known_count: int) -> bool:
+        matcher = self.config.matcher
+        if matcher == "ann":
+            return known_count > 0
+        if matcher == "auto":
+            return known_count >= self.config.ann_min_faces
+        return False
+
+    def _index_path(self) -> Path:
+        return Path(self.config.ann_index_path or DEFAULT_INDEX_PATH)
+
+    def _load_ann_index(self, known: EmbeddingStore) -> IVFFlatIndex:
+        """
+        Persisted index synced with the DB: known faces missing from it are
+        added, it is rebuilt when too many of its faces are gone, the
+        library outgrew the lists it was trained for, or it was built from
+        another database (db_identity, or sampled vectors that no longer
+        match their face ids).
+        """
+        index = None
+        path = self._index_path()
+        if path.exists():
+            index = IVFFlatIndex.load(path, nprobe=self.config.ann_nprobe)
+
+        if index is not None:
+            indexed = index.all_ids()
+            live = np.isin(indexed, known.face_ids)
+            stale = len(indexed) - int(live.sum())
+
+            if index.centroids.shape[1] != known.embeddings.shape[1] \
+                    or index.identity != self.config.db_identity \
+                    or stale > 0.2 * max(1, len(indexed)) \
+                    or len(known) > 4 * index.trained_size \
+                    or not self._index_matches(index, indexed, live, known):
+                print("CLUSTERING: ANN index is stale or from another database, rebuilding")
+                index = None
+            else:
+                missing = ~np.isin(known.face_ids, indexed)
+                index.add(known.get(missing), known.face_ids[missing])
+                print(f"CLUSTERING: ANN index loaded, {int(missing.sum())} faces added")
+
+        if index is None:
+            print(f"CLUSTERING: Building ANN index over {len(known)} faces...")
+            index = IVFFlatIndex(known.embeddings.shape[1],
+                                 nprobe=self.config.ann_nprobe)
+            index.identity = self.config.db_identity
+            embs = known.get()
+            index.train(embs)
+            index.add(embs, known.face_ids)
+
+        return index
+
+    @staticmethod
+    def _index_matches(index: IVFFlatIndex, indexed: np.ndarray, live: np.ndarray,
+                       known: EmbeddingStore, sample: int = 32) -> bool:
+        # a reused face id points at another face -> its vector differs;
+        # cosine instead of allclose, the store may be float16 / int8
+        rows = np.flatnonzero(live)
+        if len(rows) == 0:
+            return True
+        rows = np.random.default_rng().choice(rows, min(sample, len(rows)), replace=False)
+
+        order = np.argsort(known.face_ids)
+        pos = order[np.searchsorted(known.face_ids, indexed[rows], sorter=order)]
+        sims = np.einsum("ij,ij->i", index.embeddings_at(rows), known.get(pos))
+        return bool(np.all(sims > 0.99))
 
     def _run_local_clustering(self, embeddings_array: np.ndarray) -> np.ndarray:
         if len(embeddings_array) < 2:
             return np.array([0])
 
+        if self._use_leader_clustering(len(embeddings_array)):
+            print(f"CLUSTERING: Leader clustering of {len(embeddings_array)} faces "
+                  f"(budget {self.config.memory_budget_mb} MB)")
+            return LeaderClustering(
+                self.threshold, self.config.memory_budget_mb).fit_predict(embeddings_array)
+
         clustering = AgglomerativeClustering(
             n_clusters=None,
             distance_threshold=self.threshold,
@@ -106,28 +719,41 @@ class FaceClustering:
 
         return clustering.labels_
 
-    def _load_split_faces(self) -> tuple[list[tuple[int, np.ndarray]], list[tuple[int, np.ndarray]]]:
+    def _use_leader_clustering(self, n: int) -> bool:
+        mode = self.config.local_clustering
+        if mode == "leader":
+            return True
+        if mode == "auto":
+            # sklearn keeps a float64 distance matrix + its condensed copy
+            return 12 * n * n > self.config.memory_budget_mb * 1024 * 1024
+        return False
+
+    def _load_faces(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # -> (face_ids, person_ids, L2-normalized embeddings), person_id -1 = unassigned
+        if self.config.embedding_cache:
+            sidecar = EmbeddingSidecar(
+                self.config.embedding_cache_dir or DEFAULT_EMBEDDINGS_DIR,
+                identity=self.config.db_identity)
+            return sidecar.sync(self.face_repo)
+
         rows = self.face_repo.get_all_embeddings()
-        unassigned = []
-        known = []
+        face_ids = []
+        person_ids = []
+        blobs = []
 
         for row in rows:
-            face_id = row['id']
             emb_bytes = row['embedding']
-            person_id = row['person_id']
-
             if not emb_bytes:
                 continue
 
-            if isinstance(emb_bytes, memoryview):
-                emb_bytes = emb_bytes.tobytes()
-
-            emb = np.frombuffer(emb_bytes, dtype=np.float32)
-            emb = self._normalize_l2(emb)
+            face_ids.append(row['id'])
+            person_ids.append(-1 if row['person_id'] is None else row['person_id'])
+            blobs.append(emb_bytes)
 
-            if person_id is None:
-                unassigned.append((face_id, emb))
-            else:
-                known.append((person_id, emb))
+        # float32 / float16 / int8 rows, told apart by their length
+        embs = decode_many(blobs)
+        norms = np.linalg.norm(embs, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
 
-        return unassigned, known
+        return (np.array(face_ids, dtype=np.int64), np.array(person_ids, dtype=np.int64),
+                (embs / norms).astype(np.float32))
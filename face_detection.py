@@ -1,15 +1,33 @@
 from pathlib import Path
+from typing import Optional
 import json
+import threading
+import time
 import cv2
 import numpy as np
 from insightface.app import FaceAnalysis
+from insightface.app.common import Face
+from insightface.model_zoo.scrfd import distance2bbox, distance2kps
+from insightface.utils import face_align
+
+from embedding_codec import encode_embedding
+from repositories.face_batch_writer import FaceBatchWriter
+from structures import FaceQualityConfig
 
 
 class FaceDetection:
 
-    def __init__(self, photo_repo, face_repo):
+    def __init__(self, photo_repo, face_repo, quality: Optional[FaceQualityConfig] = None):
         self.photo_repo = photo_repo
         self.face_repo = face_repo
+        self.face_writer = FaceBatchWriter(face_repo, photo_repo)
+        # max face crops per recognition model call
+        self.recognition_batch_size = 32
+        # stored BYTEA format: "float32" (2 KB), "float16" (1 KB), "int8" (516 B)
+        self.embedding_dtype = "float32"
+        self.quality = quality or FaceQualityConfig()
+        self._stats_lock = threading.Lock()
+        self.reset_quality_stats()
         self._load_models()
 
     def process_photo(self, img_path: Path, photo_id: int) -> None:
@@ -27,21 +45,281 @@ class FaceDetection:
 
         try:
             rgb_image, faces = self._analyze_image(img_path)
+            self.save_results(photo_id, img_path, rgb_image, faces)
+            self.flush()
 
-            if faces:
-                print(f"{img_path.name}: Faces found: {len(faces)}")
-                self._extract_and_save_faces(photo_id, rgb_image, faces)
-            else:
-                print(f"{img_path.name}: No faces found")
+        except Exception as e:
+            print(f"Error -> Image couldn't be analyzed: {img_path.name}: {e}")
+
+    def process_photos(self, photos: list) -> None:
+        """
+        Batch version of process_photo, photos = [(img_path, photo_id), ...].
+        Detection and recognition run once per batch instead of once per image.
+        """
+        todo = []
+        for img_path, photo_id in photos:
+            row = self.photo_repo.get_by_id(photo_id)
+
+            if row is None:
+                print(
+                    f"Error: Photo with ID {photo_id} ({img_path.name}) was not found in DB. Skipping.")
+                continue
+            if row.get("already_analyzed"):
+                print(f"{img_path.name}: Already analyzed, skipping.")
+                continue
 
-            self.photo_repo.mark_analyzed(photo_id)
+            try:
+                todo.append((img_path, photo_id, self.decode_image(img_path)))
+            except Exception as e:
+                print(
+                    f"Error -> Image couldn't be analyzed: {img_path.name}: {e}")
+
+        if not todo:
+            return
+
+        try:
+            all_faces = self.detect_faces_batch([image for _, _, image in todo])
+
+            for (img_path, photo_id, image), faces in zip(todo, all_faces):
+                self.save_results(photo_id, img_path, image, faces)
+            self.flush()
 
         except Exception as e:
-            print(f"Error -> Image couldn't be analyzed: {img_path.name}: {e}")
+            print(f"Error -> Batch couldn't be analyzed: {e}")
+
+    def decode_image(self, img_path: Path, data: Optional[bytes] = None) -> np.ndarray:
+        # data = file bytes that were already read by the metadata stage
+        if data is not None:
+            image = cv2.imdecode(np.frombuffer(
+                data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        else:
+            image = cv2.imread(str(img_path))
+        if image is None:
+            raise ValueError(f"{img_path.name}: Image could not be read")
+        return image
+
+    def detect_faces(self, image: np.ndarray) -> list:
+        # single image through the batch path, so the quality gates apply here too
+        return self.detect_faces_batch([image])[0]
+
+    def detect_faces_reference(self, image: np.ndarray) -> list:
+        # plain FaceAnalysis.get without quality gates, what detect_faces_batch
+        # has to match with the gates off (benchmarks/bench_face_detection.py)
+        return self.face_app.get(image)
+
+    def detect_faces_batch(self, images: list) -> list:
+        """
+        Like FaceAnalysis.get per image, but the images are letterboxed into
+        one detector batch and all face crops go through the recognition model
+        together. Faces failing the quality gates (self.quality) are dropped
+        before recognition; kept faces carry face_size and sharpness.
+        """
+        if not images:
+            return []
+
+        det_model = self.face_app.det_model
+        rec_model = self.face_app.models.get("recognition")
+
+        # 1. DETECTION
+        if self._det_supports_batch:
+            detections = self._detect_batch(det_model, images)
+        else:
+            # fixed batch=1 model, only recognition can be batched
+            detections = [det_model.detect(img, max_num=0, metric='default')
+                          for img in images]
+
+        # 2. FACE OBJECTS (same as FaceAnalysis.get) + QUALITY GATES
+        crop_size = rec_model.input_size[0] if rec_model is not None else 112
+        all_faces = []
+        crops = []
+        skipped = {"small": 0, "score": 0, "blurry": 0}
+        for image, (bboxes, kpss) in zip(images, detections):
+            faces = []
+            for i in range(bboxes.shape[0]):
+                kps = kpss[i] if kpss is not None else None
+                face = Face(bbox=bboxes[i, 0:4], kps=kps,
+                            det_score=bboxes[i, 4])
+
+                reason, crop = self._check_quality(image, face, crop_size)
+                if reason:
+                    skipped[reason] += 1
+                    continue
+
+                faces.append(face)
+                crops.append(crop)
+            all_faces.append(faces)
+
+        # 3. RECOGNITION
+        rec_seconds = 0.0
+        if rec_model is not None and crops:
+            t0 = time.perf_counter()
+            embeddings = []
+            for start in range(0, len(crops), self.recognition_batch_size):
+                embeddings.extend(rec_model.get_feat(
+                    crops[start:start + self.recognition_batch_size]))
+            rec_seconds = time.perf_counter() - t0
+
+            flat_faces = [face for faces in all_faces for face in faces]
+            for face, emb in zip(flat_faces, embeddings):
+                face.embedding = emb.flatten()
+
+        with self._stats_lock:
+            stats = self.quality_stats
+            stats["faces_detected"] += len(crops) + sum(skipped.values())
+            stats["faces_recognized"] += len(crops) if rec_model is not None else 0
+            stats["recognition_seconds"] += rec_seconds
+            for reason, count in skipped.items():
+                stats[f"skipped_{reason}"] += count
+
+        return all_faces
+
+    def _check_quality(self, image: np.ndarray, face, crop_size: int) -> tuple:
+        # -> (reason or None, aligned crop), cheap checks first so most
+        # rejected faces never get aligned
+        x1, y1, x2, y2 = face.bbox
+        face.face_size = int(min(x2 - x1, y2 - y1))
+        if face.face_size < self.quality.min_face_size:
+            return "small", None
+        if face.det_score < self.quality.min_det_score:
+            return "score", None
 
-    def _extract_and_save_faces(self, photo_id: int, rgb_image: np.ndarray, faces: list) -> None:
+        crop = face_align.norm_crop(image, landmark=face.kps, image_size=crop_size)
+        # variance of the Laplacian, low = few edges = blurry / out of focus
+        gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+        face.sharpness = float(cv2.Laplacian(gray, cv2.CV_64F).var())
+        if face.sharpness < self.quality.min_sharpness:
+            return "blurry", None
+
+        return None, crop
+
+    def reset_quality_stats(self) -> None:
+        with self._stats_lock:
+            self.quality_stats = {
+                "faces_detected": 0, "faces_recognized": 0, "recognition_seconds": 0.0,
+                "skipped_small": 0, "skipped_score": 0, "skipped_blurry": 0,
+            }
+
+    def quality_summary(self) -> str:
+        with self._stats_lock:
+            stats = dict(self.quality_stats)
+
+        skipped = stats["skipped_small"] + stats["skipped_score"] + stats["skipped_blurry"]
+        # time saved = skipped crops at the measured recognition cost per crop
+        per_face = stats["recognition_seconds"] / stats["faces_recognized"] \
+            if stats["faces_recognized"] else 0.0
+        return (f"{stats['faces_detected']} faces detected, {skipped} skipped "
+                f"(small={stats['skipped_small']}, low score={stats['skipped_score']}, "
+                f"blurry={stats['skipped_blurry']}), "
+                f"~{skipped * per_face:.1f}s recognition saved")
+
+    def _detect_batch(self, det_model, images: list) -> list:
+        # Letterbox exactly like SCRFD.detect
+        input_size = det_model.input_size
+        det_imgs = []
+        det_scales = []
+
+        for img in images:
+            im_ratio = float(img.shape[0]) / img.shape[1]
+            model_ratio = float(input_size[1]) / input_size[0]
+            if im_ratio > model_ratio:
+                new_height = input_size[1]
+                new_width = int(new_height / im_ratio)
+            else:
+                new_width = input_size[0]
+                new_height = int(new_width * im_ratio)
+
+            det_img = np.zeros((input_size[1], input_size[0], 3), dtype=np.uint8)
+            det_img[:new_height, :new_width, :] = cv2.resize(
+                img, (new_width, new_height))
+
+            det_imgs.append(det_img)
+            det_scales.append(float(new_height) / img.shape[0])
+
+        blob = cv2.dnn.blobFromImages(
+            det_imgs, 1.0 / det_model.input_std, tuple(input_size),
+            (det_model.input_mean, det_model.input_mean, det_model.input_mean), swapRB=True)
+        net_outs = det_model.session.run(
+            det_model.output_names, {det_model.input_name: blob})
+
+        return [
+            self._decode_detections(
+                det_model, [out[b] for out in net_outs], det_scales[b], blob.shape[2:4])
+            for b in range(len(images))
+        ]
+
+    def _decode_detections(self, det_model, outs: list, det_scale: float, blob_hw) -> tuple:
+        # Post processing of one image, mirrors SCRFD.forward + SCRFD.detect (max_num=0)
+        input_height, input_width = blob_hw
+        fmc = det_model.fmc
+        scores_list, bboxes_list, kpss_list = [], [], []
+
+        for idx, stride in enumerate(det_model._feat_stride_fpn):
+            scores = outs[idx]
+            bbox_preds = outs[idx + fmc] * stride
+
+            height = input_height // stride
+            width = input_width // stride
+            key = (height, width, stride)
+            anchor_centers = det_model.center_cache.get(key)
+            if anchor_centers is None:
+                anchor_centers = np.stack(
+                    np.mgrid[:height, :width][::-1], axis=-1).astype(np.float32)
+                anchor_centers = (anchor_centers * stride).reshape((-1, 2))
+                if det_model._num_anchors > 1:
+                    anchor_centers = np.stack(
+                        [anchor_centers] * det_model._num_anchors, axis=1).reshape((-1, 2))
+                if len(det_model.center_cache) < 100:
+                    det_model.center_cache[key] = anchor_centers
+
+            pos_inds = np.where(scores >= det_model.det_thresh)[0]
+            bboxes = distance2bbox(anchor_centers, bbox_preds)
+            scores_list.append(scores[pos_inds])
+            bboxes_list.append(bboxes[pos_inds])
+
+            if det_model.use_kps:
+                kps_preds = outs[idx + fmc * 2] * stride
+                kpss = distance2kps(anchor_centers, kps_preds)
+                kpss = kpss.reshape((kpss.shape[0], -1, 2))
+                kpss_list.append(kpss[pos_inds])
+
+        scores = np.vstack(scores_list)
+        order = scores.ravel().argsort()[::-1]
+        bboxes = np.vstack(bboxes_list) / det_scale
+
+        pre_det = np.hstack((bboxes, scores)).astype(np.float32, copy=False)
+        pre_det = pre_det[order, :]
+        keep = det_model.nms(pre_det)
+        det = pre_det[keep, :]
+
+        kpss = None
+        if det_model.use_kps:
+            kpss = np.vstack(kpss_list) / det_scale
+            kpss = kpss[order, :, :]
+            kpss = kpss[keep, :, :]
+
+        return det, kpss
+
+    def save_results(self, photo_id: int, img_path: Path, image: np.ndarray, faces: list) -> None:
+        # Buffered, written together with the already_analyzed flag
+        face_rows = []
+        if faces:
+            print(f"{img_path.name}: Faces found: {len(faces)}")
+            face_rows = self._extract_faces(photo_id, image, faces)
+        else:
+            print(f"{img_path.name}: No faces found")
+
+        self.face_writer.add_photo(photo_id, face_rows)
+
+    def flush(self) -> None:
+        self.face_writer.flush()
+
+    def flush_if_due(self) -> None:
+        self.face_writer.flush_if_due()
+
+    def _extract_faces(self, photo_id: int, rgb_image: np.ndarray, faces: list) -> list:
 
         img_h, img_w, _ = rgb_image.shape
+        face_rows = []
 
         for face in faces:
             x1, y1, x2, y2 = face.bbox.astype(int)
@@ -58,16 +336,18 @@ class FaceDetection:
                 continue
             face_encoding = face.normed_embedding
 
-            self.face_repo.add(photo_id, face_encoding.tobytes(), face_coords)
+            face_rows.append(
+                (photo_id, encode_embedding(face_encoding, self.embedding_dtype), face_coords, None,
+                 float(face.det_score), face.get("face_size"), face.get("sharpness")))
+
+        return face_rows
 
     def _analyze_image(self, img_path: Path):
-        image = cv2.imread(str(img_path))
-        if image is None:
-            raise ValueError("Image could not be read")
+        image = self.decode_image(img_path)
 
         rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
 
-        faces = self.face_app.get(image)
+        faces = self.detect_faces(image)
 
         print(f"{img_path.name}: Detected faces = {len(faces)}")
 
@@ -77,3 +357,9 @@ class FaceDetection:
         self.face_app = FaceAnalysis(
             name='buffalo_s', allowed_modules=['detection', 'recognition'])
         self.face_app.prepare(ctx_id=-1, det_size=(640, 640))
+
+        # Batched detection needs a model exported with a free batch dimension
+        det_model = self.face_app.det_model
+        batch_dim = det_model.session.get_inputs()[0].shape[0]
+        self._det_supports_batch = det_model.batched and not isinstance(
+            batch_dim, int)
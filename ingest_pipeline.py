@@ -0,0 +1,275 @@
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+import fnmatch
+import os
+import queue
+import threading
+import time
+
+from metadata_handle import PhotoFile
+
+# Marks the end of the input of a stage
+_STOP = object()
+
+
+class PipelineStage:
+    """
+    One step of the ingest pipeline.
+    Items wait in a bounded queue in front of the stage and are handled by
+    `workers` threads. With use_processes=True every worker thread hands its
+    item to a process pool, so CPU bound steps run outside of the GIL.
+    `fn` returns the item for the next stage or None to drop it.
+    With batch_size > 1 `fn` gets a list of up to batch_size items (waiting
+    at most batch_wait seconds for a batch to fill) and returns a list of
+    results in the same order.
+    `on_idle()` is called every idle_every seconds while a worker waits for
+    its next item, e.g. to write out buffered results of a stalled pipeline.
+    """
+
+    def __init__(self, name, fn, workers=1, queue_size=32, use_processes=False,
+                 batch_size=1, batch_wait=0.05, on_idle=None, idle_every=0.5):
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, int(workers))
+        self.queue_size = max(1, int(queue_size))
+        self.use_processes = use_processes
+        self.batch_size = max(1, int(batch_size))
+        self.batch_wait = batch_wait
+        self.on_idle = on_idle
+        self.idle_every = idle_every
+
+
+class StagedPipeline:
+    """
+    Runs items through a list of PipelineStages connected by bounded queues.
+    Discovery is the iterable given to run(). It is walked on its own thread
+    into an unbounded queue (paths are cheap), so the walk finishes early
+    instead of being throttled by the slowest stage.
+    on_item_done(done_count) is called every time an item leaves the
+    pipeline (finished, dropped or failed).
+    """
+
+    def __init__(self, stages, on_item_done=None):
+        self.stages = stages
+        self.on_item_done = on_item_done
+
+        self._done = 0
+        self._done_lock = threading.Lock()
+
+    def run(self, items) -> int:
+        queues = [queue.Queue(maxsize=stage.queue_size)
+                  for stage in self.stages]
+        executors = [
+            ProcessPoolExecutor(max_workers=stage.workers)
+            if stage.use_processes else None
+            for stage in self.stages
+        ]
+        threads = []
+
+        try:
+            for i, stage in enumerate(self.stages):
+                out_q = queues[i + 1] if i + 1 < len(queues) else None
+                alive = [stage.workers]
+                alive_lock = threading.Lock()
+
+                for n in range(stage.workers):
+                    t = threading.Thread(
+                        target=self._work,
+                        args=(stage, executors[i], queues[i],
+                              out_q, alive, alive_lock),
+                        name=f"ingest-{stage.name}-{n}",
+                        daemon=True
+                    )
+                    t.start()
+                    threads.append(t)
+
+            # DISCOVERY
+            discovered = queue.Queue()
+            walker = threading.Thread(
+                target=self._discover, args=(items, discovered),
+                name="ingest-discovery", daemon=True)
+            walker.start()
+
+            while True:
+                item = discovered.get()
+                if item is _STOP:
+                    break
+                queues[0].put(item)
+            queues[0].put(_STOP)
+
+            for t in threads:
+                t.join()
+        finally:
+            for executor in executors:
+                if executor is not None:
+                    executor.shutdown()
+
+        return self._done
+
+    def _discover(self, items, out_q):
+        try:
+            for item in items:
+                out_q.put(item)
+        except Exception as e:
+            print(f"Error -> Discovery failed: {e}")
+        finally:
+            out_q.put(_STOP)
+
+    def _work(self, stage, executor, in_q, out_q, alive, alive_lock):
+        stopped = False
+
+        while not stopped:
+            batch, stopped = self._next_batch(stage, in_q)
+
+            if batch:
+                try:
+                    if stage.batch_size > 1:
+                        results = self._call(stage, executor, batch)
+                    else:
+                        results = [self._call(stage, executor, batch[0])]
+                except Exception as e:
+                    print(f"Error -> Stage '{stage.name}' failed: {e}")
+                    results = [None] * len(batch)
+
+                for result in results:
+                    if result is None or out_q is None:
+                        self._item_done()
+                    else:
+                        out_q.put(result)
+
+        # Last worker out closes the next stage
+        with alive_lock:
+            alive[0] -= 1
+            last = alive[0] == 0
+
+        if last and out_q is not None:
+            out_q.put(_STOP)
+
+    def _next_batch(self, stage, in_q):
+        batch = []
+        deadline = None
+
+        while len(batch) < stage.batch_size:
+            if not batch:
+                item = self._wait_item(stage, in_q)
+            else:
+                if deadline is None:
+                    deadline = time.monotonic() + stage.batch_wait
+                remaining = deadline - time.monotonic()
+                try:
+                    item = in_q.get(timeout=max(0.0, remaining))
+                except queue.Empty:
+                    break
+
+            if item is _STOP:
+                # let the other workers of this stage see it too
+                in_q.put(_STOP)
+                return batch, True
+
+            batch.append(item)
+
+        return batch, False
+
+    def _wait_item(self, stage, in_q):
+        if stage.on_idle is None:
+            return in_q.get()
+
+        while True:
+            try:
+                return in_q.get(timeout=stage.idle_every)
+            except queue.Empty:
+                try:
+                    stage.on_idle()
+                except Exception as e:
+                    print(f"Error -> Stage '{stage.name}' idle step failed: {e}")
+
+    def _call(self, stage, executor, arg):
+        if executor is not None:
+            return executor.submit(stage.fn, arg).result()
+        return stage.fn(arg)
+
+    def _item_done(self):
+        with self._done_lock:
+            self._done += 1
+            done = self._done
+
+        if self.on_item_done:
+            self.on_item_done(done)
+
+
+class FolderDiscovery:
+    """
+    Streams image files under `root` straight into the pipeline.
+    Uses os.scandir, so file/dir checks come from the directory listing
+    without an extra stat per entry. Entries whose name matches one of
+    `ignore_patterns` are skipped (directories with everything below them).
+    `count` grows while iterating, `finished` is set once the walk is done.
+    """
+
+    def __init__(self, root, extensions, ignore_patterns=(), on_progress=None, progress_every=500):
+        self.root = Path(root)
+        self.extensions = {ext.lower() for ext in extensions}
+        self.ignore_patterns = tuple(ignore_patterns)
+        # on_progress(count) while the walk is still running
+        self.on_progress = on_progress
+        self.progress_every = progress_every
+
+        self.count = 0
+        self.finished = False
+        self.seen_paths = set()
+
+    def __iter__(self):
+        stack = [self.root]
+
+        while stack:
+            folder = stack.pop()
+            try:
+                with os.scandir(folder) as entries:
+                    for entry in entries:
+                        if self._ignored(entry.name):
+                            continue
+
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file() and os.path.splitext(entry.name)[1].lower() in self.extensions:
+                            self.count += 1
+                            self.seen_paths.add(entry.path)
+
+                            if self.on_progress and self.count % self.progress_every == 0:
+                                self.on_progress(self.count)
+
+                            # entry.stat() is free on Windows (cached from the listing)
+                            yield {"path": Path(entry.path), "entry": entry}
+            except OSError as e:
+                print(f"Error -> Cannot list {folder}: {e}")
+
+        self.finished = True
+
+    def _ignored(self, name):
+        return any(fnmatch.fnmatch(name, pattern) for pattern in self.ignore_patterns)
+
+
+def read_photo_info(item: dict, keep_data: bool = True) -> dict:
+    """
+    Hash + metadata of one file. Runs inside the process pool, so it has to
+    stay a module level function and must not touch the DB.
+    The file is read once; its bytes travel on with the item so the decode
+    stage does not have to go back to the disk (keep_data=False when
+    nothing is going to be decoded).
+    """
+    photo = PhotoFile(item["path"])
+    width, height = photo.get_size()
+
+    return {
+        **item,
+        "filename": photo.path.name,
+        "hash": photo.get_hash(),
+        "time_data": photo.get_date(),
+        "width": width,
+        "height": height,
+        "orientation": photo.get_orientation(),
+        "coords": photo.get_coordinates(),
+        "phash": photo.get_dhash(),
+        "data": photo.data if keep_data else None,
+        "bytes_read": photo.bytes_read,
+    }
@@ -1,31 +1,46 @@
 from datetime import datetime
+import hashlib
 import os
-from PIL import Image
+from PIL import Image, ImageOps
 import exifread
 from geopy.geocoders import Nominatim
-from typing import Optional, Tuple
+from pathlib import Path
+from typing import BinaryIO, Optional, Tuple, Union
+import io
 
 import re
 
+from structures import ExifRecord
+
 geolocator = Nominatim(user_agent="photo_sorter")
+# names come back in this language (Czech), the offline geocoder uses English
+NOMINATIM_LANGUAGE = "cs"
+
+# Local reverse geocoder (reverse_geocoding.OfflineGeocoder), replaces Nominatim when set
+offline_geocoder = None
 
 
 class PhotoMetadata:
 
     @staticmethod
-    def get_date(img_path: str) -> Optional[str]:
+    def get_date(img_path: str, tags: Optional[dict] = None) -> Optional[str]:
         # EXIF
         try:
-            with open(img_path, 'rb') as f:
-                tags = exifread.process_file(
-                    f, stop_tag="EXIF DateTimeOriginal", details=False)
-                date_tag = tags.get("EXIF DateTimeOriginal")
+            if tags is None:
+                with open(img_path, 'rb') as f:
+                    tags = exifread.process_file(
+                        f, stop_tag="EXIF DateTimeOriginal", details=False)
+            date_tag = tags.get("EXIF DateTimeOriginal")
 
-                if date_tag:
-                    return str(date_tag).replace(":", "-", 2)
+            if date_tag:
+                return str(date_tag).replace(":", "-", 2)
         except Exception:
             pass
 
+        return PhotoMetadata.get_fallback_date(img_path)
+
+    @staticmethod
+    def get_fallback_date(img_path: str) -> Optional[str]:
         # 2. REGEX
         filename = os.path.basename(img_path)
         date_pattern = re.search(
@@ -45,8 +60,18 @@ class PhotoMetadata:
 
     @staticmethod
     def get_location(img_path: str) -> Optional[str]:
-        with open(img_path, 'rb') as f:
-            tags = exifread.process_file(f, details=False)
+        coords = PhotoMetadata.get_coordinates(img_path)
+
+        if coords is None:
+            return None, None
+
+        return PhotoMetadata.reverse_geocode(*coords)
+
+    @staticmethod
+    def get_coordinates(img_path: str, tags: Optional[dict] = None) -> Optional[Tuple[float, float]]:
+        if tags is None:
+            with open(img_path, 'rb') as f:
+                tags = exifread.process_file(f, details=False)
 
         gps_lat = tags.get("GPS GPSLatitude")
         gps_lat_ref = tags.get("GPS GPSLatitudeRef")
@@ -54,7 +79,7 @@ class PhotoMetadata:
         gps_lon_ref = tags.get("GPS GPSLongitudeRef")
 
         if not (gps_lat and gps_lat_ref and gps_lon and gps_lon_ref):
-            return None, None
+            return None
 
         def convert_to_degrees(value):
             d, m, s = [float(x.num)/float(x.den) for x in value.values]
@@ -67,8 +92,15 @@ class PhotoMetadata:
         if gps_lon_ref.values[0] != 'E':
             lon = -lon
 
+        return lat, lon
+
+    @staticmethod
+    def reverse_geocode(lat: float, lon: float) -> Optional[Tuple[Optional[str], Optional[str]]]:
+        if offline_geocoder is not None:
+            return offline_geocoder.reverse(lat, lon)
+
         try:
-            location = geolocator.reverse((lat, lon), language="cs")
+            location = geolocator.reverse((lat, lon), language=NOMINATIM_LANGUAGE)
             if location and location.raw.get("address"):
                 city = location.raw["address"].get("city") or \
                     location.raw["address"].get("town") or \
@@ -82,9 +114,323 @@ class PhotoMetadata:
             return print("Couldnt detect location data, No Internet! (Try again when connected to Internet)")
 
     @staticmethod
-    def get_size(img_path: str) -> Tuple[Optional[int], Optional[int]]:
+    def set_offline_geocoder(geocoder) -> None:
+        global offline_geocoder
+        offline_geocoder = geocoder
+
+    @staticmethod
+    def geocoder_id() -> str:
+        # which resolver reverse_geocode uses, the two name places differently
+        if offline_geocoder is not None:
+            return "offline"
+        return f"nominatim-{NOMINATIM_LANGUAGE}"
+
+    @staticmethod
+    def read_record(data: bytes) -> ExifRecord:
+        """
+        Date, GPS, orientation, width and height from the raw file bytes in
+        one pass. Only the file header is touched (JPEG/PNG/WEBP).
+        Fields that are not present stay None.
+        """
+        record = ExifRecord()
+
         try:
+            if data[:2] == b"\xff\xd8":
+                _read_jpeg(data, record)
+            elif data[:8] == b"\x89PNG\r\n\x1a\n":
+                _read_png(data, record)
+            elif data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+                _read_webp(data, record)
+        except Exception:
+            # broken header -> whatever was read so far
+            pass
+
+        return record
+
+    @staticmethod
+    def get_dhash(img_path: Union[str, BinaryIO]) -> Optional[int]:
+        """
+        64 bit difference hash: brightness gradient of a 9x8 grayscale
+        thumbnail. Survives resizing and recompression, so near-identical
+        copies end up a few bits apart.
+        """
+        try:
+            with Image.open(img_path) as img:
+                # JPEG: let libjpeg decode at 1/8 scale, we only need 9x8 pixels
+                img.draft("L", (64, 64))
+                img = ImageOps.exif_transpose(img)
+                small = img.convert("L").resize((9, 8), Image.BILINEAR)
+        except Exception:
+            return None
+
+        pixels = list(small.getdata())
+        value = 0
+        for row in range(8):
+            for col in range(8):
+                left = pixels[row * 9 + col]
+                right = pixels[row * 9 + col + 1]
+                value = (value << 1) | (left > right)
+        return value
+
+    @staticmethod
+    def get_hash(img_path: str) -> str:
+        BUF_SIZE = 65536  # 64KB
+        sha256 = hashlib.sha256()
+        with open(img_path, "rb") as f:
+            while chunk := f.read(BUF_SIZE):
+                sha256.update(chunk)
+        return sha256.hexdigest()
+
+    @staticmethod
+    def get_size(img_path: Union[str, BinaryIO]) -> Tuple[Optional[int], Optional[int]]:
+        try:
+            # only reads the header, pixels are not decoded
             with Image.open(img_path) as img:
                 return img.width, img.height
         except:
             return None, None
+
+
+class PhotoFile:
+    """
+    Raw bytes of one image, read from disk exactly once.
+    Hash, EXIF, dimensions and the pixel decode all work on this buffer
+    instead of reopening the file.
+    """
+
+    def __init__(self, img_path):
+        self.path = Path(img_path)
+
+        with open(self.path, "rb") as f:
+            self.data = f.read()
+
+        # IO counter, how many bytes this photo cost us
+        self.bytes_read = len(self.data)
+        self._record = None
+
+    def stream(self) -> io.BytesIO:
+        return io.BytesIO(self.data)
+
+    def get_hash(self) -> str:
+        return hashlib.sha256(self.data).hexdigest()
+
+    def get_record(self) -> ExifRecord:
+        # One pass over the header serves date, GPS, orientation and size
+        if self._record is None:
+            self._record = PhotoMetadata.read_record(self.data)
+            if self._record.width is None:
+                self._record.width, self._record.height = PhotoMetadata.get_size(
+                    self.stream())
+        return self._record
+
+    def get_dhash(self) -> Optional[int]:
+        return PhotoMetadata.get_dhash(self.stream())
+
+    def get_date(self) -> Optional[str]:
+        return self.get_record().date or PhotoMetadata.get_fallback_date(self.path)
+
+    def get_coordinates(self) -> Optional[Tuple[float, float]]:
+        record = self.get_record()
+        if record.latitude is None or record.longitude is None:
+            return None
+        return record.latitude, record.longitude
+
+    def get_size(self) -> Tuple[Optional[int], Optional[int]]:
+        record = self.get_record()
+        return record.width, record.height
+
+    def get_orientation(self) -> int:
+        # EXIF orientation, 1 = stored upright (also when the tag is missing)
+        return self.get_record().orientation or 1
+
+
+# =========================================================================
+#  FAST HEADER PARSER (PhotoMetadata.read_record)
+#  Jumps straight to the IFDs it needs instead of decoding every tag.
+# =========================================================================
+
+# TIFF tags
+_TAG_ORIENTATION = 0x0112
+_TAG_EXIF_IFD = 0x8769
+_TAG_GPS_IFD = 0x8825
+_TAG_DATE_ORIGINAL = 0x9003
+_TAG_GPS_LAT_REF = 0x0001
+_TAG_GPS_LAT = 0x0002
+_TAG_GPS_LON_REF = 0x0003
+_TAG_GPS_LON = 0x0004
+
+# TIFF type -> size of one value in bytes
+_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 7: 1, 9: 4, 10: 8}
+
+# JPEG start-of-frame markers (not DHT, JPG and DAC)
+_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def _read_jpeg(data: bytes, record: ExifRecord) -> None:
+    i = 2
+    size = len(data)
+    exif_done = False
+
+    while i + 4 <= size:
+        if data[i] != 0xFF:
+            return
+        marker = data[i + 1]
+
+        # padding and markers without a length
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            i += 2
+            continue
+        # start of scan / end of image, header is over
+        if marker in (0xDA, 0xD9):
+            return
+
+        seg_len = int.from_bytes(data[i + 2:i + 4], "big")
+        seg_start = i + 4
+
+        if marker == 0xE1 and not exif_done and data[seg_start:seg_start + 6] == b"Exif\x00\x00":
+            _read_tiff(data[seg_start + 6:i + 2 + seg_len], record)
+            exif_done = True
+        elif marker in _SOF_MARKERS:
+            record.height = int.from_bytes(
+                data[seg_start + 1:seg_start + 3], "big")
+            record.width = int.from_bytes(
+                data[seg_start + 3:seg_start + 5], "big")
+            return
+
+        i += 2 + seg_len
+
+
+def _read_png(data: bytes, record: ExifRecord) -> None:
+    i = 8
+    size = len(data)
+
+    while i + 8 <= size:
+        chunk_len = int.from_bytes(data[i:i + 4], "big")
+        chunk_type = data[i + 4:i + 8]
+        start = i + 8
+
+        if chunk_type == b"IHDR":
+            record.width = int.from_bytes(data[start:start + 4], "big")
+            record.height = int.from_bytes(data[start + 4:start + 8], "big")
+        elif chunk_type == b"eXIf":
+            _read_tiff(data[start:start + chunk_len], record)
+        elif chunk_type == b"IEND":
+            return
+
+        # length + type + data + CRC
+        i = start + chunk_len + 4
+
+
+def _read_webp(data: bytes, record: ExifRecord) -> None:
+    i = 12
+    size = len(data)
+
+    while i + 8 <= size:
+        chunk_type = data[i:i + 4]
+        chunk_len = int.from_bytes(data[i + 4:i + 8], "little")
+        start = i + 8
+        chunk = data[start:start + chunk_len]
+
+        if chunk_type == b"VP8X" and len(chunk) >= 10:
+            record.width = int.from_bytes(chunk[4:7], "little") + 1
+            record.height = int.from_bytes(chunk[7:10], "little") + 1
+        elif chunk_type == b"VP8 " and len(chunk) >= 10 and record.width is None:
+            record.width = int.from_bytes(chunk[6:8], "little") & 0x3FFF
+            record.height = int.from_bytes(chunk[8:10], "little") & 0x3FFF
+        elif chunk_type == b"VP8L" and len(chunk) >= 5 and record.width is None:
+            bits = int.from_bytes(chunk[1:5], "little")
+            record.width = (bits & 0x3FFF) + 1
+            record.height = ((bits >> 14) & 0x3FFF) + 1
+        elif chunk_type == b"EXIF":
+            if chunk.startswith(b"Exif\x00\x00"):
+                chunk = chunk[6:]
+            _read_tiff(chunk, record)
+
+        # chunks are padded to an even size
+        i = start + chunk_len + (chunk_len & 1)
+
+
+def _read_tiff(tiff: bytes, record: ExifRecord) -> None:
+    if len(tiff) < 8:
+        return
+
+    if tiff[:2] == b"II":
+        endian = "little"
+    elif tiff[:2] == b"MM":
+        endian = "big"
+    else:
+        return
+
+    def u16(pos):
+        return int.from_bytes(tiff[pos:pos + 2], endian)
+
+    def u32(pos):
+        return int.from_bytes(tiff[pos:pos + 4], endian)
+
+    def read_ifd(offset, wanted):
+        # tag -> (type, count, position of the value)
+        found = {}
+        if offset <= 0 or offset + 2 > len(tiff):
+            return found
+
+        for n in range(u16(offset)):
+            entry = offset + 2 + n * 12
+            if entry + 12 > len(tiff):
+                break
+            tag = u16(entry)
+            if tag in wanted:
+                value_type, count = u16(entry + 2), u32(entry + 4)
+                value_size = _TYPE_SIZES.get(value_type, 1) * count
+                value_pos = entry + 8 if value_size <= 4 else u32(entry + 8)
+                found[tag] = (value_type, count, value_pos)
+        return found
+
+    def read_ascii(entry):
+        _, count, pos = entry
+        return tiff[pos:pos + count].split(b"\x00", 1)[0].decode("ascii", "ignore").strip()
+
+    def read_degrees(entry):
+        value_type, count, pos = entry
+        if value_type != 5 or count < 3:
+            return None
+        parts = []
+        for k in range(3):
+            num, den = u32(pos + k * 8), u32(pos + k * 8 + 4)
+            if den == 0:
+                return None
+            parts.append(num / den)
+        d, m, s = parts
+        return d + m/60 + s/3600
+
+    if u16(2) != 42:
+        return
+
+    ifd0 = read_ifd(u32(4), {_TAG_ORIENTATION, _TAG_EXIF_IFD, _TAG_GPS_IFD})
+
+    if _TAG_ORIENTATION in ifd0:
+        record.orientation = u16(ifd0[_TAG_ORIENTATION][2])
+
+    if _TAG_EXIF_IFD in ifd0:
+        exif_ifd = read_ifd(u32(ifd0[_TAG_EXIF_IFD][2]), {_TAG_DATE_ORIGINAL})
+        if _TAG_DATE_ORIGINAL in exif_ifd:
+            date = read_ascii(exif_ifd[_TAG_DATE_ORIGINAL])
+            if date:
+                record.date = date.replace(":", "-", 2)
+
+    if _TAG_GPS_IFD in ifd0:
+        gps = read_ifd(u32(ifd0[_TAG_GPS_IFD][2]), {
+                       _TAG_GPS_LAT_REF, _TAG_GPS_LAT, _TAG_GPS_LON_REF, _TAG_GPS_LON})
+
+        if len(gps) == 4:
+            lat = read_degrees(gps[_TAG_GPS_LAT])
+            lon = read_degrees(gps[_TAG_GPS_LON])
+
+            if lat is not None and lon is not None:
+                if read_ascii(gps[_TAG_GPS_LAT_REF])[:1] != "N":
+                    lat = -lat
+                if read_ascii(gps[_TAG_GPS_LON_REF])[:1] != "E":
+                    lon = -lon
+                record.latitude, record.longitude = lat, lon
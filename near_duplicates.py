@@ -0,0 +1,110 @@
+from typing import Iterable, List, Optional, Tuple
+
+# set (or cleared) bits below this -> the dHash of a (near) uniform image,
+# unrelated flat or dark shots all hash to about 0
+MIN_HASH_BITS = 8
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def to_signed64(value: int) -> int:
+    # Postgres BIGINT is signed, hashes are unsigned 64 bit
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def to_unsigned64(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+
+def is_degenerate(value: int) -> bool:
+    bits = value.bit_count()
+    return bits < MIN_HASH_BITS or bits > 64 - MIN_HASH_BITS
+
+
+class MultiIndexHash:
+    """
+    Multi-index hashing over 64 bit hashes for Hamming radius queries.
+    The hash is split into radius + 1 chunks. Two hashes at most `radius`
+    bits apart must agree exactly on at least one chunk (pigeonhole), so a
+    query only verifies the entries sharing one of its chunks instead of
+    scanning everything.
+    """
+
+    def __init__(self, radius: int):
+        self.radius = radius
+        n_chunks = radius + 1
+        # chunk bit widths, e.g. radius 4 -> 13,13,13,13,12
+        widths = [64 // n_chunks + (1 if i < 64 % n_chunks else 0)
+                  for i in range(n_chunks)]
+        self._chunks = []
+        shift = 0
+        for width in widths:
+            self._chunks.append((shift, (1 << width) - 1))
+            shift += width
+
+        self._tables = [{} for _ in self._chunks]
+        self._values = []
+        self._payloads = []
+
+    def add(self, value: int, payload) -> None:
+        idx = len(self._values)
+        self._values.append(value)
+        self._payloads.append(payload)
+
+        for table, (shift, mask) in zip(self._tables, self._chunks):
+            table.setdefault((value >> shift) & mask, []).append(idx)
+
+    def query(self, value: int, radius: Optional[int] = None) -> List[Tuple[int, object]]:
+        # -> [(distance, payload), ...] sorted by distance
+        radius = self.radius if radius is None else min(radius, self.radius)
+        seen = set()
+        found = []
+
+        for table, (shift, mask) in zip(self._tables, self._chunks):
+            for idx in table.get((value >> shift) & mask, ()):
+                if idx in seen:
+                    continue
+                seen.add(idx)
+
+                dist = hamming(value, self._values[idx])
+                if dist <= radius:
+                    found.append((dist, self._payloads[idx]))
+
+        found.sort(key=lambda x: x[0])
+        return found
+
+    def __len__(self):
+        return len(self._values)
+
+
+class NearDuplicateIndex:
+    """
+    Perceptual hash (dHash) -> photo ids. Finds resized, recompressed or
+    forwarded copies of a photo that exact SHA-256 dedupe misses.
+    """
+
+    def __init__(self, radius: int = 4):
+        # max differing bits out of 64 that still count as the same shot
+        self.radius = radius
+        self._index = MultiIndexHash(radius)
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[dict], radius: int = 4) -> "NearDuplicateIndex":
+        index = cls(radius)
+        for row in rows:
+            if row["phash"] is not None:
+                index.add(to_unsigned64(row["phash"]), row["id"])
+        return index
+
+    def add(self, phash: int, photo_id: int) -> None:
+        self._index.add(phash, photo_id)
+
+    def find(self, phash: int, exclude_id: Optional[int] = None) -> List[Tuple[int, int]]:
+        # -> [(distance, photo_id), ...], closest first
+        return [(dist, photo_id) for dist, photo_id in self._index.query(phash)
+                if photo_id != exclude_id]
+
+    def __len__(self):
+        return len(self._index)
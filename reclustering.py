@@ -0,0 +1,343 @@
+from typing import Callable, Optional
+import json
+import re
+import threading
+import time
+
+import numpy as np
+
+from db_setup import Database
+from face_clustering import LeaderClustering, PersonStats
+from repositories.face_repo import FaceRepository
+from repositories.person_repo import PersonRepository
+from repositories.sys_prefs_repo import SystemPrefsRepository
+
+CHECKPOINT_KEY = "recluster_checkpoint"
+# JSON list of sorted person id lists the user declined, not proposed again
+REJECTED_KEY = "recluster_rejected"
+# names given by FaceClustering, a person renamed by the user wins a merge
+_DEFAULT_NAME = re.compile(r"^Person\d+$")
+
+
+class ReclusteringJob:
+    """
+    Global pass over all people that finds persons split by the incremental
+    clustering (same face in two imports -> Person3 and Person17).
+    Two people are merge candidates when the average similarity between
+    their faces, dot(sum_a, sum_b) / (n_a * n_b) from the stored person
+    stats, is within `threshold` (same meaning as in FaceClustering).
+    Candidates connected by such pairs are grouped by average linkage on
+    the merged sums (LeaderClustering._merge), so A~B and B~C alone do not
+    put A and C together. Groups are either only proposed (self.proposals)
+    or applied in one transaction. A group is merged automatically only if
+    every member is still within the threshold of the rest of the group
+    and at most one of them was named by the user, otherwise it stays a
+    proposal for the user to confirm (apply_proposals() / reject()).
+
+    Runs on its own thread and DB connection, so ingest and the UI keep
+    going. People are compared in row chunks of the upper triangle; after
+    every chunk the position is checkpointed in system_preferences, so a
+    cancelled run or one that hit its time / comparison budget resumes
+    where it stopped next time.
+    """
+
+    def __init__(self, threshold: float = 0.6, apply: bool = False, chunk_size: int = 1024,
+                 memory_budget_mb: int = 256, max_seconds: Optional[float] = None,
+                 max_comparisons: Optional[int] = None, db_factory: Callable = Database):
+        self.threshold = threshold
+        self.apply = apply
+        self.chunk_size = chunk_size
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self.max_seconds = max_seconds
+        self.max_comparisons = max_comparisons
+        self.db_factory = db_factory
+
+        # [(keep_person_id, [merged_person_ids], lowest similarity, auto), ...]
+        # lowest = weakest member against the rest of its group,
+        # auto = False -> too weak or several user-given names, proposal only
+        self.proposals = []
+        self.comparisons = 0
+        self.finished = False
+        # person_id -> (name, face_count) as read at the start, a group whose
+        # members changed since is not merged
+        self._snapshot = {}
+        self.error = None
+
+        self._cancel = threading.Event()
+        self._thread = None
+
+    def start(self, on_done: Optional[Callable] = None) -> threading.Thread:
+        # on_done(job) runs on the job thread, UI callers have to hop back via after()
+        def target():
+            try:
+                self.run()
+            except Exception as e:
+                self.error = e
+                print(f"Error -> Re-clustering failed: {e}")
+            if on_done:
+                on_done(self)
+
+        self._thread = threading.Thread(
+            target=target, name="reclustering", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def cancel(self) -> None:
+        self._cancel.set()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def run(self) -> None:
+        db = self.db_factory()
+        try:
+            self._run(PersonRepository(db), FaceRepository(db),
+                      SystemPrefsRepository(db))
+        finally:
+            db.close()
+
+    def apply_proposals(self, proposals) -> int:
+        """
+        Merges proposals the user accepted, auto or not, on a connection
+        of its own. Groups whose people changed since the run are skipped.
+        """
+        db = self.db_factory()
+        try:
+            applied = self._apply(PersonRepository(db), FaceRepository(db),
+                                  [(keep, merged) for keep, merged, *_ in proposals])
+        finally:
+            db.close()
+        self._drop(applied)
+        return len(applied)
+
+    def reject(self, prefs, proposal) -> None:
+        # the same group of people is not proposed again
+        rejected = self._load_rejected(prefs)
+        keep, merged, *_ = proposal
+        rejected.add(frozenset([keep, *merged]))
+        prefs.save_pref(REJECTED_KEY, json.dumps(sorted(sorted(g) for g in rejected)))
+        self.proposals = [p for p in self.proposals if p is not proposal]
+
+    def person_name(self, person_id) -> Optional[str]:
+        # name as read at the start of the run
+        return self._snapshot.get(person_id, (None, 0))[0]
+
+    def _run(self, person_repo, face_repo, prefs) -> None:
+        person_ids, names, sums, counts = self._load_people(person_repo)
+        if len(person_ids) < 2:
+            self.finished = True
+            return
+
+        # Resume only if the set of people is still the one we started on
+        fingerprint = f"{len(person_ids)}:{int(person_ids.max())}:{int(person_ids.sum())}"
+        checkpoint = self._load_checkpoint(prefs, fingerprint)
+        start_row = checkpoint["row"]
+        pairs = [tuple(p) for p in checkpoint["pairs"]]
+        if start_row:
+            print(f"RECLUSTER: Resuming at person {start_row} / {len(person_ids)}")
+
+        # a / n_a against b / n_b -> average face similarity
+        means = sums / counts[:, None]
+        min_sim = 1.0 - self.threshold
+        deadline = time.monotonic() + self.max_seconds if self.max_seconds else None
+
+        row = start_row
+        while row < len(person_ids):
+            if self._out_of_budget(deadline):
+                self._save_checkpoint(prefs, fingerprint, row, pairs)
+                print(f"RECLUSTER: Stopped at person {row} / {len(person_ids)}, "
+                      f"{self.comparisons} comparisons")
+                return
+
+            end = min(row + self.chunk_size, len(person_ids))
+            pairs.extend(self._compare_chunk(
+                means, sums, counts, row, end, min_sim))
+            row = end
+            self._save_checkpoint(prefs, fingerprint, row, pairs)
+
+        rejected = self._load_rejected(prefs)
+        self.proposals = [p for p in self._group(person_ids, names, sums, counts, pairs)
+                          if frozenset([p[0], *p[1]]) not in rejected]
+        print(f"RECLUSTER: {len(self.proposals)} merge groups from "
+              f"{self.comparisons} comparisons")
+
+        # groups with several user-given names or a weak member are left to the user
+        merges = [(keep, merged) for keep, merged, _, auto in self.proposals if auto]
+        if self.apply and merges:
+            applied = self._apply(person_repo, face_repo, merges)
+            self._drop(applied)
+            print(f"RECLUSTER: Applied {len(applied)} merges, "
+                  f"{len(self.proposals)} left for review")
+
+        prefs.save_pref(CHECKPOINT_KEY, "")
+        self.finished = True
+
+    def _compare_chunk(self, means, sums, counts, row, end, min_sim) -> list:
+        # rows row..end against every later person, column blocks within the budget
+        found = []
+        block = max(1, self.memory_budget // (4 * 3 * (end - row)))
+
+        for col in range(row, len(sums), block):
+            col_end = min(col + block, len(sums))
+            sims = means[row:end] @ sums[col:col_end].T
+            sims /= counts[col:col_end]
+
+            # upper triangle only, each pair once
+            rows = np.arange(row, end)[:, None]
+            cols = np.arange(col, col_end)[None, :]
+            sims[cols <= rows] = -np.inf
+            self.comparisons += int((cols > rows).sum())
+
+            for i, j in zip(*np.nonzero(sims > min_sim)):
+                found.append((int(row + i), int(col + j), float(sims[i, j])))
+
+        return found
+
+    def _group(self, person_ids, names, sums, counts, pairs) -> list:
+        # union-find over candidate pairs (row indices) only splits the
+        # people into independent components, the groups come from merging
+        parent = list(range(len(person_ids)))
+
+        def find(x):
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        for a, b, _ in pairs:
+            ra, rb = find(a), find(b)
+            if ra != rb:
+                parent[rb] = ra
+
+        components = {}
+        for a, b, _ in pairs:
+            components.setdefault(find(a), set()).update((a, b))
+
+        min_sim = 1.0 - self.threshold
+        merger = LeaderClustering(self.threshold, self.memory_budget // (1024 * 1024))
+        proposals = []
+        for component in components.values():
+            rows = np.array(sorted(component))
+            # average linkage: two groups join only while the average
+            # similarity between all their faces stays within the threshold
+            labels = merger._merge(sums[rows].copy(), counts[rows].copy())
+
+            for label in np.unique(labels):
+                members = rows[labels == label]
+                if len(members) < 2:
+                    continue
+
+                # every member against the rest of the group, not just the
+                # pair that linked it
+                total, n = sums[members].sum(axis=0), counts[members].sum()
+                sims = np.einsum("ij,ij->i", sums[members], total - sums[members]) \
+                    / (counts[members] * (n - counts[members]))
+                lowest = float(sims.min())
+
+                # a named person stays, then the one with most faces
+                members = sorted(members, key=lambda r: (
+                    bool(_DEFAULT_NAME.match(names[r] or "")), -counts[r]))
+                named = sum(not _DEFAULT_NAME.match(names[m] or "") for m in members)
+                proposals.append((int(person_ids[members[0]]),
+                                  [int(person_ids[m]) for m in members[1:]],
+                                  lowest, named <= 1 and lowest > min_sim))
+        return proposals
+
+    def _apply(self, person_repo, face_repo, merges) -> list:
+        # merges = [(keep_person_id, [merged_person_ids]), ...] -> the applied ones
+        conn = person_repo.conn
+
+        try:
+            # the stats are read again under a row lock, the ones loaded at
+            # the start miss faces ingest assigned while the job was running
+            current = {r["id"]: r for r in person_repo.get_stats_for_update(
+                [p for keep, merged in merges for p in (keep, *merged)])}
+
+            groups = []
+            for keep, merged in merges:
+                members = [keep, *merged]
+                if any(p not in current or self._snapshot.get(p) !=
+                       (current[p]["name"], current[p]["face_count"]) for p in members):
+                    print(f"RECLUSTER: People {members} changed since the run started, "
+                          f"merge skipped")
+                    continue
+                groups.append((keep, merged, [current[p] for p in members]))
+
+            if groups:
+                dim = len(_floats(groups[0][2][0]["embedding_sum"]))
+                medoids = {r["id"]: _floats(r["medoids"]).reshape(-1, dim)
+                           for _, _, rows in groups for r in rows}
+                stats = PersonStats(dim, max(1, max(len(m) for m in medoids.values())),
+                                    capacity=len(groups))
+
+                for keep, merged, rows in groups:
+                    face_repo.reassign_people(merged, keep)
+
+                    # stats of the merged person without reading its faces again,
+                    # new medoids are picked from the old ones
+                    stats.set(keep, np.sum([_floats(r["embedding_sum"]) for r in rows], axis=0),
+                              sum(r["face_count"] for r in rows),
+                              np.concatenate([medoids[r["id"]] for r in rows]))
+
+                person_repo.update_stats_many(
+                    [(p, *stats.to_bytes(p)) for p in stats.dirty])
+                person_repo.delete_people([p for _, merged, _ in groups for p in merged])
+            conn.commit()
+            return [(keep, merged) for keep, merged, _ in groups]
+        except Exception:
+            conn.rollback()
+            raise
+
+    def _load_people(self, person_repo):
+        rows = [r for r in person_repo.get_all_stats()
+                if r["embedding_sum"] is not None and r["face_count"]]
+        self._snapshot = {r["id"]: (r["name"], r["face_count"]) for r in rows}
+        if not rows:
+            return np.empty(0, dtype=np.int64), None, None, None
+
+        person_ids = np.array([r["id"] for r in rows], dtype=np.int64)
+        names = [r["name"] for r in rows]
+        sums = np.stack([_floats(r["embedding_sum"]) for r in rows])
+        counts = np.array([r["face_count"] for r in rows], dtype=np.float32)
+
+        return person_ids, names, sums, counts
+
+    def _out_of_budget(self, deadline) -> bool:
+        if self._cancel.is_set():
+            return True
+        if deadline is not None and time.monotonic() > deadline:
+            return True
+        return self.max_comparisons is not None and self.comparisons >= self.max_comparisons
+
+    def _drop(self, applied) -> None:
+        done = {keep for keep, _ in applied}
+        self.proposals = [p for p in self.proposals if p[0] not in done]
+
+    @staticmethod
+    def _load_rejected(prefs) -> set:
+        raw = prefs.load_pref(REJECTED_KEY, "")
+        try:
+            return {frozenset(g) for g in json.loads(raw)} if raw else set()
+        except (TypeError, ValueError):
+            return set()
+
+    def _load_checkpoint(self, prefs, fingerprint) -> dict:
+        raw = prefs.load_pref(CHECKPOINT_KEY, "")
+        try:
+            checkpoint = json.loads(raw) if raw else None
+        except (TypeError, ValueError):
+            checkpoint = None
+
+        if not checkpoint or checkpoint.get("fingerprint") != fingerprint:
+            return {"row": 0, "pairs": []}
+        return checkpoint
+
+    def _save_checkpoint(self, prefs, fingerprint, row, pairs) -> None:
+        prefs.save_pref(CHECKPOINT_KEY, json.dumps(
+            {"fingerprint": fingerprint, "row": row, "pairs": pairs}))
+
+
+def _floats(data) -> np.ndarray:
+    # BYTEA (bytes / memoryview / None) -> float32 vector
+    return np.frombuffer(bytes(data or b""), dtype=np.float32)
@@ -0,0 +1,59 @@
+import time
+
+
+class FaceBatchWriter:
+    """
+    Buffers detected faces and writes them in bulk.
+    The faces of a photo and its already_analyzed flag are committed in the
+    same transaction, so a crash never leaves half-saved faces behind.
+    """
+
+    def __init__(self, face_repo, photo_repo, max_rows=500, max_delay=2.0):
+        self.face_repo = face_repo
+        self.photo_repo = photo_repo
+
+        # flush when this many faces/photos are waiting ...
+        self.max_rows = max_rows
+        # ... or when the oldest one waits longer than this (seconds), checked
+        # on add_photo() and flush_if_due(), which the idle write stage calls
+        self.max_delay = max_delay
+
+        self._face_rows = []
+        self._photo_ids = []
+        self._oldest = None
+
+    def add_photo(self, photo_id, face_rows):
+        # face_rows = rows of FaceRepository.add_many
+        self._face_rows.extend(face_rows)
+        self._photo_ids.append(photo_id)
+
+        if self._oldest is None:
+            self._oldest = time.monotonic()
+
+        if len(self._face_rows) >= self.max_rows or len(self._photo_ids) >= self.max_rows:
+            self.flush()
+        else:
+            self.flush_if_due()
+
+    def flush_if_due(self):
+        # without new photos add_photo never runs, a stalled pipeline would
+        # keep the buffered faces uncommitted
+        if self._oldest is not None and time.monotonic() - self._oldest >= self.max_delay:
+            self.flush()
+
+    def flush(self):
+        if not self._photo_ids:
+            return
+
+        face_rows, photo_ids = self._face_rows, self._photo_ids
+        self._face_rows, self._photo_ids, self._oldest = [], [], None
+
+        conn = self.face_repo.conn
+        try:
+            self.face_repo.add_many(face_rows)
+            self.photo_repo.mark_analyzed_many(photo_ids)
+            conn.commit()
+        except Exception:
+            # photos stay unanalyzed and get detected again next time
+            conn.rollback()
+            raise
@@ -1,3 +1,5 @@
+import psycopg2.extras
+
 from .base_repo import BaseRepository
 
 
@@ -16,6 +18,15 @@ class FaceRepository(BaseRepository):
         """, (person_id,))
         return self.cursor.fetchall()
 
+    def get_faces_by_photo_id(self, photo_id):
+        self.cursor.execute(
+            """
+            SELECT embedding, face_coords, person_id, det_score, face_size, sharpness
+            FROM faces WHERE photo_id = %s
+            """,
+            (photo_id,))
+        return self.cursor.fetchall()
+
     def add(self, photo_id, embedding_bytes, face_coords):
         self.cursor.execute(
             """
@@ -26,10 +37,41 @@ class FaceRepository(BaseRepository):
         )
         self.conn.commit()
 
+    def add_many(self, rows):
+        # rows = [(photo_id, embedding_bytes, face_coords, person_id,
+        #          det_score, face_size, sharpness), ...]
+        # No commit, caller owns the transaction (FaceBatchWriter)
+        if not rows:
+            return
+
+        psycopg2.extras.execute_values(
+            self.cursor,
+            """
+            INSERT INTO faces (photo_id, embedding, face_coords, person_id,
+                               det_score, face_size, sharpness)
+            VALUES %s
+            """,
+            rows,
+            page_size=1000
+        )
+
     def get_all_embeddings(self):
         self.cursor.execute("SELECT id, embedding, person_id FROM faces")
         return self.cursor.fetchall()
 
+    def get_face_person_ids(self):
+        # no embeddings -> cheap even for big libraries (EmbeddingSidecar)
+        self.cursor.execute("SELECT id, person_id FROM faces ORDER BY id")
+        return self.cursor.fetchall()
+
+    def get_embeddings_by_ids(self, face_ids):
+        if not face_ids:
+            return []
+        self.cursor.execute(
+            "SELECT id, embedding FROM faces WHERE id = ANY(%s) ORDER BY id",
+            (list(face_ids),))
+        return self.cursor.fetchall()
+
     def update_person_id(self, face_id, person_id):
         self.cursor.execute(
             "UPDATE faces SET person_id = %s WHERE id = %s",
@@ -37,6 +79,29 @@ class FaceRepository(BaseRepository):
         )
         self.conn.commit()
 
+    def assign_persons(self, pairs):
+        # pairs = [(face_id, person_id), ...], one statement per 1000 pairs
+        # No commit, caller owns the transaction (FaceClustering)
+        if not pairs:
+            return
+
+        psycopg2.extras.execute_values(
+            self.cursor,
+            """
+            UPDATE faces AS f SET person_id = v.person_id
+            FROM (VALUES %s) AS v(id, person_id)
+            WHERE f.id = v.id
+            """,
+            pairs,
+            page_size=1000
+        )
+
+    def reassign_people(self, from_person_ids, to_person_id):
+        # No commit, caller owns the transaction (ReclusteringJob)
+        self.cursor.execute(
+            "UPDATE faces SET person_id = %s WHERE person_id = ANY(%s)",
+            (to_person_id, list(from_person_ids)))
+
     def get_all_without_person_id(self):
         self.cursor.execute(
             "SELECT id, embedding FROM faces WHERE person_id IS NULL")
@@ -0,0 +1,49 @@
+import os
+
+import psycopg2.extras
+
+from .base_repo import BaseRepository
+
+
+class FileIndexRepository(BaseRepository):
+
+    def get_under_folder(self, folder_path):
+        # trailing separator -> "/photos" does not match "/photos2/..."
+        prefix = os.path.join(str(folder_path), "")
+        # LIKE wildcards in the folder name must not match anything else
+        prefix = prefix.replace("\\", "\\\\").replace(
+            "%", "\\%").replace("_", "\\_")
+
+        self.cursor.execute("""
+            SELECT fi.path, fi.size, fi.mtime_ns, fi.inode, fi.photo_id, p.already_analyzed,
+                   (p.phash IS NOT NULL OR p.phash_checked) AND p.orientation IS NOT NULL
+                       AS near_dup_ready
+            FROM file_index fi
+            JOIN photos p ON p.id = fi.photo_id
+            WHERE fi.path LIKE %s
+        """, (prefix + "%",))
+        return self.cursor.fetchall()
+
+    def upsert_many(self, rows):
+        # rows = [(path, size, mtime_ns, inode, photo_id), ...]
+        if not rows:
+            return
+
+        psycopg2.extras.execute_values(self.cursor, """
+            INSERT INTO file_index (path, size, mtime_ns, inode, photo_id)
+            VALUES %s
+            ON CONFLICT (path) DO UPDATE SET
+                size = EXCLUDED.size,
+                mtime_ns = EXCLUDED.mtime_ns,
+                inode = EXCLUDED.inode,
+                photo_id = EXCLUDED.photo_id
+        """, rows)
+        self.conn.commit()
+
+    def delete_paths(self, paths):
+        if not paths:
+            return
+
+        self.cursor.execute(
+            "DELETE FROM file_index WHERE path = ANY(%s)", (list(paths),))
+        self.conn.commit()
@@ -0,0 +1,27 @@
+import psycopg2.extras
+
+from .base_repo import BaseRepository
+
+
+class GeocodeCacheRepository(BaseRepository):
+
+    def get_all(self, prefix=""):
+        # prefix = resolver id of GeocodeCache, cells of the other one are skipped
+        self.cursor.execute(
+            "SELECT cell, city, country FROM geocode_cache WHERE starts_with(cell, %s)",
+            (prefix,))
+        return self.cursor.fetchall()
+
+    def put_many(self, rows):
+        # rows = [(cell, city, country), ...]
+        if not rows:
+            return
+
+        psycopg2.extras.execute_values(self.cursor, """
+            INSERT INTO geocode_cache (cell, city, country)
+            VALUES %s
+            ON CONFLICT (cell) DO UPDATE SET
+                city = EXCLUDED.city,
+                country = EXCLUDED.country
+        """, rows)
+        self.conn.commit()
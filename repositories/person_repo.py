@@ -1,3 +1,5 @@
+import psycopg2.extras
+
 from .base_repo import BaseRepository
 
 
@@ -39,6 +41,30 @@ class PersonRepository(BaseRepository):
         self.conn.commit()
         return new_id
 
+    def create_people(self, rows):
+        # rows = [(name, avg_embedding_bytes), ...] -> ids in the same order
+        # No commit, caller owns the transaction (FaceClustering)
+        if not rows:
+            return []
+
+        result = psycopg2.extras.execute_values(
+            self.cursor,
+            "INSERT INTO people (name, avg_embedding) VALUES %s RETURNING id",
+            rows,
+            page_size=1000,
+            fetch=True
+        )
+        return [row['id'] for row in result]
+
+    def max_default_number(self):
+        # highest N of the "PersonN" names, 0 if there are none; COUNT(*)
+        # would hand out a name again once a person was deleted or merged
+        self.cursor.execute("""
+            SELECT COALESCE(MAX(substring(name FROM '^Person([0-9]+)$')::bigint), 0) AS n
+            FROM people
+        """)
+        return self.cursor.fetchone()['n']
+
     def get_all_people_data(self):
         self.cursor.execute("SELECT id, name, avg_embedding FROM people")
         return self.cursor.fetchall()
@@ -50,6 +76,48 @@ class PersonRepository(BaseRepository):
         )
         self.conn.commit()
 
+    def get_all_stats(self):
+        self.cursor.execute(
+            "SELECT id, name, embedding_sum, face_count, medoids FROM people")
+        return self.cursor.fetchall()
+
+    def get_stats_for_update(self, person_ids):
+        # rows stay locked until the caller commits, ingest waits for the merge
+        # No commit, caller owns the transaction (ReclusteringJob)
+        self.cursor.execute("""
+            SELECT id, name, embedding_sum, face_count, medoids FROM people
+            WHERE id = ANY(%s)
+            ORDER BY id
+            FOR UPDATE
+        """, (list(person_ids),))
+        return self.cursor.fetchall()
+
+    def update_stats_many(self, rows):
+        # rows = [(person_id, avg_embedding, embedding_sum, face_count, medoids), ...]
+        # No commit, caller owns the transaction (FaceClustering)
+        if not rows:
+            return
+
+        psycopg2.extras.execute_values(
+            self.cursor,
+            """
+            UPDATE people AS p
+            SET avg_embedding = v.avg_embedding, embedding_sum = v.embedding_sum,
+                face_count = v.face_count, medoids = v.medoids
+            FROM (VALUES %s) AS v(id, avg_embedding, embedding_sum, face_count, medoids)
+            WHERE p.id = v.id
+            """,
+            rows,
+            page_size=500
+        )
+
+    def delete_people(self, person_ids):
+        # No commit, caller owns the transaction (ReclusteringJob)
+        if not person_ids:
+            return
+        self.cursor.execute(
+            "DELETE FROM people WHERE id = ANY(%s)", (list(person_ids),))
+
     def update_name(self, person_id, new_name):
         self.cursor.execute(
             "UPDATE people SET name = %s WHERE id = %s",
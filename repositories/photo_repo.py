@@ -18,15 +18,21 @@ class PhotoRepository(BaseRepository):
             "SELECT * FROM photos WHERE id = %s", (id,))
         return self.cursor.fetchone()
 
+    def get_all_phashes(self):
+        self.cursor.execute(
+            "SELECT id, phash FROM photos WHERE phash IS NOT NULL")
+        return self.cursor.fetchall()
+
     def insert_photo(self, **kwargs):
         self.cursor.execute(
             """
-                INSERT INTO photos (path, filename, hash, location_data_city, time_data, width, height, location_data_country)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                INSERT INTO photos (path, filename, hash, location_data_city, time_data, width, height, location_data_country, phash, phash_checked, orientation)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, TRUE, %s)
                 RETURNING id
                 """,
             (kwargs["path"], kwargs["filename"], kwargs["hash"], kwargs["location_data_city"],
-             kwargs["time_data"], kwargs["width"], kwargs["height"], kwargs["location_data_country"])
+             kwargs["time_data"], kwargs["width"], kwargs["height"], kwargs["location_data_country"], kwargs.get("phash"),
+             kwargs.get("orientation"))
         )
 
         result = self.cursor.fetchone()
@@ -44,14 +50,16 @@ class PhotoRepository(BaseRepository):
 
         if (location_data_city != None):
             self.cursor.execute(
-                "UPDATE photos SET path=%s, filename=%s, location_data_city=%s,location_data_country=%s  WHERE id=%s",
+                "UPDATE photos SET path=%s, filename=%s, location_data_city=%s,location_data_country=%s, phash=COALESCE(phash, %s), phash_checked=TRUE, orientation=COALESCE(orientation, %s) WHERE id=%s",
                 (kwargs["path"], kwargs["filename"],
-                 kwargs["location_data_city"], kwargs["location_data_country"], photo_id)
+                 kwargs["location_data_city"], kwargs["location_data_country"], kwargs.get("phash"),
+                 kwargs.get("orientation"), photo_id)
             )
         else:
             self.cursor.execute(
-                "UPDATE photos SET path=%s, filename=%s WHERE id=%s",
-                (kwargs["path"], kwargs["filename"], photo_id)
+                "UPDATE photos SET path=%s, filename=%s, phash=COALESCE(phash, %s), phash_checked=TRUE, orientation=COALESCE(orientation, %s) WHERE id=%s",
+                (kwargs["path"], kwargs["filename"], kwargs.get("phash"),
+                 kwargs.get("orientation"), photo_id)
             )
 
         self.conn.commit()
@@ -63,6 +71,13 @@ class PhotoRepository(BaseRepository):
         )
         self.conn.commit()
 
+    def mark_analyzed_many(self, photo_ids):
+        # No commit, caller owns the transaction (FaceBatchWriter)
+        self.cursor.execute(
+            "UPDATE photos SET already_analyzed = 1 WHERE id = ANY(%s)",
+            (list(photo_ids),)
+        )
+
     def get_photos(self, criteria: FilterCriteria):
 
         query = "SELECT DISTINCT p.* FROM photos p"
@@ -1,8 +1,21 @@
+import uuid
+
 from .base_repo import BaseRepository
 
+DB_IDENTITY_KEY = "db_identity"
+
 
 class SystemPrefsRepository(BaseRepository):
 
+    def get_db_identity(self):
+        # random id of this database, a reset DB gets a new one; ties the
+        # caches in data/ (keyed by reused serial ids) to the DB they came from
+        identity = self.load_pref(DB_IDENTITY_KEY)
+        if identity is None:
+            identity = str(uuid.uuid4())
+            self.save_pref(DB_IDENTITY_KEY, identity)
+        return str(identity)
+
     def save_pref(self, key, value):
         self.cursor.execute("""
             INSERT INTO system_preferences (key, value)
@@ -0,0 +1,250 @@
+from pathlib import Path
+from typing import Optional, Tuple
+import math
+import threading
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+
+# Default place for a user supplied GeoNames dump (see README)
+DEFAULT_CITIES_PATH = Path(__file__).resolve(
+).parent / "data" / "geonames" / "cities1000.txt"
+
+
+class OfflineGeocoder:
+    """
+    Nearest-city reverse geocoding without any network access.
+    Built from a GeoNames cities file (cities500.txt, cities1000.txt, ...).
+    Cities are stored as unit vectors in a uniform 3D grid, a lookup only
+    checks the cells around the query point instead of every city.
+    """
+
+    # Edge of one grid cell as chord length on the unit sphere (~64 km)
+    CELL = 0.01
+
+    def __init__(self, cities_path, country_info_path=None, max_distance_km=50.0):
+        self.cities_path = Path(cities_path)
+        self.country_info_path = Path(country_info_path) if country_info_path \
+            else self.cities_path.parent / "countryInfo.txt"
+        # Further away from any known city -> (None, None)
+        self.max_distance_km = max_distance_km
+
+        self._names = []
+        self._countries = []
+        self._points = None
+        self._grid = {}
+        self._shells = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def reverse(self, lat: float, lon: float) -> Tuple[Optional[str], Optional[str]]:
+        self._ensure_loaded()
+
+        if self._points is None or len(self._points) == 0:
+            return None, None
+
+        query = _to_unit_vector(lat, lon)
+        cell = tuple(np.floor(query / self.CELL).astype(int))
+
+        max_chord = 2 * math.sin(min(self.max_distance_km /
+                                     EARTH_RADIUS_KM, math.pi) / 2)
+        max_ring = int(math.ceil(max_chord / self.CELL)) + 1
+
+        best_idx = -1
+        best_dist = math.inf
+
+        for ring in range(max_ring + 1):
+            candidates = []
+            for dx, dy, dz in self._shell(ring):
+                bucket = self._grid.get(
+                    (cell[0] + dx, cell[1] + dy, cell[2] + dz))
+                if bucket:
+                    candidates.extend(bucket)
+
+            if candidates:
+                dists = np.linalg.norm(
+                    self._points[candidates] - query, axis=1)
+                i = int(np.argmin(dists))
+                if dists[i] < best_dist:
+                    best_dist = float(dists[i])
+                    best_idx = candidates[i]
+
+            # Every point in the next ring is at least ring * CELL away
+            if best_dist <= ring * self.CELL:
+                break
+
+        if best_idx < 0 or best_dist > max_chord:
+            return None, None
+
+        return self._names[best_idx], self._countries[best_idx]
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+
+        with self._lock:
+            if self._loaded:
+                return
+            self._load()
+            self._loaded = True
+
+    def _load(self):
+        country_names = self._load_country_names()
+
+        coords = []
+        with open(self.cities_path, encoding="utf-8") as f:
+            for line in f:
+                cols = line.rstrip("\n").split("\t")
+                # geonameid, name, asciiname, alternatenames, latitude, longitude,
+                # feature class, feature code, country code, ...
+                if len(cols) < 9:
+                    continue
+                try:
+                    lat, lon = float(cols[4]), float(cols[5])
+                except ValueError:
+                    continue
+
+                self._names.append(cols[1])
+                self._countries.append(country_names.get(cols[8], cols[8]))
+                coords.append((lat, lon))
+
+        if not coords:
+            print(f"GEOCODER: No places found in {self.cities_path}")
+            return
+
+        lat = np.radians(np.array([c[0] for c in coords]))
+        lon = np.radians(np.array([c[1] for c in coords]))
+        self._points = np.stack([
+            np.cos(lat) * np.cos(lon),
+            np.cos(lat) * np.sin(lon),
+            np.sin(lat)
+        ], axis=1)
+
+        cells = np.floor(self._points / self.CELL).astype(int)
+        for idx, cell in enumerate(map(tuple, cells)):
+            self._grid.setdefault(cell, []).append(idx)
+
+        print(
+            f"GEOCODER: Loaded {len(self._names)} places into {len(self._grid)} cells")
+
+    def _load_country_names(self):
+        # countryInfo.txt: ISO, ISO3, ISO-Numeric, fips, Country, ...
+        names = {}
+        if not self.country_info_path.exists():
+            return names
+
+        with open(self.country_info_path, encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("#"):
+                    continue
+                cols = line.rstrip("\n").split("\t")
+                if len(cols) > 4:
+                    names[cols[0]] = cols[4]
+        return names
+
+    def _shell(self, ring):
+        # Cell offsets with Chebyshev distance exactly `ring`
+        if ring not in self._shells:
+            r = range(-ring, ring + 1)
+            self._shells[ring] = [
+                (dx, dy, dz) for dx in r for dy in r for dz in r
+                if max(abs(dx), abs(dy), abs(dz)) == ring
+            ]
+        return self._shells[ring]
+
+
+def _to_unit_vector(lat, lon):
+    lat, lon = math.radians(lat), math.radians(lon)
+    return np.array([
+        math.cos(lat) * math.cos(lon),
+        math.cos(lat) * math.sin(lon),
+        math.sin(lat)
+    ])
+
+
+class GeocodeCache:
+    """
+    Reverse geocoding results keyed by coordinates rounded to `precision`
+    decimal places (2 = ~1 km cells). Photos from one trip share a handful of
+    cells, so only the first photo of each cell reaches the resolver.
+    Results are kept in memory for the run and persisted in geocode_cache.
+    `source` names the resolver (PhotoMetadata.geocoder_id()) and prefixes
+    every key: Nominatim and the offline geocoder spell places differently
+    ("Česko" / "Czechia"), their cells must not mix.
+    """
+
+    def __init__(self, repo, resolver, source, precision=2):
+        self.repo = repo
+        # (lat, lon) -> (city, country), or None when the lookup failed
+        self.resolver = resolver
+        self.source = source
+        self.precision = precision
+
+        self.hits = 0
+        self.misses = 0
+
+        self._cells = {}
+        self._new_rows = []
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def load(self):
+        # Whole table, one row per cell -> small even for big libraries
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            for row in self.repo.get_all(prefix=f"{self.source}:"):
+                self._cells[row["cell"]] = (row["city"], row["country"])
+
+    def lookup(self, lat: float, lon: float) -> Optional[Tuple[Optional[str], Optional[str]]]:
+        key = self.cell_key(lat, lon)
+
+        while True:
+            with self._lock:
+                if key in self._cells:
+                    self.hits += 1
+                    return self._cells[key]
+
+                # Someone else is resolving this cell right now -> wait for it
+                event = self._in_flight.get(key)
+                if event is None:
+                    event = self._in_flight[key] = threading.Event()
+                    self.misses += 1
+                    break
+
+            # resolved -> hit on the next loop, failed -> we try ourselves
+            event.wait()
+
+        result = None
+        try:
+            result = self.resolver(lat, lon)
+        finally:
+            with self._lock:
+                # failures (no network) are not cached
+                if result is not None:
+                    self._cells[key] = tuple(result)
+                    self._new_rows.append((key, *result))
+                del self._in_flight[key]
+            event.set()
+
+        return result
+
+    def flush(self):
+        with self._lock:
+            rows, self._new_rows = self._new_rows, []
+        self.repo.put_many(rows)
+
+    def cell_key(self, lat: float, lon: float) -> str:
+        # resolver and precision are part of the key, switching either one
+        # does not mix names or cell sizes
+        return f"{self.source}:{self.precision}:{lat:.{self.precision}f},{lon:.{self.precision}f}"
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "cells": len(self._cells),
+        }
@@ -1,6 +1,7 @@
 from dataclasses import dataclass, field
 from typing import List, Optional
 from datetime import datetime
+import os
 
 
 @dataclass
@@ -41,3 +42,111 @@ class FilterCriteria:
             f"country={self.country}, "
             f"city={self.city}"
         )
+
+
+@dataclass
+class PipelineConfig:
+    """
+    Worker pool and queue sizes for the ingest pipeline.
+    Used by PhotoController.analyze_folder.
+    """
+
+    # file/folder names skipped by discovery (hidden, NAS thumbnails, trash)
+    ignore_patterns: tuple = (".*", "@eaDir", "#recycle",
+                              "$RECYCLE.BIN", "System Volume Information")
+
+    # stat() calls for the change check, mostly waiting on the file system
+    stat_workers: int = 4
+
+    # hashing + EXIF, CPU bound -> separate processes
+    metadata_workers: int = max(1, (os.cpu_count() or 2) - 1)
+    use_processes: bool = True
+
+    # cv2 decoding and ONNX inference release the GIL -> threads
+    decode_workers: int = 2
+    detect_workers: int = 1
+    # photos per detector call, face crops are batched across all of them
+    detect_batch_size: int = 8
+
+    # dHash bits that may differ for a near-duplicate, 0 = feature off
+    near_duplicate_radius: int = 4
+
+    # max items waiting in front of each stage
+    queue_size: int = 32
+
+
+@dataclass
+class ClusteringConfig:
+    """
+    How FaceClustering matches new faces to known people.
+    Used by FaceClustering.resolve_identities.
+    """
+
+    # "faces" = compare new faces with known faces (see matcher),
+    # "people" = with per-person centroids and medoids only
+    match_mode: str = "faces"
+    medoids_per_person: int = 3
+    # "people" mode: best distance within threshold +- margin is re-checked
+    # against every face of the recheck_candidates closest people
+    recheck_margin: float = 0.05
+    recheck_candidates: int = 3
+
+    # "brute" = compare with every known face, "ann" = IVF index,
+    # "auto" = ann once there are at least ann_min_faces known faces
+    matcher: str = "auto"
+    ann_min_faces: int = 20_000
+
+    # inverted lists scanned per query, higher = better recall, slower
+    ann_nprobe: int = 16
+    # nearest known faces looked at per new face
+    ann_top_k: int = 10
+    # None -> data/face_index.npz next to the app
+    ann_index_path: Optional[str] = None
+
+    # normalized embeddings memory-mapped from data/embeddings (or this dir)
+    # instead of reading every BYTEA row from the DB on each run
+    embedding_cache: bool = True
+    embedding_cache_dir: Optional[str] = None
+    # SystemPrefsRepository.get_db_identity(), the sidecar and the ANN index
+    # are rebuilt when it changes (a reset DB starts face ids at 1 again)
+    db_identity: Optional[str] = None
+
+    # in-memory matrix of known faces: "float32", "float16" or "int8"
+    matrix_dtype: str = "float32"
+
+    # grouping of the unassigned faces: "agglomerative" (exact, O(n^2) RAM),
+    # "leader" (chunked, bounded RAM), "auto" = leader when n^2 would not fit
+    local_clustering: str = "auto"
+    # working memory of the local clustering, the embeddings themselves excluded
+    memory_budget_mb: int = 512
+
+
+@dataclass
+class FaceQualityConfig:
+    """
+    Gates in front of face recognition. A detected face failing any of them
+    gets no embedding and is not stored.
+    Used by FaceDetection.detect_faces_batch.
+    """
+
+    # detector confidence, the detector itself already drops < 0.5
+    min_det_score: float = 0.6
+    # shorter side of the bounding box in pixels, tiny background faces
+    min_face_size: int = 20
+    # variance of the Laplacian of the aligned 112x112 crop, 0 = off
+    min_sharpness: float = 10.0
+
+
+@dataclass(slots=True)
+class ExifRecord:
+    """
+    Everything the ingest needs from a file header, read in one pass.
+    Produced by PhotoMetadata.read_record.
+    """
+
+    date: Optional[str] = None  # EXIF DateTimeOriginal as "YYYY-MM-DD HH:MM:SS"
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    orientation: Optional[int] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
@@ -0,0 +1,152 @@
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+import os
+import threading
+
+import cv2
+import numpy as np
+from PIL import Image, ImageOps, features
+
+DEFAULT_THUMBNAIL_DIR = Path(__file__).resolve().parent / "data" / "thumbnails"
+# longest side, same as the gallery cards
+THUMBNAIL_SIZE = 140
+
+
+class ThumbnailCache:
+    """
+    Small copies of the photos on disk, keyed by the SHA-256 content hash
+    of the original (photos.hash), so renamed or moved files keep their
+    thumbnail and edited ones get a new one.
+    Files are sharded by the first two hash characters:
+    <root>/ab/ab12....webp (JPEG when Pillow has no WebP support).
+
+    Written during ingest from the already decoded pixels (put_array), the
+    gallery only reads them (get_or_create falls back to the original).
+    The total size is bounded by max_bytes, least recently used thumbnails
+    are evicted first. Recency is the file mtime, touched on every read,
+    so the order survives restarts.
+    """
+
+    def __init__(self, root=DEFAULT_THUMBNAIL_DIR, max_bytes: int = 512 * 1024 * 1024,
+                 size: int = THUMBNAIL_SIZE, quality: int = 80):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.size = size
+        self.quality = quality
+        self.format, self.suffix = ("WEBP", ".webp") if features.check("webp") \
+            else ("JPEG", ".jpg")
+
+        self.hits = 0
+        self.misses = 0
+
+        # hash -> file size, oldest first, scanned from disk on first write
+        self._entries = None
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def path_for(self, photo_hash: str) -> Path:
+        return self.root / photo_hash[:2] / f"{photo_hash}{self.suffix}"
+
+    def get(self, photo_hash: str) -> Optional[Image.Image]:
+        path = self.path_for(photo_hash)
+        try:
+            img = Image.open(path)
+            img.load()
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._touch(photo_hash, path)
+        return img
+
+    def get_or_create(self, photo_hash: Optional[str], img_path) -> Optional[Image.Image]:
+        # cached thumbnail, otherwise made from the original once
+        if photo_hash:
+            img = self.get(photo_hash)
+            if img is not None:
+                return img
+
+        try:
+            img = Image.open(img_path)
+            # JPEG: decode at 1/2, 1/4 or 1/8 scale, still >= size on both sides
+            img.draft("RGB", (self.size, self.size))
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail((self.size, self.size))
+        except Exception:
+            return None
+
+        if photo_hash:
+            self.put(photo_hash, img)
+        return img
+
+    def contains(self, photo_hash: str) -> bool:
+        return self.path_for(photo_hash).exists()
+
+    def put_array(self, photo_hash: str, bgr_image: np.ndarray) -> None:
+        # cv2 decoded (BGR, EXIF orientation already applied) -> thumbnail
+        h, w = bgr_image.shape[:2]
+        scale = self.size / max(h, w)
+        if scale < 1:
+            bgr_image = cv2.resize(bgr_image, (max(1, round(w * scale)), max(1, round(h * scale))),
+                                   interpolation=cv2.INTER_AREA)
+        self.put(photo_hash, Image.fromarray(cv2.cvtColor(bgr_image, cv2.COLOR_BGR2RGB)))
+
+    def put(self, photo_hash: str, img: Image.Image) -> None:
+        if max(img.size) > self.size:
+            img = img.copy()
+            img.thumbnail((self.size, self.size))
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+
+        path = self.path_for(photo_hash)
+        tmp = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            img.save(tmp, self.format, quality=self.quality)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"Error -> Thumbnail couldn't be saved: {photo_hash}: {e}")
+            tmp.unlink(missing_ok=True)
+            return
+
+        size = path.stat().st_size
+        with self._lock:
+            self._ensure_index()
+            self._total += size - self._entries.pop(photo_hash, 0)
+            self._entries[photo_hash] = size
+            self._evict()
+
+    def _touch(self, photo_hash: str, path: Path) -> None:
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        with self._lock:
+            if self._entries is not None and photo_hash in self._entries:
+                self._entries.move_to_end(photo_hash)
+
+    def _evict(self) -> None:
+        while self._total > self.max_bytes and len(self._entries) > 1:
+            photo_hash, size = self._entries.popitem(last=False)
+            self._total -= size
+            self.path_for(photo_hash).unlink(missing_ok=True)
+
+    def _ensure_index(self) -> None:
+        if self._entries is not None:
+            return
+
+        found = []
+        if self.root.exists():
+            for shard in os.scandir(self.root):
+                if not shard.is_dir():
+                    continue
+                for entry in os.scandir(shard.path):
+                    if entry.name.endswith(self.suffix):
+                        st = entry.stat()
+                        found.append((st.st_mtime_ns, entry.name[:-len(self.suffix)], st.st_size))
+
+        found.sort()
+        self._entries = OrderedDict((h, size) for _, h, size in found)
+        self._total = sum(size for _, _, size in found)
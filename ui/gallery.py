@@ -1,142 +1,253 @@
+import math
+
 import customtkinter as ctk
-from PIL import Image, ImageOps
-import os
+from PIL import Image
+
+from ui.thumbnail_loader import ImageMemoryCache, ThumbnailLoader
 
 # ADD REFRESH GALLERY FUNCTION!!!
 
+COLUMNS = 5
+CARD_WIDTH = 150
+CARD_HEIGHT = 150
+CARD_PAD = 10
+IMG_SIZE = 140
+ROW_HEIGHT = CARD_HEIGHT + 2 * CARD_PAD
+# decoded thumbnails kept in memory, ~1500 at 140 px
+PREFETCH_MEMORY_MB = 64
+
+
+class _Card:
+    # one recycled grid cell, index = position in PhotoGallery.photos or None
+    def __init__(self, frame):
+        self.frame = frame
+        self.button = None
+        self.index = None
+        self.loaded = False
+
 
 class PhotoGallery(ctk.CTkFrame):
+    """
+    Virtualized photo grid. Only the rows that fit into the window exist as
+    widgets (a fixed pool of cards); scrolling moves a row offset and
+    rebinds the cards to other photos, so the widget count stays the same
+    for 20 or 100 000 photos.
+    """
+
     def __init__(self, master, controller, **kwargs):
         super().__init__(master, **kwargs)
         self.controller = controller
 
-        self.num_of_photos_per_batch = 20
-        self.batches = []  # [[id,path,...], [id,path,...], ...]
-        self.current_batch_index = 0
+        self.photos = []
+        self.top_row = 0
+        self.cards = []
+        self._render_pending = False
+        # +1 / -1, the screen in this direction is prefetched first
+        self._scroll_direction = 1
+
+        # thumbnails are read off the Tk thread, cards start as placeholders;
+        # the screens above and below are prefetched into memory
+        self.thumbnail_memory = ImageMemoryCache(PREFETCH_MEMORY_MB * 1024 * 1024)
+        self.thumbnail_loader = ThumbnailLoader(
+            self, self.controller.get_photo_thumbnail,
+            key_fn=lambda photo: photo.get("id"), memory=self.thumbnail_memory)
+        self.placeholder = ctk.CTkImage(
+            light_image=Image.new("RGB", (IMG_SIZE, IMG_SIZE), "#d9d9d9"),
+            dark_image=Image.new("RGB", (IMG_SIZE, IMG_SIZE), "#404040"),
+            size=(IMG_SIZE, IMG_SIZE))
 
         self.grid_rowconfigure(0, weight=1)  # photos
-        self.grid_rowconfigure(1, weight=0)  # navigation
+        self.grid_rowconfigure(1, weight=0)  # position
         self.grid_columnconfigure(0, weight=1)
 
-        # 1. SCROLL FRAME 5
-        self.scroll_frame_photos = ctk.CTkScrollableFrame(
-            self, label_text="Photos"
-        )
-        self.scroll_frame_photos.grid(
-            row=0, column=0, sticky="nsew", padx=5, pady=5)
-        self.scroll_frame_photos.grid_columnconfigure(0, weight=1)
+        # 1. CARD AREA + SCROLLBAR
+        self.grid_area = ctk.CTkFrame(self, fg_color="transparent")
+        self.grid_area.grid(row=0, column=0, sticky="nsew", padx=5, pady=5)
+        for col in range(COLUMNS):
+            self.grid_area.grid_columnconfigure(col, weight=1)
+        self.grid_area.bind("<Configure>", lambda e: self._resize_pool())
+        self._bind_wheel(self.grid_area)
 
-        # 2. NAVIGATION BUTTONS
-        self.bottom_bar = ctk.CTkFrame(self, height=40, fg_color="transparent")
-        self.bottom_bar.grid(row=1, column=0, sticky="ew", padx=10, pady=5)
+        self.scrollbar = ctk.CTkScrollbar(self, command=self._on_scrollbar)
+        self.scrollbar.grid(row=0, column=1, sticky="ns", pady=5)
 
-        self.btn_prev = ctk.CTkButton(self.bottom_bar, text="< Previous", width=100,
-                                      command=lambda: self.change_batch(-1))
-        self.btn_prev.pack(side="left", padx=10)
+        # 2. POSITION
+        self.bottom_bar = ctk.CTkFrame(self, height=40, fg_color="transparent")
+        self.bottom_bar.grid(row=1, column=0, columnspan=2, sticky="ew", padx=10, pady=5)
 
         self.lbl_page = ctk.CTkLabel(self.bottom_bar, text="0 / 0")
         self.lbl_page.pack(side="left", expand=True)
 
-        self.btn_next = ctk.CTkButton(self.bottom_bar, text="Next >", width=100,
-                                      command=lambda: self.change_batch(1))
-        self.btn_next.pack(side="right", padx=10)
-
     def update(self, photos):
-        # print(f"Updating gallery with {len(photos)} photos")
-        self.batches = []
-        temp_list = []
-
-        for photo in photos:
-
-            temp_list.append(photo)
-
-            if len(temp_list) == self.num_of_photos_per_batch:
-                self.batches.append(temp_list)
-                temp_list = []
-
-        # last incomplete batch
-        if temp_list:
-            self.batches.append(temp_list)
-
-        self.current_batch_index = 0
-        self.build_photo_grid()
+        self.photos = list(photos)
+        self.top_row = 0
+        for card in self.cards:
+            card.index = None
+        self._schedule_render()
+
+    def destroy(self):
+        self.thumbnail_loader.shutdown()
+        stats = self.thumbnail_memory.stats()
+        print(f"GALLERY PREFETCH: {stats['hits']} hits, {stats['misses']} misses "
+              f"({stats['hit_rate']:.0%})")
+        super().destroy()
+
+    @property
+    def total_rows(self):
+        return math.ceil(len(self.photos) / COLUMNS)
+
+    @property
+    def visible_rows(self):
+        return len(self.cards) // COLUMNS
+
+    def scroll_to_row(self, row):
+        # the last row of the pool is only partly visible
+        full_rows = max(1, self.visible_rows - 1)
+        row = max(0, min(row, self.total_rows - full_rows))
+        if row != self.top_row:
+            self._scroll_direction = 1 if row > self.top_row else -1
+            self.top_row = row
+            self._schedule_render()
+
+    def _on_scrollbar(self, action, value, unit=None):
+        if action == "moveto":
+            self.scroll_to_row(round(float(value) * self.total_rows))
+        elif action == "scroll":
+            step = max(1, self.visible_rows - 1) if unit == "pages" else 1
+            self.scroll_to_row(self.top_row + int(value) * step)
+
+    def _on_wheel(self, event):
+        # Windows / macOS: delta, X11: Button-4 / Button-5
+        if event.num == 4 or event.delta > 0:
+            self.scroll_to_row(self.top_row - 1)
+        elif event.num == 5 or event.delta < 0:
+            self.scroll_to_row(self.top_row + 1)
+
+    def _bind_wheel(self, widget):
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            widget.bind(sequence, self._on_wheel, add="+")
+
+    def _resize_pool(self):
+        # enough rows to fill the area, plus the partly visible one
+        scaling = ctk.ScalingTracker.get_widget_scaling(self)
+        height = self.grid_area.winfo_height() / scaling
+        rows = max(1, math.ceil(height / ROW_HEIGHT))
+        if rows == self.visible_rows:
+            return
 
-    def change_batch(self, direction):
-        new_index = self.current_batch_index + direction
+        while self.visible_rows < rows:
+            row = self.visible_rows
+            for col in range(COLUMNS):
+                self.cards.append(self._create_card(row, col))
+        for card in self.cards[rows * COLUMNS:]:
+            card.frame.destroy()
+        del self.cards[rows * COLUMNS:]
+
+        self.scroll_to_row(self.top_row)
+        self._schedule_render()
+
+    def _create_card(self, row, col):
+        frame = ctk.CTkFrame(
+            self.grid_area,
+            width=CARD_WIDTH,
+            height=CARD_HEIGHT,
+            fg_color=("gray85", "gray25")
+        )
+        frame.grid(row=row, column=col, padx=CARD_PAD, pady=CARD_PAD)
+        frame.grid_propagate(False)
+
+        card = _Card(frame)
+        card.button = ctk.CTkButton(
+            frame,
+            text="",
+            image=self.placeholder,
+            fg_color="transparent",
+            hover_color="gray40",
+            width=IMG_SIZE,
+            height=IMG_SIZE,
+            command=lambda: self._on_card_click(card)
+        )
+        card.button.place(relx=0.5, rely=0.5, anchor="center")
+
+        self._bind_wheel(frame)
+        self._bind_wheel(card.button)
+        return card
+
+    def _on_card_click(self, card):
+        if card.index is not None:
+            print(f"id:{self.photos[card.index].get('id')}")
+
+    def _schedule_render(self):
+        # a burst of scroll events -> one render
+        if not self._render_pending:
+            self._render_pending = True
+            self.after_idle(self._render)
+
+    def _render(self):
+        self._render_pending = False
+        first = self.top_row * COLUMNS
+
+        for offset, card in enumerate(self.cards):
+            index = first + offset
+            if index >= len(self.photos):
+                card.index = None
+                card.frame.grid_remove()
+                continue
 
-        if 0 <= new_index < len(self.batches):
-            self.current_batch_index = new_index
-            self.build_photo_grid()
+            card.frame.grid()
+            if card.index != index:
+                card.index = index
+                card.loaded = False
+                card.button.configure(image=self.placeholder, text="")
+
+        # loads for rows scrolled past are dropped, cards still showing the
+        # same photo keep their image
+        self.thumbnail_loader.new_generation()
+        for card in self.cards:
+            if card.index is not None and not card.loaded:
+                self.thumbnail_loader.request(
+                    self.photos[card.index],
+                    lambda img, c=card, i=card.index: self._set_thumbnail(c, i, img))
+        self._prefetch_adjacent()
+
+        self._update_position()
+
+    def _prefetch_adjacent(self):
+        # one screen ahead in the scroll direction first, then one behind
+        screen = len(self.cards)
+        first = self.top_row * COLUMNS
+        ahead = range(first + screen, min(len(self.photos), first + 2 * screen))
+        behind = range(max(0, first - screen), first)
+        if self._scroll_direction < 0:
+            ahead, behind = reversed(behind), ahead
+
+        self.thumbnail_loader.prefetch(self.photos[i] for i in ahead)
+        self.thumbnail_loader.prefetch(self.photos[i] for i in behind)
+
+    def prefetch_stats(self):
+        # hits = thumbnails shown straight from memory
+        return self.thumbnail_memory.stats()
+
+    def _set_thumbnail(self, card, index, pil_img):
+        # Tk thread, the card may have been rebound in the meantime
+        if card.index != index or not card.button.winfo_exists():
+            return
+        card.loaded = True
+        if pil_img is None:
+            card.button.configure(text="?")
+            return
 
-    def build_photo_grid(self):
-        for widget in self.scroll_frame_photos.winfo_children():
-            widget.destroy()
+        card.button.configure(image=ctk.CTkImage(
+            light_image=pil_img, dark_image=pil_img, size=(IMG_SIZE, IMG_SIZE)))
 
-        if not self.batches:
+    def _update_position(self):
+        if not self.photos:
             self.lbl_page.configure(text="0 / 0")
-            self.btn_prev.configure(state="disabled")
-            self.btn_next.configure(state="disabled")
+            self.scrollbar.set(0.0, 1.0)
             return
 
-        current_photos = self.batches[self.current_batch_index]
-
-        self.lbl_page.configure(
-            text=f"Page {self.current_batch_index + 1} / {len(self.batches)}")
-
-        self.btn_prev.configure(
-            state="normal" if self.current_batch_index > 0 else "disabled")
-        self.btn_next.configure(
-            state="normal" if self.current_batch_index < len(self.batches) - 1 else "disabled")
-
-        COLUMNS = 5
-        CARD_WIDTH = 150
-        CARD_HEIGHT = 150
-        IMG_SIZE = 140
-
-        valid_index = 0
-
-        for photo_data in current_photos:
-
-            path = photo_data.get('path')
-            p_id = photo_data.get('id')
-
-            try:
-                pil_img = Image.open(path)
-                pil_img = ImageOps.exif_transpose(pil_img)
-                pil_img.thumbnail((IMG_SIZE, IMG_SIZE))
-            except Exception:
-                continue
-
-            row = valid_index // COLUMNS
-            col = valid_index % COLUMNS
-            valid_index += 1
-
-            self.scroll_frame_photos.grid_columnconfigure(col, weight=1)
-
-            card = ctk.CTkFrame(
-                self.scroll_frame_photos,
-                width=CARD_WIDTH,
-                height=CARD_HEIGHT,
-                fg_color=("gray85", "gray25")
-            )
-            card.grid(row=row, column=col, padx=10, pady=10)
-            card.grid_propagate(False)
-
-            my_image = ctk.CTkImage(
-                light_image=pil_img,
-                dark_image=pil_img,
-                size=(IMG_SIZE, IMG_SIZE)
-            )
-
-            btn = ctk.CTkButton(
-                card,
-                text="",
-                image=my_image,
-                fg_color="transparent",
-                hover_color="gray40",
-                width=IMG_SIZE,
-                height=IMG_SIZE,
-                command=lambda x=p_id: print(f"id:{x}")
-            )
-
-            btn.place(relx=0.5, rely=0.5, anchor="center")
+        first = self.top_row * COLUMNS
+        last = min(len(self.photos), first + len(self.cards))
+        self.lbl_page.configure(text=f"{first + 1} - {last} / {len(self.photos)}")
+        self.scrollbar.set(self.top_row / self.total_rows,
+                           min(1.0, (self.top_row + self.visible_rows) / self.total_rows))
@@ -10,6 +10,7 @@ class PeopleSidebar(ctk.CTkFrame):
 
         self.selected_ids = set()
         self.person_rows = {}
+        self.subset_ids = None
 
         self.scroll_frame_people = ctk.CTkScrollableFrame(
             self, label_text="Sort by Found People"
@@ -20,7 +21,16 @@ class PeopleSidebar(ctk.CTkFrame):
 
         self.scroll_frame_people.grid_columnconfigure(0, weight=1)
 
+        # merge proposals of the re-clustering job, hidden while there are none
+        self.scroll_frame_merges = ctk.CTkScrollableFrame(
+            self, label_text="Same Person?", height=140
+        )
+        self.scroll_frame_merges.grid(row=1, column=0, sticky="ew", pady=(5, 0))
+        self.scroll_frame_merges.grid_columnconfigure(0, weight=1)
+        self.scroll_frame_merges.grid_remove()
+
     def refresh_people_list(self, subset_ids=None):
+        self.subset_ids = subset_ids
         for widget in self.scroll_frame_people.winfo_children():
             widget.destroy()
 
@@ -30,18 +40,8 @@ class PeopleSidebar(ctk.CTkFrame):
             self.create_person_row(row['id'], row['name'], row_index=i)
 
     def create_person_row(self, person_id, person_name, row_index):
-        pil_img = self.controller.get_person_thumbnail(person_id)
-
-        if pil_img:
-            pil_img = pil_img.resize((60, 60), Image.LANCZOS)
-            mask = Image.new("L", pil_img.size, 0)
-            draw = ImageDraw.Draw(mask)
-            draw.ellipse((0, 0) + pil_img.size, fill=255)
-            pil_img.putalpha(mask)
-
-            img_ctk = ctk.CTkImage(light_image=pil_img,
-                                   dark_image=pil_img, size=(60, 60))
-        else:
+        img_ctk = self._round_thumbnail(person_id, 60)
+        if img_ctk is None:
             return
 
         if person_id in self.selected_ids:
@@ -87,6 +87,85 @@ class PeopleSidebar(ctk.CTkFrame):
         item_frame.bind(
             "<Button-1>", lambda e: self._toggle_selection(person_id))
 
+    def _round_thumbnail(self, person_id, size):
+        pil_img = self.controller.get_person_thumbnail(person_id)
+        if not pil_img:
+            return None
+
+        pil_img = pil_img.resize((size, size), Image.LANCZOS)
+        mask = Image.new("L", pil_img.size, 0)
+        draw = ImageDraw.Draw(mask)
+        draw.ellipse((0, 0) + pil_img.size, fill=255)
+        pil_img.putalpha(mask)
+
+        return ctk.CTkImage(light_image=pil_img,
+                            dark_image=pil_img, size=(size, size))
+
+    def show_merge_proposals(self, proposals):
+        # proposals = [(proposal, [(person_id, name), ...]), ...]
+        for widget in self.scroll_frame_merges.winfo_children():
+            widget.destroy()
+
+        if not proposals:
+            self.scroll_frame_merges.grid_remove()
+            return
+
+        self.scroll_frame_merges.grid()
+        for i, (proposal, people) in enumerate(proposals):
+            self.create_merge_row(proposal, people, row_index=i)
+
+    def create_merge_row(self, proposal, people, row_index):
+        item_frame = ctk.CTkFrame(
+            self.scroll_frame_merges, fg_color=("gray85", "gray25"))
+        item_frame.grid(row=row_index, column=0, sticky="ew", padx=5, pady=5)
+
+        # faces of the first few people side by side
+        faces = ctk.CTkFrame(item_frame, fg_color="transparent")
+        faces.grid(row=0, column=0, columnspan=3, sticky="w", padx=5, pady=(5, 0))
+        for col, (person_id, _) in enumerate(people[:5]):
+            img_ctk = self._round_thumbnail(person_id, 36)
+            if img_ctk:
+                ctk.CTkLabel(faces, image=img_ctk, text="").grid(row=0, column=col, padx=2)
+
+        names = ", ".join(name or f"#{person_id}" for person_id, name in people)
+        lbl_names = ctk.CTkLabel(
+            item_frame, text=f"{names}\n{proposal[2]:.0%} similar",
+            justify="left", anchor="w", wraplength=200)
+        lbl_names.grid(row=1, column=0, padx=10, pady=(0, 5), sticky="w")
+        item_frame.grid_columnconfigure(0, weight=1)
+
+        btn_accept = ctk.CTkButton(item_frame, text="✔", width=40)
+        btn_reject = ctk.CTkButton(item_frame, text="✖", width=40,
+                                   fg_color="gray40", hover_color="gray30")
+
+        def accept_action():
+            btn_accept.configure(state="disabled")
+            btn_reject.configure(state="disabled")
+            # merge runs off the Tk thread, the list is refreshed afterwards
+            self.controller.accept_merge_proposal(
+                proposal, on_done=lambda applied: self.after(
+                    0, lambda: self._on_merge_done(item_frame, applied)))
+
+        def reject_action():
+            self.controller.reject_merge_proposal(proposal)
+            self._remove_merge_row(item_frame)
+
+        btn_accept.configure(command=accept_action)
+        btn_reject.configure(command=reject_action)
+        btn_accept.grid(row=1, column=1, padx=(0, 5), pady=(0, 5))
+        btn_reject.grid(row=1, column=2, padx=(0, 5), pady=(0, 5))
+
+    def _on_merge_done(self, item_frame, applied):
+        if not applied:
+            print("Merge skipped, the people changed since the check")
+        self._remove_merge_row(item_frame)
+        self.refresh_people_list(self.subset_ids)
+
+    def _remove_merge_row(self, item_frame):
+        item_frame.destroy()
+        if not self.scroll_frame_merges.winfo_children():
+            self.scroll_frame_merges.grid_remove()
+
     def _toggle_selection(self, person_id):
 
         if person_id in self.selected_ids:
@@ -0,0 +1,167 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+import queue
+import threading
+
+
+class ImageMemoryCache:
+    """
+    Decoded, ready to display PIL images in memory, LRU with a byte budget
+    (pixel data: width * height * bands). Filled from the loader threads,
+    read on the Tk thread.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+        self._images = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            img = self._images.get(key)
+            if img is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._images.move_to_end(key)
+            return img
+
+    def contains(self, key) -> bool:
+        with self._lock:
+            return key in self._images
+
+    def put(self, key, img) -> None:
+        size = img.width * img.height * len(img.getbands())
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._images.pop(key, None)
+            if old is not None:
+                self._bytes -= old.width * old.height * len(old.getbands())
+            self._images[key] = img
+            self._bytes += size
+
+            while self._bytes > self.max_bytes:
+                _, evicted = self._images.popitem(last=False)
+                self._bytes -= evicted.width * evicted.height * len(evicted.getbands())
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "images": len(self._images),
+                "bytes": self._bytes,
+            }
+
+
+class ThumbnailLoader:
+    """
+    Loads images on a thread pool and hands them back on the Tk thread.
+    load_fn(arg) runs on a worker, on_loaded(result) is called through
+    widget.after(), so only the main thread ever touches widgets.
+
+    Every page shown starts a new generation (new_generation()); requests
+    of older generations are cancelled if they did not start yet, skipped
+    if they did, and their results are dropped.
+
+    With a memory cache, loaded images are kept under key_fn(arg): a
+    request for a cached image is answered right away, and prefetch()
+    warms the cache for images that are likely shown next.
+    """
+
+    def __init__(self, widget, load_fn: Callable, key_fn: Optional[Callable] = None,
+                 memory: Optional[ImageMemoryCache] = None, workers: int = 4,
+                 poll_ms: int = 30, max_per_poll: int = 10):
+        self.widget = widget
+        self.load_fn = load_fn
+        self.key_fn = key_fn or (lambda arg: arg)
+        self.memory = memory
+        self.poll_ms = poll_ms
+        # images swapped in per poll, keeps the event loop free between polls
+        self.max_per_poll = max_per_poll
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="thumbnails")
+        self._results = queue.Queue()
+        self._generation = 0
+        self._futures = []
+        self._lock = threading.Lock()
+        self._polling = False
+
+    def new_generation(self) -> int:
+        with self._lock:
+            self._generation += 1
+            futures, self._futures = self._futures, []
+        for future in futures:
+            future.cancel()
+        return self._generation
+
+    def request(self, arg, on_loaded: Callable) -> None:
+        if self.memory is not None:
+            img = self.memory.get(self.key_fn(arg))
+            if img is not None:
+                on_loaded(img)
+                return
+        self._submit(arg, on_loaded)
+
+    def prefetch(self, args) -> None:
+        # queued behind the requests of the current generation, cancelled with it
+        if self.memory is None:
+            return
+        for arg in args:
+            if not self.memory.contains(self.key_fn(arg)):
+                self._submit(arg, None)
+
+    def _submit(self, arg, on_loaded) -> None:
+        generation = self._generation
+        future = self._executor.submit(self._load, generation, arg, on_loaded)
+        with self._lock:
+            self._futures = [f for f in self._futures if not f.done()]
+            self._futures.append(future)
+
+        if not self._polling:
+            self._polling = True
+            self.widget.after(self.poll_ms, self._poll)
+
+    def shutdown(self) -> None:
+        self.new_generation()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _load(self, generation, arg, on_loaded) -> None:
+        if generation != self._generation:
+            return
+        try:
+            result = self.load_fn(arg)
+        except Exception as e:
+            print(f"Error -> Thumbnail couldn't be loaded: {e}")
+            result = None
+
+        if result is not None and self.memory is not None:
+            self.memory.put(self.key_fn(arg), result)
+        if on_loaded is not None:
+            self._results.put((generation, on_loaded, result))
+
+    def _poll(self) -> None:
+        for _ in range(self.max_per_poll):
+            try:
+                generation, on_loaded, result = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if generation == self._generation:
+                on_loaded(result)
+
+        with self._lock:
+            pending = any(not f.done() for f in self._futures)
+        if pending or not self._results.empty():
+            self.widget.after(self.poll_ms, self._poll)
+        else:
+            self._polling = False